@@ -0,0 +1,402 @@
+"""
+This module defines benchmarks of the hot paths of the olimex package
+and a runner that tracks them over time.
+
+Run it from the root of the repository::
+
+    python -m benchmarks.run            # run all benchmarks
+    python -m benchmarks.run -k sync    # run benchmarks matching "sync"
+    python -m benchmarks.run --list
+
+Every run is appended to a history file (``benchmarks/.history.jsonl``
+by default). Each result is compared with the median of the previous
+runs on the same machine, and the runner exits with status 1 if any
+benchmark got slower by more than the threshold.
+
+Each benchmark function does its setup and returns a tuple of
+``(func, units_per_call, unit)``. Only calls to ``func`` are timed.
+"""
+import argparse
+from collections import OrderedDict
+import datetime
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+
+from olimex.constants import PACKET_SIZE, SAMPLE_FREQUENCY
+from olimex.exg import PacketStreamReader
+from olimex.index import PacketIndex
+from olimex.mock import FakeSerialByteArray, ReplaySerial, synthetic_stream
+from olimex.utils import (calculate_values_from_packet_data, calculate_values_from_packets,
+                          get_mock_data_list)
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+MOCK_DATA_DIR, MOCK_DATA_FILES = get_mock_data_list()
+DEFAULT_HISTORY = os.path.join(BENCHMARKS_DIR, '.history.jsonl')
+
+# Runs compared against when looking for regressions
+BASELINE_RUNS = 5
+# A benchmark regressed if it takes this many times its baseline
+DEFAULT_THRESHOLD = 1.25
+# Seconds spent in each timing repeat
+TARGET_REPEAT_SECONDS = 0.2
+REPEATS = 5
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(func):
+    """
+    Register ``func`` as a benchmark under its name.
+    """
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def mock_stream(min_bytes=1024 * 1024):
+    """
+    Return the mock-data corpus repeated to at least ``min_bytes``.
+    """
+    corpus = bytearray()
+    for name in MOCK_DATA_FILES:
+        with open(os.path.join(MOCK_DATA_DIR, name), 'rb') as fd:
+            corpus.extend(fd.read())
+    return bytes(corpus * (min_bytes // len(corpus) + 1))
+
+
+def add_noise(stream, every, noise_length, seed=0):
+    """
+    Return ``stream`` with random bytes inserted after every ``every``
+    packets, so that the reader loses sync.
+    """
+    random = np.random.RandomState(seed)
+    pieces = []
+    step = every * PACKET_SIZE
+    for start in range(0, len(stream), step):
+        pieces.append(stream[start:start + step])
+        pieces.append(random.randint(0, 256, noise_length).astype(np.uint8).tobytes())
+    return b''.join(pieces)
+
+
+def corrupt(stream, fraction, seed=0):
+    """
+    Return ``stream`` with a ``fraction`` of its bytes overwritten with
+    random values, sync bytes included.
+    """
+    random = np.random.RandomState(seed)
+    data = np.frombuffer(stream, dtype=np.uint8).copy()
+    positions = random.randint(0, len(data), int(len(data) * fraction))
+    data[positions] = random.randint(0, 256, len(positions))
+    return data.tobytes()
+
+
+@benchmark
+def sync_clean():
+    stream = mock_stream()
+    return lambda: PacketIndex.build(stream), len(stream), 'bytes'
+
+
+@benchmark
+def sync_noisy():
+    # 3 noise bytes after every second of packets
+    stream = add_noise(mock_stream(), SAMPLE_FREQUENCY, 3)
+    return lambda: PacketIndex.build(stream), len(stream), 'bytes'
+
+
+@benchmark
+def sync_corrupted():
+    # One byte in a thousand overwritten
+    stream = corrupt(mock_stream(), 0.001)
+    return lambda: PacketIndex.build(stream), len(stream), 'bytes'
+
+
+@benchmark
+def generate_synthetic_stream():
+    return lambda: synthetic_stream(100000, seed=0), 100000, 'packets'
+
+
+@benchmark
+def decode_per_packet():
+    stream = synthetic_stream(1000, seed=0)
+    packets = [stream[start:start + PACKET_SIZE] for start in range(0, len(stream), PACKET_SIZE)]
+
+    def decode():
+        for packet in packets:
+            calculate_values_from_packet_data(packet[4:16])
+    return decode, len(packets), 'packets'
+
+
+@benchmark
+def decode_batched():
+    stream = synthetic_stream(1000, seed=0)
+    return lambda: calculate_values_from_packets(stream), 1000, 'packets'
+
+
+def drain(reader, max_packets):
+    num_packets = 0
+    while True:
+        values, *_ = reader.read_chunk(max_packets)
+        if not len(values):
+            return num_packets
+        num_packets += len(values)
+
+
+@benchmark
+def reader_read_chunk():
+    stream = synthetic_stream(2000, seed=0)
+
+    def read():
+        # Chunks of 5 packets, as read by the GUI on each refresh
+        drain(PacketStreamReader(FakeSerialByteArray(stream)), 5)
+    return read, 2000, 'packets'
+
+
+@benchmark
+def reader_per_packet():
+    stream = synthetic_stream(2000, seed=0)
+
+    def read():
+        reader = PacketStreamReader(FakeSerialByteArray(stream))
+        num_packets = 0
+        while num_packets < 2000:
+            if reader._get_next_packet_values() is not None:
+                num_packets += 1
+    return read, 2000, 'packets'
+
+
+@benchmark
+def reader_replay():
+    stream = synthetic_stream(2000, seed=0)
+
+    def read():
+        # Replaying a file as fast as possible, eg. in a notebook
+        drain(PacketStreamReader(ReplaySerial(stream, speed=None)), None)
+    return read, 2000, 'packets'
+
+
+@benchmark
+def filter_bank_chunk():
+    from olimex.filters import FilterBank
+    filter_bank = FilterBank()
+    samples = np.random.RandomState(0).normal(512, 50, (5, 6))
+    return lambda: filter_bank.filter(samples), 5, 'samples'
+
+
+@benchmark
+def qrs_detector_chunk():
+    from olimex.heart import QRSDetector
+    detector = QRSDetector()
+    samples = np.random.RandomState(0).normal(512, 50, (5, 6))
+    return lambda: detector.update(samples), 5, 'samples'
+
+
+@benchmark
+def spectral_estimator_hop():
+    from olimex.spectral import SpectralEstimator
+    estimator = SpectralEstimator()
+    samples = np.random.RandomState(0).normal(512, 50, (estimator.hop, 6))
+    return lambda: estimator.update(samples), estimator.hop, 'samples'
+
+
+class FrameClock:
+    """
+    A replay clock that only moves when told to.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def gui_frame(num_channels):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from olimex import gui
+
+    # The replay clock only moves on by one refresh per frame, so that
+    # every frame reads the packets the shield sends in that time.
+    clock = FrameClock()
+    reader = PacketStreamReader(ReplaySerial(mock_stream(8 * 1024 * 1024), clock=clock))
+    figure = Figure(figsize=(gui.STRIP_LENGTH_SECONDS, num_channels * 2), dpi=gui.DOTS_PER_SECOND)
+    canvas = FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.set_xlim(0, gui.DOTS_PER_STRIP_LENGTH)
+    axes.set_ylim(0, num_channels * gui.DOTS_PER_STRIP_HEIGHT)
+    updater = gui.axes_updater(axes, reader, num_channels=num_channels)
+    next(updater)
+    canvas.draw()
+    background = canvas.copy_from_bbox(axes.bbox)
+
+    def frame():
+        clock.now += 1 / gui.REFRESHES_PER_SECOND
+        # What a blitting FuncAnimation does on each refresh
+        artists = next(updater)
+        canvas.restore_region(background)
+        for artist in artists:
+            axes.draw_artist(artist)
+        canvas.blit(axes.bbox)
+    return frame, 1, 'frames'
+
+
+@benchmark
+def gui_frame_1_channel():
+    return gui_frame(1)
+
+
+@benchmark
+def gui_frame_6_channels():
+    return gui_frame(6)
+
+
+def time_benchmark(func):
+    """
+    Return the best time in seconds of one call to ``func``.
+    """
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * TARGET_REPEAT_SECONDS / max(elapsed, 1e-9)))
+    return min(timer.repeat(REPEATS, number)) / number
+
+
+def run(names):
+    """
+    Run the benchmarks in ``names`` and return their results.
+
+    :returns: A dictionary of benchmark name to a dictionary of
+              ``seconds`` per call, ``units_per_call`` and ``unit``.
+    """
+    results = OrderedDict()
+    for name in names:
+        func, units_per_call, unit = BENCHMARKS[name]()
+        results[name] = {
+            'seconds': time_benchmark(func),
+            'units_per_call': units_per_call,
+            'unit': unit,
+        }
+    return results
+
+
+def load_history(path):
+    """
+    Return the runs saved at ``path``, oldest first.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path) as fd:
+        return [json.loads(line) for line in fd if line.strip()]
+
+
+def save_run(path, results):
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                         cwd=BENCHMARKS_DIR, stderr=subprocess.DEVNULL)
+        commit = commit.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    run_record = {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'machine': platform.node(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'results': {name: result['seconds'] for name, result in results.items()},
+    }
+    with open(path, 'a') as fd:
+        fd.write(json.dumps(run_record) + '\n')
+
+
+def compare(results, history, machine=None):
+    """
+    Compare results with the previous runs on the same machine.
+
+    :param results: Results as returned by :py:func:`run`.
+    :param history: Runs as returned by :py:func:`load_history`.
+    :returns: A dictionary of benchmark name to the ratio of its time
+              to its baseline, the median of its last
+              :py:data:`BASELINE_RUNS` times. Benchmarks with no
+              previous runs are left out.
+    """
+    machine = platform.node() if machine is None else machine
+    runs = [run_record for run_record in history if run_record['machine'] == machine]
+    ratios = OrderedDict()
+    for name, result in results.items():
+        previous = [run_record['results'][name] for run_record in runs
+                    if name in run_record['results']][-BASELINE_RUNS:]
+        if previous:
+            ratios[name] = result['seconds'] / float(np.median(previous))
+    return ratios
+
+
+def format_seconds(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return '{:.3g} {}'.format(seconds / scale, unit)
+    return '{:.3g} ns'.format(seconds / 1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the olimex hot paths.')
+    parser.add_argument('-k',
+                        dest='pattern',
+                        help='Only run benchmarks whose name matches this regular expression.')
+    parser.add_argument('--list',
+                        action='store_true',
+                        default=False,
+                        dest='list',
+                        help='List the benchmarks and exit.')
+    parser.add_argument('--history',
+                        dest='history',
+                        default=DEFAULT_HISTORY,
+                        help='File the results of every run are appended to.')
+    parser.add_argument('--no-save',
+                        action='store_false',
+                        default=True,
+                        dest='save',
+                        help="Don't add this run to the history.")
+    parser.add_argument('--threshold',
+                        dest='threshold',
+                        type=float,
+                        default=DEFAULT_THRESHOLD,
+                        help='Slow-down relative to previous runs reported as a regression.')
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS
+             if args.pattern is None or re.search(args.pattern, name)]
+    if args.list:
+        for name in names:
+            print(name)
+        return
+
+    results = run(names)
+    history = load_history(args.history)
+    ratios = compare(results, history)
+
+    regressions = []
+    for name, result in results.items():
+        throughput = result['units_per_call'] / result['seconds']
+        line = '{:<26} {:>10} per call {:>14.4g} {}/s'.format(
+            name, format_seconds(result['seconds']), throughput, result['unit'])
+        if name in ratios:
+            line += '  {:+.0%}'.format(ratios[name] - 1)
+            if ratios[name] > args.threshold:
+                line += '  REGRESSION'
+                regressions.append(name)
+        print(line)
+
+    if args.save:
+        save_run(args.history, results)
+    if regressions:
+        print('{} benchmark(s) slower than {:.0%} of the median of previous runs: {}'.format(
+            len(regressions), args.threshold, ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""
+This module defines classes for reading packets on a background thread.
+
+Readers used directly by a GUI only read from the serial port when the
+GUI redraws. A :py:class:`BackgroundReader` instead drains the port
+continuously on its own thread into a fixed-size :py:class:`RingBuffer`,
+from which the GUI takes whatever has arrived since its last read.
+"""
+from collections import deque
+import threading
+import time
+
+import numpy as np
+
+from olimex.constants import NUMCHANNELS, SAMPLE_FREQUENCY
+
+
+class RingBuffer:
+    """
+    A fixed-size, preallocated buffer of packet arrays.
+
+    Rows are written by one thread and read by another. If the reader
+    falls more than ``capacity`` packets behind, the oldest unread
+    packets are overwritten and counted in ``overflow_count``.
+
+    :param capacity: Number of packets the buffer holds.
+    :param dtype: dtype of the channel values.
+    :ivar last_arrival: Arrival time of the oldest packet returned by
+                        the last :py:meth:`read` that returned any.
+    """
+    def __init__(self, capacity, dtype=np.int32):
+        self.capacity = capacity
+        self._values = np.empty((capacity, NUMCHANNELS), dtype=dtype)
+        self._counts = np.empty(capacity, dtype=np.uint8)
+        self._versions = np.empty(capacity, dtype=np.uint8)
+        self._switches = np.empty(capacity, dtype=np.uint8)
+        # Total number of packets ever written and read. The
+        # position of either in the buffer is the total % capacity.
+        self._written = 0
+        self._read = 0
+        # (first packet, arrival) of each write whose packets aren't
+        # all read yet, oldest first. Packets are numbered as _written.
+        self._arrivals = deque()
+        self._lock = threading.Lock()
+        self.overflow_count = 0
+        self.last_arrival = None
+
+    def __len__(self):
+        return self._written - self._read
+
+    def write(self, values, counts, versions, switches, arrival=None):
+        """
+        Append packets to the buffer.
+
+        Arguments are as returned by
+        :py:meth:`~olimex.exg.PacketStreamReader.read_chunk`.
+
+        :param arrival: Arrival time of the oldest packet, as in
+                        :py:attr:`~olimex.exg.PacketStreamReader.last_arrival`.
+        """
+        num_packets = len(values)
+        with self._lock:
+            if num_packets:
+                self._arrivals.append((self._written, arrival))
+            if num_packets > self.capacity:
+                # Only the newest packets fit. The rest count as
+                # written and then overflowed below.
+                skipped = num_packets - self.capacity
+                self._written += skipped
+                values, counts, versions, switches = (
+                    values[skipped:], counts[skipped:], versions[skipped:], switches[skipped:])
+                num_packets = self.capacity
+
+            unread = self._written - self._read
+            overflow = unread + num_packets - self.capacity
+            if overflow > 0:
+                self.overflow_count += overflow
+                self._read += overflow
+
+            start = self._written % self.capacity
+            first = min(num_packets, self.capacity - start)
+            for dest, src in ((self._values, values),
+                              (self._counts, counts),
+                              (self._versions, versions),
+                              (self._switches, switches)):
+                dest[start:start + first] = src[:first]
+                dest[:num_packets - first] = src[first:]
+            self._written += num_packets
+            self._forget_arrivals()
+
+    def _forget_arrivals(self):
+        # Keep the write holding the oldest unread packet and those after it.
+        while len(self._arrivals) > 1 and self._arrivals[1][0] <= self._read:
+            self._arrivals.popleft()
+
+    def clear(self):
+        """
+        Drop the packets not read yet.
+        """
+        with self._lock:
+            self._read = self._written
+            self._arrivals.clear()
+
+    def read(self, max_packets=None):
+        """
+        Return the packets written since the last read.
+
+        :param max_packets: Upper bound on the number of packets to
+                            return.
+        :returns: A tuple of ``(values, counts, versions, switches)``
+                  as returned by
+                  :py:meth:`~olimex.exg.PacketStreamReader.read_chunk`.
+        """
+        with self._lock:
+            num_packets = self._written - self._read
+            if max_packets is not None:
+                num_packets = min(num_packets, max_packets)
+            indices = np.arange(self._read, self._read + num_packets) % self.capacity
+            if num_packets:
+                self.last_arrival = self._arrivals[0][1]
+            self._read += num_packets
+            if self._read == self._written:
+                self._arrivals.clear()
+            else:
+                self._forget_arrivals()
+            return (self._values[indices],
+                    self._counts[indices],
+                    self._versions[indices],
+                    self._switches[indices])
+
+
+class BackgroundReader:
+    """
+    Read packets from a reader on a background thread.
+
+    Instances have the same :py:meth:`read_chunk` method as
+    :py:class:`~olimex.exg.PacketStreamReader`, but it only ever
+    returns packets already read by the background thread and so never
+    waits on the serial port.
+
+    For example::
+
+        reader = PacketStreamReader(serial.Serial(port, 115200))
+        with BackgroundReader(reader) as background_reader:
+            values, counts, versions, switches = background_reader.read_chunk()
+
+    :param reader: Reader to read packets from. It must not be used by
+                   any other thread once the background reader starts.
+    :type reader: :py:class:`~olimex.exg.PacketStreamReader`
+    :param capacity: Number of packets held for the consumer.
+    :param poll_interval: Seconds to wait when no packet is available.
+    """
+    def __init__(self, reader, capacity=60 * SAMPLE_FREQUENCY, poll_interval=0.005):
+        self.reader = reader
+        dtype = np.int32 if reader.fill_gaps is None else np.float64
+        self.buffer = RingBuffer(capacity, dtype=dtype)
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        # Offset asked for by seek(), applied by the background thread
+        self._seek_offset = None
+        self._seek_lock = threading.Lock()
+        self._seeked = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def overflow_count(self):
+        return self.buffer.overflow_count
+
+    @property
+    def last_arrival(self):
+        """
+        As :py:attr:`~olimex.exg.PacketStreamReader.last_arrival`, for
+        the packets returned by the last :py:meth:`read_chunk`.
+        """
+        return self.buffer.last_arrival
+
+    @property
+    def seek_count(self):
+        return self.reader.seek_count
+
+    @property
+    def metrics(self):
+        return self.reader.metrics
+
+    def _apply_seek(self):
+        with self._seek_lock:
+            offset, self._seek_offset = self._seek_offset, None
+        if offset is None:
+            return
+        self.reader.seek(offset)
+        # Packets from before the seek may have been written since the
+        # consumer asked for it.
+        self.buffer.clear()
+        self._seeked.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._apply_seek()
+            # No more than the buffer holds at a time
+            chunk = self.reader.read_chunk(self.buffer.capacity)
+            if len(chunk[0]):
+                self.buffer.write(*chunk, arrival=self.reader.last_arrival)
+            else:
+                time.sleep(self.poll_interval)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def seek(self, offset, timeout=1):
+        """
+        Continue reading from byte ``offset`` of the source.
+
+        The reader is only ever used by the background thread, so the
+        seek is handed to it. Packets not read yet are dropped.
+
+        :param offset: Byte offset, as for
+                       :py:meth:`~olimex.exg.PacketStreamReader.seek`.
+        :param timeout: Seconds to wait for the background thread to
+                        seek.
+        """
+        with self._seek_lock:
+            self._seek_offset = offset
+            self._seeked.clear()
+        if not self._thread.is_alive():
+            self._apply_seek()
+            return
+        self.buffer.clear()
+        self._seeked.wait(timeout)
+
+    def read_chunk(self, max_packets=None):
+        """
+        Return the packets read since the last call.
+
+        See :py:meth:`RingBuffer.read`. Sets :py:attr:`last_arrival`
+        as :py:meth:`~olimex.exg.PacketStreamReader.read_chunk` does.
+        """
+        return self.buffer.read(max_packets)
@@ -0,0 +1,84 @@
+"""
+This module defines an AsyncPacketStreamReader for reading packets
+from many Olimex-EKG-EMG shields in one asyncio event loop.
+
+For example::
+
+    async def acquire(port):
+        reader = AsyncPacketStreamReader(serial.Serial(port, 115200, timeout=0))
+        async for values in reader:
+            ...
+
+    loop.run_until_complete(asyncio.gather(*(acquire(port) for port in ports)))
+
+No thread is used per shield. When no packet is available, the reader
+waits for its serial port's file descriptor to become readable. Serial
+stand-ins without a file descriptor (eg.
+:py:class:`~olimex.mock.ReplaySerial`) are polled instead.
+"""
+import asyncio
+
+from olimex.exg import PacketStreamReader
+
+
+class AsyncPacketStreamReader(PacketStreamReader):
+    """
+    Instantiations of this class are asynchronous iterators of packet
+    values.
+
+    Packets are found and validated exactly as by
+    :py:class:`~olimex.exg.PacketStreamReader`, and the same dropped
+    packet counters are kept.
+
+    :param poll_interval: Seconds to wait between polls of serial
+                          objects without a file descriptor.
+    """
+    def __init__(self, serial, fill_gaps=None, poll_interval=0.005):
+        super().__init__(serial, fill_gaps=fill_gaps)
+        self.poll_interval = poll_interval
+        try:
+            self._fileno = serial.fileno()
+        except (AttributeError, OSError, ValueError):
+            self._fileno = None
+
+    async def _wait_for_data(self):
+        if self._fileno is None:
+            await asyncio.sleep(self.poll_interval)
+            return
+
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+        loop.add_reader(self._fileno, readable.set_result, None)
+        try:
+            await readable
+        finally:
+            loop.remove_reader(self._fileno)
+
+    async def read_chunk_async(self, max_packets=None):
+        """
+        Return the available packets, waiting for at least one.
+
+        See :py:meth:`~olimex.exg.PacketStreamReader.read_chunk`.
+        """
+        while True:
+            chunk = self.read_chunk(max_packets)
+            if len(chunk[0]):
+                return chunk
+            await self._wait_for_data()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            values = self._get_next_packet_values()
+            if values is not None:
+                self.ret_none_count = 0
+                return values
+
+            # Like the synchronous reader, give up on polled
+            # sources that have stopped sending data.
+            self.ret_none_count += 1
+            if self._fileno is None and self.ret_none_count >= 1000:
+                raise StopAsyncIteration
+            await self._wait_for_data()
@@ -0,0 +1,217 @@
+"""
+This module defines functions for analysing many recordings at once.
+
+Each recording is summarised by :py:func:`analyze`: packet counts,
+dropped packets and resyncs, statistics of every channel and heart rate
+metrics from channel 1. :py:func:`analyze_all` spreads the recordings
+over a pool of processes, one recording per task, and the summaries are
+written to a single CSV table.
+
+For example::
+
+    python -m olimex.batch olimex/mock-data/ -o summary.csv
+
+Both raw captures (``.bin``) and recordings (``.olx``, see
+:py:mod:`olimex.recording`) can be analysed.
+"""
+import argparse
+import csv
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import mmap
+import os
+import sys
+
+import numpy as np
+
+from olimex.constants import NUMCHANNELS, SAMPLE_FREQUENCY
+from olimex.index import PacketIndex
+from olimex.recording import RECORDING_SUFFIX, Recording
+from olimex.utils import calculate_values_from_packets, classify_steps
+
+RECORDING_PATTERNS = ('*.bin', '*' + RECORDING_SUFFIX)
+
+CHANNEL_STATISTICS = ('mean', 'std', 'min', 'max')
+FIELDS = (
+    ('file', 'duration_s', 'packets', 'dropped', 'duplicates', 'counter_errors', 'resyncs') +
+    tuple('ch{}_{}'.format(channel, statistic)
+          for channel in range(1, NUMCHANNELS + 1)
+          for statistic in CHANNEL_STATISTICS) +
+    ('beats', 'heart_rate_bpm', 'rr_sdnn_ms', 'rr_rmssd_ms', 'error')
+)
+
+
+def load_capture(path):
+    """
+    Return the packets of the raw capture at ``path``.
+
+    :returns: A tuple of ``(values, samples, counters)``. ``samples``
+              holds the sample number of each packet, as in
+              :py:meth:`~olimex.recording.Recording.read`, and
+              ``counters`` is a dictionary of the dropped, duplicate,
+              counter error and resync counts. Duplicates are left out.
+    """
+    index = PacketIndex.for_file(path)
+    if not len(index):
+        return np.empty((0, NUMCHANNELS), dtype=np.int32), np.empty(0, dtype=np.int64), {
+            'dropped': 0, 'duplicates': 0, 'counter_errors': 0, 'resyncs': 0}
+
+    with open(path, 'rb') as fd:
+        with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as buff:
+            values, counts, _, _ = calculate_values_from_packets(index.read_packets(buff))
+    steps, duplicates, errors = classify_steps(values, counts)
+    kept = ~duplicates
+    samples = np.cumsum(steps[kept], dtype=np.int64) - 1
+    counters = {
+        'dropped': int((steps[kept] - 1).sum()),
+        'duplicates': int(duplicates.sum()),
+        'counter_errors': int(errors.sum()),
+        # As with PacketStreamReader.resync_count, bytes before the
+        # first packet don't count as a resync.
+        'resyncs': int(np.count_nonzero(index.resyncs)),
+    }
+    return values[kept], samples, counters
+
+
+def load_recording(path):
+    """
+    Return the packets of the recording at ``path``.
+
+    See :py:func:`load_capture`.
+    """
+    with Recording(path) as recording:
+        values, samples, _, _, _ = recording.read()
+        chunks = recording.chunks
+    counters = {name: int(chunks[name].sum())
+                for name in ('dropped', 'duplicates', 'counter_errors', 'resyncs')}
+    return values, samples, counters
+
+
+def heart_rate_metrics(values, samples):
+    """
+    Return the beats and heart rate metrics of channel 1.
+
+    Dropped packets are interpolated before detecting beats.
+    """
+    # Imported here so that listing and loading recordings doesn't
+    # require scipy.
+    from olimex.heart import QRSDetector
+
+    metrics = {'beats': 0, 'heart_rate_bpm': None, 'rr_sdnn_ms': None, 'rr_rmssd_ms': None}
+    if not len(samples):
+        return metrics
+
+    timeline = np.arange(samples[-1] + 1)
+    channel = np.interp(timeline, samples, values[:, 0])
+    peak_times = QRSDetector().update(channel)
+    metrics['beats'] = len(peak_times)
+    if len(peak_times) < 2:
+        return metrics
+
+    rr_intervals = np.diff(peak_times)
+    metrics['heart_rate_bpm'] = round(60 / rr_intervals.mean(), 1)
+    metrics['rr_sdnn_ms'] = round(1000 * rr_intervals.std(), 1)
+    if len(rr_intervals) > 1:
+        metrics['rr_rmssd_ms'] = round(1000 * np.sqrt(np.mean(np.diff(rr_intervals) ** 2)), 1)
+    return metrics
+
+
+def analyze(path):
+    """
+    Return a summary of the recording at ``path``.
+
+    :returns: A dictionary with the keys in :py:data:`FIELDS`. If the
+              recording can't be read, only ``file`` and ``error`` are
+              set.
+    """
+    summary = dict.fromkeys(FIELDS)
+    summary['file'] = path
+    try:
+        if path.endswith(RECORDING_SUFFIX):
+            values, samples, counters = load_recording(path)
+        else:
+            values, samples, counters = load_capture(path)
+    except (OSError, ValueError) as e:
+        summary['error'] = str(e)
+        return summary
+
+    summary.update(counters)
+    summary['packets'] = len(values)
+    summary['duration_s'] = (int(samples[-1]) + 1) / SAMPLE_FREQUENCY if len(samples) else 0
+    if len(values):
+        for statistic in CHANNEL_STATISTICS:
+            results = getattr(np, statistic)(values, axis=0)
+            for channel, result in enumerate(results, 1):
+                summary['ch{}_{}'.format(channel, statistic)] = round(float(result), 2)
+    summary.update(heart_rate_metrics(values, samples))
+    return summary
+
+
+def find_recordings(paths):
+    """
+    Return the recordings in ``paths``, looking inside directories.
+    """
+    recordings = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in RECORDING_PATTERNS:
+                recordings.extend(glob.glob(os.path.join(path, pattern)))
+        else:
+            recordings.append(path)
+    return sorted(recordings)
+
+
+def analyze_all(paths, jobs=None):
+    """
+    Return the summaries of the recordings at ``paths``, in order.
+
+    :param jobs: Number of processes to use. Defaults to the number of
+                 CPUs. With 1, recordings are analysed in this process.
+    :returns: An iterator of summaries as returned by :py:func:`analyze`.
+    """
+    if jobs == 1:
+        for path in paths:
+            yield analyze(path)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for summary in executor.map(analyze, paths):
+            yield summary
+
+
+def write_table(summaries, fd):
+    """
+    Write summaries to ``fd`` as CSV, one row per recording.
+    """
+    writer = csv.DictWriter(fd, fieldnames=FIELDS)
+    writer.writeheader()
+    for summary in summaries:
+        writer.writerow(summary)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise many EXG recordings.')
+    parser.add_argument('paths',
+                        nargs='+',
+                        help='Recordings (.bin or {}) or directories of them.'.format(
+                            RECORDING_SUFFIX))
+    parser.add_argument('-o', '--output',
+                        dest='output',
+                        help='CSV file to write. Defaults to standard output.')
+    parser.add_argument('-j', '--jobs',
+                        dest='jobs',
+                        type=int,
+                        help='Number of processes to use. Defaults to the number of CPUs.')
+    args = parser.parse_args()
+
+    paths = find_recordings(args.paths)
+    summaries = analyze_all(paths, args.jobs)
+    if args.output:
+        with open(args.output, 'w', newline='') as fd:
+            write_table(summaries, fd)
+    else:
+        write_table(summaries, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""
+This module defines a CaptureWriter for saving the raw serial byte
+stream of an Olimex-EKG-EMG shield to disk over long sessions.
+
+Captures are written in the same format as ``olimex/mock-data/*.bin``, so they
+can be played back, indexed and converted like any other recording.
+Data reaches the disk as it arrives and is synced every few seconds.
+Since the format has no header or footer, a capture cut short by a
+crash or power cut is still a valid capture of everything synced
+before it.
+
+For example::
+
+    serial_obj = serial.Serial(port, DEFAULT_BAUDRATE, timeout=READ_TIMEOUT)
+    with CaptureWriter('session.bin', max_seconds=3600) as writer:
+        capture(serial_obj, writer)
+"""
+import os
+import time
+
+from olimex.exg import PacketStreamReader
+from olimex.utils import find_packet_run
+
+# Bytes asked for per read of the serial port. Reads return early
+# when the port's timeout expires, so this only bounds the read size.
+READ_SIZE = 4096
+# Serial port timeout in seconds for use with capture()
+READ_TIMEOUT = 0.1
+DEFAULT_FSYNC_INTERVAL = 2  # seconds
+WRITE_BUFFER_SIZE = 64 * 1024
+
+
+class ByteQueue:
+    """
+    A serial.Serial stand-in for bytes handed over by the caller.
+
+    Bytes passed to :py:meth:`put` are returned by :py:meth:`read` in
+    order and are dropped once read, so a
+    :py:class:`~olimex.exg.PacketStreamReader` can decode a stream
+    that is also being written elsewhere.
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def __repr__(self):
+        return '<ByteQueue {} bytes>'.format(len(self._buffer))
+
+    def put(self, data):
+        self._buffer.extend(data)
+
+    def inWaiting(self):
+        return len(self._buffer)
+
+    def read(self, n=1):
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+    def close(self):
+        pass
+
+
+class CaptureWriter:
+    """
+    Write a serial byte stream to a series of capture files.
+
+    A new file is started once the current one reaches ``max_bytes``
+    or has been open for ``max_seconds``. Files are named after
+    ``path`` with a sequence number, eg. ``session-0001.bin``,
+    ``session-0002.bin``. When rotating, the current file is finished
+    at the start of the next packet, so no packet is split between two
+    files.
+
+    :param path: Path of the capture. Without rotation, the path of
+                 the only file written.
+    :param max_bytes: Size at which to start a new file, or ``None``.
+    :param max_seconds: Age at which to start a new file, or ``None``.
+    :param fsync_interval: Longest time in seconds between syncs of the
+                           current file to disk. At most this much data
+                           is lost on an unclean shutdown.
+    :param validate: Decode the packets as they are written and keep
+                     the counters of a
+                     :py:class:`~olimex.exg.PacketStreamReader` in
+                     :py:attr:`reader`.
+    :ivar paths: Paths of the files written so far.
+    :ivar packet_count: Number of packets decoded, if validating.
+    """
+    def __init__(self, path, max_bytes=None, max_seconds=None,
+                 fsync_interval=DEFAULT_FSYNC_INTERVAL, validate=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.fsync_interval = fsync_interval
+        self.rotating = max_bytes is not None or max_seconds is not None
+        self.paths = []
+
+        self._fd = None
+        self._file_bytes = 0
+        self._opened_at = None
+        self._synced_at = None
+        self._unsynced = False
+        self._sequence = 0
+
+        self.reader = None
+        self._queue = None
+        self.packet_count = 0
+        if validate:
+            self._queue = ByteQueue()
+            self.reader = PacketStreamReader(self._queue)
+
+        self._open()
+
+    def __repr__(self):
+        return '<CaptureWriter {}>'.format(self.current_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def current_path(self):
+        return self.paths[-1] if self.paths else None
+
+    def _next_path(self):
+        if not self.rotating:
+            return self.path
+        root, ext = os.path.splitext(self.path)
+        self._sequence += 1
+        return '{}-{:04d}{}'.format(root, self._sequence, ext)
+
+    def _open(self):
+        while True:
+            path = self._next_path()
+            if not self.rotating:
+                self._fd = open(path, 'wb', buffering=WRITE_BUFFER_SIZE)
+                break
+            try:
+                # Never overwrite a file from an earlier capture.
+                self._fd = open(path, 'xb', buffering=WRITE_BUFFER_SIZE)
+                break
+            except FileExistsError:
+                pass
+        self.paths.append(path)
+        self._file_bytes = 0
+        self._opened_at = self._synced_at = time.monotonic()
+
+    def _sync(self):
+        self._fd.flush()
+        os.fsync(self._fd.fileno())
+        self._synced_at = time.monotonic()
+        self._unsynced = False
+
+    def _rotation_due(self, now):
+        if not self._file_bytes:
+            return False
+        return ((self.max_bytes is not None and self._file_bytes >= self.max_bytes) or
+                (self.max_seconds is not None and now - self._opened_at >= self.max_seconds))
+
+    def _find_split(self, data):
+        """
+        Return the offset of the first packet in ``data`` that is
+        followed by another, or -1.
+
+        Checking for two packets in a row keeps a SYNC0/SYNC1 pair
+        within packet data from being taken as the start of a packet.
+        """
+        pos = 0
+        while True:
+            offset, num_packets = find_packet_run(data, pos, 2)
+            if offset < 0 or num_packets == 2:
+                return offset
+            pos = offset + 1
+
+    def _write(self, data):
+        self._fd.write(data)
+        self._file_bytes += len(data)
+        self._unsynced = True
+
+    def write(self, data):
+        """
+        Write bytes read from the serial port.
+        """
+        if not data:
+            return
+        now = time.monotonic()
+        if self._rotation_due(now):
+            # Finish the current file where the next packet starts. If
+            # no packet starts in data, keep writing to the current file.
+            split = self._find_split(data)
+            if split >= 0:
+                self._write(data[:split])
+                self._sync()
+                self._fd.close()
+                self._open()
+                data = data[split:]
+        self._write(data)
+        self.tick()
+
+        if self.reader is not None:
+            self._queue.put(data)
+            values, _, _, _ = self.reader.read_chunk()
+            self.packet_count += len(values)
+
+    def tick(self):
+        """
+        Sync the current file if data written since the last sync has
+        waited ``fsync_interval`` seconds.
+
+        Called by :py:meth:`write`, and should also be called when a
+        read returns nothing, so that data isn't left unsynced while
+        the port is idle.
+        """
+        if self._unsynced and time.monotonic() - self._synced_at >= self.fsync_interval:
+            self._sync()
+
+    def close(self):
+        """
+        Sync and close the current file.
+        """
+        if self._fd is None or self._fd.closed:
+            return
+        self._sync()
+        self._fd.close()
+
+
+def capture(serial_obj, writer, duration=None, on_read=None):
+    """
+    Copy bytes from ``serial_obj`` to ``writer`` until stopped.
+
+    Each read asks for :py:data:`READ_SIZE` bytes and returns early
+    when the port's timeout expires, so memory and CPU use stay the
+    same however long the capture runs. Open the port with a timeout,
+    eg. :py:data:`READ_TIMEOUT`.
+
+    :param serial_obj: Serial port to read.
+    :param writer: Where to write the bytes read.
+    :type writer: :py:class:`CaptureWriter`
+    :param duration: Seconds after which to stop, or ``None`` to run
+                     until interrupted with Ctrl-C.
+    :param on_read: Called with the bytes of every read, eg. to echo
+                    them.
+    :returns: Number of bytes captured.
+    """
+    captured = 0
+    start = time.monotonic()
+    try:
+        while duration is None or time.monotonic() - start < duration:
+            data = serial_obj.read(READ_SIZE)
+            if not data:
+                writer.tick()
+                continue
+            writer.write(data)
+            captured += len(data)
+            if on_read is not None:
+                on_read(data)
+    except KeyboardInterrupt:
+        pass
+    return captured
@@ -17,6 +17,6 @@ PACKET_SLICES = {
     'version': slice(2, 3),
     'count': slice(3, 4),
     'data': slice(4, 16),
-    'switches': slice(16)
+    'switches': slice(16, 17)
 }
 
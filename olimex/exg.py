@@ -29,10 +29,20 @@ shield packet is organized are below::
       uint8_t	switches;	// State of PD5 to PD2, in bits 3 to 0.
     };
 """
+from collections import deque
 import time
 
-from olimex.constants import PACKET_SIZE, PACKET_SLICES, SAMPLE_FREQUENCY, SYNC0, SYNC1
-from olimex.utils import calculate_values_from_packet_data
+import numpy as np
+
+from olimex.constants import NUMCHANNELS, PACKET_SIZE
+from olimex.metrics import ReaderMetrics
+from olimex.utils import calculate_values_from_packets, classify_steps, find_packet_run
+
+FILL_GAPS_CHOICES = (None, 'nan', 'interpolate')
+# Most bytes read from the serial port at a time, so that a source
+# with a lot waiting, eg. a file played back at once, is buffered a
+# bit at a time.
+MAX_READ_SIZE = 64 * 1024
 
 
 class PacketStreamReader:
@@ -45,57 +55,300 @@ class PacketStreamReader:
         serial = serial.Serial(port, 115200)
         reader = PacketStreamReader(serial)
         packet = next(reader)
+
+    The packet counter of every packet is checked to keep track of
+    packets lost on the way from the shield:
+
+    - ``dropped_count``: packets missing according to the counter.
+    - ``duplicate_count``: packets identical to the one before, counter
+      included.
+    - ``counter_error_count``: packets whose counter repeats with
+      different data or jumps too far to be believed.
+    - ``resync_count``: times bytes had to be skipped to find the next
+      packet after the first one.
+
+    These and other counters, such as the bytes read and the latency of
+    reads, are kept in :py:attr:`metrics`, a
+    :py:class:`~olimex.metrics.ReaderMetrics`.
+
+    After each :py:meth:`read_chunk` that returns packets,
+    :py:attr:`last_arrival` holds the :py:func:`time.perf_counter` time
+    at which the bytes of its oldest packet were read from the serial
+    port, see :py:mod:`olimex.tracing`.
+
+    :param fill_gaps: How :py:meth:`read_chunk` accounts for missing
+                      packets. ``None`` returns the packets as received.
+                      ``'nan'`` inserts a row of NaNs for each dropped
+                      packet and ``'interpolate'`` inserts linearly
+                      interpolated values, so that every row is one
+                      sample period apart. Duplicates are left out when
+                      filling gaps.
     """
-    def __init__(self, serial):
+    def __init__(self, serial, fill_gaps=None):
+        if fill_gaps not in FILL_GAPS_CHOICES:
+            raise ValueError('fill_gaps must be one of {}'.format(FILL_GAPS_CHOICES))
         self._serial = serial
+        self.fill_gaps = fill_gaps
+        # Bytes read from the serial port but not handed out yet start
+        # at self._pos. Consumed bytes are dropped on the next read.
+        self._buffer = bytearray()
+        self._pos = 0
+        # data members for tracking dropped packets
+        self._synced = False
+        self._lost_sync = False
+        self._last_count = None
+        self._last_values = None
         # data members for tracking performance
-        self._packet_index = 0
-        self.start_time = time.perf_counter()
-        self.times = []
+        self.metrics = ReaderMetrics()
+        self.last_arrival = None
+        # (end, time) of each read whose bytes aren't all handed out
+        # yet, oldest first. end is the offset in the buffer just past
+        # the bytes of the read.
+        self._reads = deque()
         self.ret_none_count = 0
+        # Number of seeks so far, so that consumers can tell when the
+        # stream jumped and reset any state carried across packets.
+        self.seek_count = 0
+
+    @property
+    def dropped_count(self):
+        return self.metrics.dropped
+
+    @property
+    def duplicate_count(self):
+        return self.metrics.duplicates
+
+    @property
+    def counter_error_count(self):
+        return self.metrics.counter_errors
+
+    @property
+    def resync_count(self):
+        return self.metrics.resyncs
+
+    def _fill(self):
+        """
+        Read what is waiting on the serial port into the buffer, up to
+        :py:data:`MAX_READ_SIZE` bytes.
+
+        Return the number of bytes read.
+        """
+        started = time.perf_counter()
+        in_waiting = min(self._serial.inWaiting(), MAX_READ_SIZE)
+        if not in_waiting:
+            self.metrics.record_read(0, time.perf_counter() - started)
+            return 0
+
+        if self._pos:
+            del self._buffer[:self._pos]
+            self._reads = deque((end - self._pos, read_time)
+                                for end, read_time in self._reads if end > self._pos)
+            self._pos = 0
+        self._buffer.extend(self._serial.read(in_waiting))
+        read_time = time.perf_counter()
+        self._reads.append((len(self._buffer), read_time))
+        self.metrics.record_read(in_waiting, read_time - started)
+        return in_waiting
+
+    def _arrival_at(self, offset):
+        """
+        Return the time of the read the byte at ``offset`` of the buffer
+        came in with.
+        """
+        for end, read_time in self._reads:
+            if end > offset:
+                return read_time
+        return None
+
+    def _skip_to(self, offset):
+        """
+        Discard buffered bytes that cannot be part of a packet.
+
+        :param offset: Offset returned by
+                       :py:func:`~olimex.utils.find_packet_run`.
+        """
+        if offset < 0:
+            # No sync found. Hold on to the last byte in case it
+            # is a SYNC0 whose SYNC1 has not arrived yet.
+            offset = max(self._pos, len(self._buffer) - 1)
+        if offset > self._pos:
+            self._lost_sync = True
+            self.metrics.bytes_discarded += offset - self._pos
+        self._pos = offset
+
+    def _take(self, offset, num_packets):
+        """
+        Return ``num_packets`` packets from the buffer starting at ``offset``.
+        """
+        if offset > self._pos:
+            self._lost_sync = True
+            self.metrics.bytes_discarded += offset - self._pos
+        if self._lost_sync and self._synced:
+            self.metrics.resyncs += 1
+        self._synced = True
+        self._lost_sync = False
+        self.metrics.packets += num_packets
+
+        self._pos = offset + num_packets * PACKET_SIZE
+        return self._buffer[offset:self._pos]
+
+    def _track_counts(self, values, counts):
+        """
+        Update the dropped packet counters.
+
+        Return the step of each packet counter as described in
+        :py:func:`~olimex.utils.count_steps`, with duplicates set to 0
+        and unbelievable steps set to 1.
+        """
+        steps, duplicates, errors = classify_steps(values, counts, self._last_values,
+                                                   self._last_count)
+        if not len(steps):
+            return steps
+
+        self.metrics.duplicates += int(duplicates.sum())
+        self.metrics.counter_errors += int(errors.sum())
+        self.metrics.dropped += int((steps[steps > 1] - 1).sum())
+
+        self._last_count = counts[-1]
+        self._last_values = values[-1].copy()
+        return steps
+
+    def _fill_gaps(self, values, counts, versions, switches, steps, last_values):
+        """
+        Return the packet arrays with rows inserted for dropped packets.
+
+        See the ``fill_gaps`` argument of :py:class:`PacketStreamReader`.
+        """
+        # Position of each packet relative to the first row returned.
+        # Duplicates land on the same position as the packet before them.
+        positions = np.cumsum(steps) - 1
+        received = steps > 0
+        positions = positions[received]
+        if not len(positions):
+            return (np.empty((0, NUMCHANNELS)),
+                    counts[:0], versions[:0], switches[:0])
+
+        filled_values = np.full((positions[-1] + 1, NUMCHANNELS), np.nan)
+        filled_values[positions] = values[received]
+
+        if self.fill_gaps == 'interpolate' and len(positions) < len(filled_values):
+            known_positions = positions
+            known_values = values[received]
+            if last_values is not None:
+                known_positions = np.concatenate(([-1], positions))
+                known_values = np.concatenate(([last_values], known_values))
+            missing = np.isnan(filled_values[:, 0]).nonzero()[0]
+            for channel in range(NUMCHANNELS):
+                filled_values[missing, channel] = np.interp(
+                    missing, known_positions, known_values[:, channel])
+
+        # Inserted rows take the header bytes of the next packet received,
+        # apart from the counter which is counted back from it.
+        slots = np.arange(len(filled_values))
+        following = np.searchsorted(positions, slots)
+        next_received = np.flatnonzero(received)[following]
+        filled_counts = (counts[next_received].astype(np.int16) -
+                         (positions[following] - slots)) % 256
+        return (filled_values,
+                filled_counts.astype(counts.dtype),
+                versions[next_received],
+                switches[next_received])
 
     def _get_next_packet(self):
-        byte0, byte1 = 0, 0
-
-        while byte0 != SYNC0 or byte1 != SYNC1:
-            # If we don't have enough data to do ALL of the following,
-            # return None.
-            #   - Move current byte 1 into byte0 position
-            #   - Read a new byte into byte1  (1 byte)
-            #   - Read the rest of a packet into a buffer (PACKET_SIZE - 2 bytes)
-            # We need at least (PACKET_SIZE - 2) + 1 bytes before
-            # attempting to get the next packet.
-            in_waiting = self._serial.inWaiting()
-            if in_waiting < PACKET_SIZE - 1:
-                return None
-            byte0, byte1 = byte1, self._serial.read()
+        while True:
+            offset, num_packets = find_packet_run(self._buffer, self._pos, 1)
+            if num_packets:
+                return self._take(offset, 1)
 
-        buff = bytearray()
-        buff.append(ord(byte0))
-        buff.append(ord(byte1))
-        # read 15 more bytes and parse result
-        buff.extend(self._serial.read(PACKET_SIZE - 2))
-        return buff
+            self._skip_to(offset)
+            if not self._fill():
+                return None
 
     def _get_next_packet_values(self):
         packet = self._get_next_packet()
         if packet is None:
+            self.metrics.record_empty_poll()
             return None
-        self._packet_index += 1
-        data = packet[PACKET_SLICES['data']]
-        return calculate_values_from_packet_data(data)
+        values, counts, _, _ = calculate_values_from_packets(packet)
+        self._track_counts(values, counts)
+        return values[0].tolist()
+
+    def read_chunk(self, max_packets=None):
+        """
+        Return all packets currently available as arrays.
+
+        :param max_packets: Upper bound on the number of packets to
+                            return. Defaults to every complete packet
+                            available.
+        :returns: A tuple of ``(values, counts, versions, switches)``
+                  as returned by
+                  :py:func:`~olimex.utils.calculate_values_from_packets`.
+                  All arrays are empty if no packet is available. If
+                  the reader fills gaps, ``values`` is a float array
+                  and may have more rows than ``max_packets``.
+        """
+        while ((max_packets is None or
+                len(self._buffer) - self._pos < max_packets * PACKET_SIZE) and
+               self._fill()):
+            pass
+
+        buff = bytearray()
+        num_packets = 0
+        while max_packets is None or num_packets < max_packets:
+            remaining = None if max_packets is None else max_packets - num_packets
+            offset, run_length = find_packet_run(self._buffer, self._pos, remaining)
+            if not run_length:
+                self._skip_to(offset)
+                break
+            if not num_packets:
+                self.last_arrival = self._arrival_at(offset)
+            buff.extend(self._take(offset, run_length))
+            num_packets += run_length
+
+        if not num_packets:
+            self.metrics.record_empty_poll()
+        # Forget the reads handed out in full.
+        while self._reads and self._reads[0][0] <= self._pos:
+            self._reads.popleft()
+
+        values, counts, versions, switches = calculate_values_from_packets(buff)
+        last_values = self._last_values
+        steps = self._track_counts(values, counts)
+        if self.fill_gaps is None:
+            return values, counts, versions, switches
+        return self._fill_gaps(values, counts, versions, switches, steps, last_values)
+
+    def seek(self, offset):
+        """
+        Continue reading from byte ``offset`` of the source.
+
+        The source must support seeking, eg.
+        :py:class:`~olimex.mock.ReplaySerial`. Use a
+        :py:class:`~olimex.index.PacketIndex` to find the offset of a
+        packet.
+
+        Packet counters and sync are tracked afresh from the new
+        position, so the jump doesn't count as dropped packets.
+        """
+        self._serial.seek(offset)
+        del self._buffer[:]
+        self._pos = 0
+        self._synced = False
+        self._lost_sync = False
+        self._last_count = None
+        self._last_values = None
+        self._reads.clear()
+        self.seek_count += 1
 
     @property
     def packets_in_waiting(self):
-        return self._serial.inWaiting() // PACKET_SIZE
+        buffered = len(self._buffer) - self._pos
+        return (self._serial.inWaiting() + buffered) // PACKET_SIZE
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        if not self._packet_index % SAMPLE_FREQUENCY:
-            self.times.append(time.perf_counter() - self.start_time)
-
         values = self._get_next_packet_values()
 
         if values is None:
@@ -0,0 +1,100 @@
+"""
+This module defines a FilterBank for cleaning up exg samples as they
+stream in.
+
+Raw samples carry baseline wander and mains hum. A :py:class:`FilterBank`
+removes them with a high-pass, a notch and a low-pass filter applied to
+all channels at once. Filter state is kept between calls, so the output
+is the same however the samples are split into chunks.
+"""
+import numpy as np
+import scipy.signal
+
+from olimex.constants import NUMCHANNELS, SAMPLE_FREQUENCY
+
+DEFAULT_HIGHPASS = 0.5  # Hz, removes baseline wander
+DEFAULT_NOTCH = 60  # Hz, mains frequency (50 in most of the world)
+DEFAULT_LOWPASS = 40  # Hz, removes muscle and high frequency noise
+NOTCH_QUALITY = 30
+
+
+class FilterBank:
+    """
+    Filter blocks of samples from all channels, keeping state between
+    blocks.
+
+    For example::
+
+        filter_bank = FilterBank(notch=50)
+        while True:
+            values, *_ = reader.read_chunk()
+            filtered = filter_bank.filter(values)
+
+    The filters are IIR filters run as one cascade of second-order
+    sections, so there is no block delay and only a few multiply-adds
+    per sample and channel.
+
+    :param highpass: High-pass cut-off in Hz, or ``None`` to disable.
+    :param notch: Notch frequency in Hz, or ``None`` to disable.
+    :param lowpass: Low-pass cut-off in Hz, or ``None`` to disable. Must
+                    be below half of ``fs``.
+    :param fs: Sampling frequency in Hz.
+    :param num_channels: Number of channels in each block.
+    :param order: Order of the high-pass and low-pass filters.
+    """
+    def __init__(self, highpass=DEFAULT_HIGHPASS, notch=DEFAULT_NOTCH, lowpass=DEFAULT_LOWPASS,
+                 fs=SAMPLE_FREQUENCY, num_channels=NUMCHANNELS, order=2):
+        self.highpass = highpass
+        self.notch = notch
+        self.lowpass = lowpass
+        self.fs = fs
+        self.num_channels = num_channels
+
+        sections = []
+        if highpass:
+            sections.append(scipy.signal.butter(order, highpass, btype='highpass', fs=fs,
+                                                output='sos'))
+        if notch:
+            b, a = scipy.signal.iirnotch(notch, NOTCH_QUALITY, fs=fs)
+            sections.append(scipy.signal.tf2sos(b, a))
+        if lowpass:
+            sections.append(scipy.signal.butter(order, lowpass, btype='lowpass', fs=fs,
+                                                output='sos'))
+        if not sections:
+            raise ValueError('At least one filter must be enabled')
+        self.sos = np.concatenate(sections)
+        self._state = None
+
+    def __repr__(self):
+        return '<FilterBank highpass={} notch={} lowpass={}>'.format(
+            self.highpass, self.notch, self.lowpass)
+
+    def reset(self):
+        """
+        Forget the filter state, eg. after seeking within a recording.
+        """
+        self._state = None
+
+    def filter(self, samples):
+        """
+        Return the filtered samples.
+
+        :param samples: Array of shape ``(N, num_channels)``. Samples
+                        must be evenly spaced and finite.
+        :returns: Float array of the same shape.
+        :raises ValueError: If the samples don't have ``num_channels``
+                            columns.
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        if samples.ndim != 2 or samples.shape[1] != self.num_channels:
+            raise ValueError('expected samples of shape (N, {}), got {}'.format(
+                self.num_channels, samples.shape))
+        if not len(samples):
+            return samples
+        if self._state is None:
+            # Start as if the first sample had always been there, so
+            # the high-pass doesn't ring on the DC offset.
+            zi = scipy.signal.sosfilt_zi(self.sos)
+            self._state = zi[:, :, np.newaxis] * samples[0]
+        filtered, self._state = scipy.signal.sosfilt(self.sos, samples, axis=0, zi=self._state)
+        return filtered
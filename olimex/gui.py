@@ -1,28 +1,25 @@
 """
 This module defines logic for plotting exg data in real-time.
+
+matplotlib, tkinter and scipy are only imported once a figure is
+shown, so that commands such as ``--list-mock-data`` start quickly.
 """
 import argparse
 import os
 import sys
 
-try:
-    import tkinter
-except ImportError:
-    print('exg requires tkinter to be installed')
-    sys.exit(1)
-
-import matplotlib as mpl
-mpl.use('TkAgg')
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
 import numpy as np
-import scipy.ndimage
 import serial
 
-from olimex.constants import DEFAULT_BAUDRATE, SAMPLE_FREQUENCY
+from olimex.acquisition import BackgroundReader
+from olimex.constants import DEFAULT_BAUDRATE, NUMCHANNELS, SAMPLE_FREQUENCY
 from olimex.exg import PacketStreamReader
-from olimex.mock import FakeSerialByteArray
-from olimex.utils import calculate_heart_rate, get_mock_data_list
+from olimex.index import PacketIndex
+from olimex.metrics import RATE_WINDOW
+from olimex.mock import ReplaySerial
+from olimex.ports import AUTO_PORT, find_shields
+from olimex.tracing import LatencyTracer, print_latencies
+from olimex.utils import get_mock_data_list
 
 # Packets are coming in at 125 packets per second
 # Ie. Every 8 ms, a packet is received
@@ -44,20 +41,99 @@ DOTS_PER_STRIP_HEIGHT = 1025
 DOTS_MAX_GRAPH_HEIGHT = 1023
 
 SAMPLES_PER_004_SECOND = int(5)
+DOTS_PER_SAMPLE = int(DOTS_PER_SECOND / SAMPLE_FREQUENCY)
+# Blank space kept ahead of the write head of a sweeping strip.
+DOTS_PER_SWEEP_GAP = int(DOTS_PER_02_SECOND)
 
 REFRESHES_PER_SECOND = 25
 REFRESH_INTERVAL_MS = 1000 / REFRESHES_PER_SECOND
 DOTS_TO_JUMP_PER_REFRESH = DOTS_PER_SECOND / REFRESHES_PER_SECOND
+# Most packets read per refresh: two strip lengths. Files played back
+# as fast as possible are read a bit at a time rather than at once.
+MAX_PACKETS_PER_REFRESH = 2 * STRIP_LENGTH_SECONDS * SAMPLE_FREQUENCY
+
+# Number of spectra along the spectrogram
+SPECTROGRAM_LENGTH = 60
+
+LINE_WIDTH = 0.35
+
 
-mpl.rcParams['savefig.dpi'] = 600
-mpl.rcParams['savefig.bbox'] = 'tight'
-mpl.rcParams['lines.linewidth'] = 0.35
+def use_tk_backend():
+    """
+    Set matplotlib up to show figures in Tk windows.
+
+    Exits if tkinter isn't installed.
+    """
+    try:
+        import tkinter
+    except ImportError:
+        print('exg requires tkinter to be installed')
+        sys.exit(1)
+
+    import matplotlib as mpl
+    mpl.use('TkAgg')
+    mpl.rcParams['savefig.dpi'] = 600
+    mpl.rcParams['savefig.bbox'] = 'tight'
 
 
 INITIAL_VOLTAGE = DOTS_PER_STRIP_HEIGHT / 2
 
 
-def get_new_data_points(packet_reader):
+class StripBuffer:
+    """
+    A preallocated, sweep-style strip of dots.
+
+    Like a classic ECG monitor, new samples are written over the oldest
+    ones at a write head that moves left to right and wraps around. A
+    short gap of blank (NaN) dots is kept ahead of the write head so
+    the sweep is visible. Writing samples allocates nothing.
+
+    :param length: Number of dots along the strip.
+    :param num_channels: Number of channels held in the strip.
+    :ivar ydata: Array of shape ``(num_channels, length)``. Each row can
+                 be passed as the ydata of a matplotlib line once and
+                 is updated in place from then on.
+    """
+    def __init__(self, length=DOTS_PER_STRIP_LENGTH, num_channels=1,
+                 dots_per_sample=DOTS_PER_SAMPLE, gap=DOTS_PER_SWEEP_GAP):
+        if length % dots_per_sample:
+            raise ValueError('length must be a multiple of dots_per_sample')
+        self.length = length
+        self.dots_per_sample = dots_per_sample
+        self.gap = gap
+        # Start the graph off with a flat vertically-centered line
+        self.ydata = np.full((num_channels, length), INITIAL_VOLTAGE)
+        self.head = 0
+
+    def write(self, samples):
+        """
+        Write samples at the write head and move the head past them.
+
+        :param samples: Array of shape ``(N, num_channels)``.
+        """
+        num_samples = len(samples)
+        if not num_samples:
+            return
+        if num_samples * self.dots_per_sample > self.length:
+            samples = samples[-(self.length // self.dots_per_sample):]
+            num_samples = len(samples)
+
+        # The head is always on a sample boundary and the length is a
+        # multiple of dots_per_sample, so wrapping splits on a sample.
+        first = min(num_samples, (self.length - self.head) // self.dots_per_sample)
+        end = self.head + first * self.dots_per_sample
+        wrapped_end = (num_samples - first) * self.dots_per_sample
+        for dot in range(self.dots_per_sample):
+            self.ydata[:, self.head + dot:end:self.dots_per_sample] = samples[:first].T
+            self.ydata[:, dot:wrapped_end:self.dots_per_sample] = samples[first:].T
+        self.head = (self.head + num_samples * self.dots_per_sample) % self.length
+
+        gap_end = self.head + self.gap
+        self.ydata[:, self.head:gap_end] = np.nan
+        self.ydata[:, :max(gap_end - self.length, 0)] = np.nan
+
+
+def get_new_data_points(packet_reader, max_packets=MAX_PACKETS_PER_REFRESH):
     """
     Return all data points in the buffer waiting to be displayed.
 
@@ -65,58 +141,266 @@ def get_new_data_points(packet_reader):
     read into a waiting buffer where they are held before
     they are displayed during the next refresh. The packet
     reader is responsible for managing that buffer.
+
+    :param packet_reader: A :py:class:`~olimex.exg.PacketStreamReader`
+                          or :py:class:`~olimex.acquisition.BackgroundReader`.
+    :param max_packets: Most packets returned at a time.
     """
-    range_samples_per_004_second = range(SAMPLES_PER_004_SECOND)
     while True:
-        new_data = np.array([INITIAL_VOLTAGE for _ in range_samples_per_004_second])
-        for i, _ in enumerate(range_samples_per_004_second):
-            channel_values = next(packet_reader)
-            if channel_values:
-                channel_1, *_ = channel_values
-                new_data[i] = channel_1
-        new_data = scipy.ndimage.zoom(new_data, DOTS_PER_SECOND / SAMPLE_FREQUENCY,
-                                      order=0)
-        yield new_data
+        values, *_ = packet_reader.read_chunk(max_packets)
+        yield values
 
 
-def axes_updater(axes, packet_reader):
+def draw_grid(axes, strip_length=DOTS_PER_STRIP_LENGTH, strip_height=DOTS_PER_STRIP_HEIGHT):
     """
-    Update exg figure.
+    Draw the red ECG paper grid on ``axes``.
 
-    This function will update the exg figure.
+    The grid never changes. When blitting, it is rendered once as part
+    of the cached background.
 
-    :param axes:
-    :param packet_reader:
+    :param strip_length: Number of dots along the strip.
+    :param strip_height: Number of dots up the strip.
     """
-    minor_vgrid_points = np.arange(0, DOTS_PER_STRIP_LENGTH, DOTS_PER_004_SECOND)
-    axes.vlines(minor_vgrid_points, 0, DOTS_PER_STRIP_HEIGHT, color='r', alpha=0.3)
+    minor_vgrid_points = np.arange(0, strip_length, DOTS_PER_004_SECOND)
+    axes.vlines(minor_vgrid_points, 0, strip_height, color='r', alpha=0.3)
 
-    minor_hgrid_points = np.arange(0, DOTS_PER_STRIP_HEIGHT, 1.75 * DOTS_PER_004_SECOND)
-    axes.hlines(minor_hgrid_points, 0, DOTS_PER_STRIP_LENGTH, color='r', alpha=0.3)
+    minor_hgrid_points = np.arange(0, strip_height, 1.75 * DOTS_PER_004_SECOND)
+    axes.hlines(minor_hgrid_points, 0, strip_length, color='r', alpha=0.3)
 
-    major_vgrid_points = np.arange(0, DOTS_PER_STRIP_LENGTH, DOTS_PER_02_SECOND)
-    axes.vlines(major_vgrid_points, 0, DOTS_PER_STRIP_HEIGHT, color='r', alpha=0.9)
+    major_vgrid_points = np.arange(0, strip_length, DOTS_PER_02_SECOND)
+    axes.vlines(major_vgrid_points, 0, strip_height, color='r', alpha=0.9)
 
-    major_hgrid_points = np.arange(0, DOTS_PER_STRIP_HEIGHT, 1.75 * DOTS_PER_02_SECOND)
-    axes.hlines(major_hgrid_points, 0, DOTS_PER_STRIP_LENGTH, color='r', alpha=0.9)
+    major_hgrid_points = np.arange(0, strip_height, 1.75 * DOTS_PER_02_SECOND)
+    axes.hlines(major_hgrid_points, 0, strip_length, color='r', alpha=0.9)
 
-    # Start the graph off with a flat vertically-centered line
-    ydata = np.array([INITIAL_VOLTAGE for _ in range(DOTS_PER_STRIP_LENGTH)])
-    line, = axes.plot(range(DOTS_PER_STRIP_LENGTH), ydata)
+
+def spectrogram_artists(axes, estimator, length=SPECTROGRAM_LENGTH):
+    """
+    Set up ``axes`` to show a spectrogram of channel 1.
+
+    :param estimator: Estimator whose spectra are shown.
+    :type estimator: :py:class:`~olimex.spectral.SpectralEstimator`
+    :param length: Number of spectra along the spectrogram.
+    :returns: A tuple of the :py:class:`~olimex.spectral.SpectrogramBuffer`,
+              the image showing it and a median frequency read-out.
+    """
+    from olimex.spectral import SPECTROGRAM_RANGE, SpectrogramBuffer
+
+    spectrogram = SpectrogramBuffer(len(estimator.frequencies), length)
+    extent = (0, length, estimator.frequencies[0], estimator.frequencies[-1])
+    image = axes.imshow(spectrogram.image, origin='lower', aspect='auto', extent=extent,
+                        vmin=-SPECTROGRAM_RANGE, vmax=0, cmap='viridis', animated=True)
+    axes.xaxis.set_visible(False)
+    axes.set_ylabel('Hz')
+    median_text = axes.text(0.01, 0.97, '', transform=axes.transAxes, va='top',
+                            color='w', animated=True)
+    return spectrogram, image, median_text
+
+
+def axes_updater(axes, packet_reader, strip_length=DOTS_PER_STRIP_LENGTH, num_channels=1,
+                 filter_bank=None, spectrogram_axes=None, tracer=None):
+    """
+    Update exg figure.
+
+    This function will update the exg figure. The first step draws the
+    grid, the traces and a heart rate read-out for channel 1. Every step
+    yields the artists that change from frame to frame, as needed by a
+    blitting :py:class:`~matplotlib.animation.FuncAnimation`.
+
+    All channels shown share one :py:class:`StripBuffer` and are
+    written to it in one go. Each channel is stacked above the next by
+    the transform of its line rather than by shifting its data.
+
+    :param axes:
+    :param packet_reader:
+    :param strip_length: Number of dots along the strip.
+    :param num_channels: Number of channels to show, starting with
+                         channel 1 at the top.
+    :param filter_bank: Filters applied to the samples before they are
+                        drawn.
+    :type filter_bank: :py:class:`~olimex.filters.FilterBank`
+    :param spectrogram_axes: Axes on which to show a spectrogram and the
+                             median frequency of channel 1, or ``None``.
+    :param tracer: Tracer of the latency of each batch, or ``None``.
+                   The ``render`` stage is stamped once the artists
+                   yielded are drawn, see :py:func:`render_stamp`.
+    :type tracer: :py:class:`~olimex.tracing.LatencyTracer`
+    """
+    from matplotlib.transforms import Affine2D
+    from olimex.heart import QRSDetector
+    from olimex.spectral import SpectralEstimator
+
+    draw_grid(axes, strip_length, num_channels * DOTS_PER_STRIP_HEIGHT)
+
+    strip = StripBuffer(strip_length, num_channels)
+    xdata = np.arange(strip_length)
+    lines = []
+    for channel, ydata in enumerate(strip.ydata):
+        offset = (num_channels - 1 - channel) * DOTS_PER_STRIP_HEIGHT
+        transform = Affine2D().translate(0, offset) + axes.transData
+        line, = axes.plot(xdata, ydata, animated=True, transform=transform,
+                          linewidth=LINE_WIDTH)
+        lines.append(line)
+    heart_rate_text = axes.text(0.01, 0.99, '', transform=axes.transAxes,
+                                va='top', animated=True)
+    artists = tuple(lines) + (heart_rate_text,)
+
+    estimator = None
+    if spectrogram_axes is not None:
+        estimator = SpectralEstimator()
+        spectrogram, image, median_text = spectrogram_artists(spectrogram_axes, estimator)
+        artists += (image, median_text)
+    if tracer is not None:
+        artists += (render_stamp(axes, tracer),)
+    yield artists
+
+    detector = QRSDetector()
+    peak_count = 0
+    seek_count = packet_reader.seek_count
 
     new_data_gen = get_new_data_points(packet_reader)
-    delete_indicies= range(int(SAMPLES_PER_004_SECOND * (DOTS_PER_SECOND / SAMPLE_FREQUENCY)))
     while True:
         new_data = next(new_data_gen)
+        if packet_reader.seek_count != seek_count:
+            # Playback jumped. Don't run beat detection or filters
+            # across the jump.
+            seek_count = packet_reader.seek_count
+            detector = QRSDetector()
+            peak_count = 0
+            heart_rate_text.set_text('')
+            if filter_bank is not None:
+                filter_bank.reset()
+            if estimator is not None:
+                estimator.reset()
+        if tracer is not None:
+            tracer.begin(packet_reader.last_arrival if len(new_data) else None)
+            tracer.stamp('decode')
+        # Beats are detected on the raw signal.
+        detector.update(new_data)
+
+        if filter_bank is not None:
+            new_data = filter_bank.filter(new_data)
+            if filter_bank.highpass:
+                # Put the signal back in the middle of the strip.
+                new_data += INITIAL_VOLTAGE
+        strip.write(new_data[:, :num_channels])
+        # ydata was updated in place. Setting it again only tells
+        # the lines to recache it.
+        for line, ydata in zip(lines, strip.ydata):
+            line.set_ydata(ydata)
+
+        # A new spectrum is only ready every hop, about once a second.
+        if estimator is not None and len(new_data):
+            spectra = estimator.update(new_data)
+            if len(spectra):
+                spectrogram.write(spectra)
+                image.set_data(spectrogram.image)
+                median_text.set_text('median {:.1f} Hz'.format(estimator.median_frequency[0]))
+
+        if detector.peak_count != peak_count and detector.heart_rate:
+            peak_count = detector.peak_count
+            heart_rate_text.set_text('{:.0f} bpm'.format(detector.heart_rate))
+        if tracer is not None:
+            tracer.stamp('process')
+        yield artists
+
+
+def add_timeline(fig, reader, index, start=0):
+    """
+    Add a slider to ``fig`` for scrubbing through a recording.
+
+    :param reader: Reader playing back the recording.
+    :type reader: :py:class:`~olimex.exg.PacketStreamReader`
+                  or :py:class:`~olimex.acquisition.BackgroundReader`.
+    :param index: Index of the recording.
+    :type index: :py:class:`~olimex.index.PacketIndex`
+    :param start: Initial position of the slider in seconds.
+    :returns: The slider. Keep a reference to it, otherwise it stops
+              responding.
+    """
+    from matplotlib.widgets import Slider
+
+    fig.subplots_adjust(bottom=0.15)
+    slider_axes = fig.add_axes([0.1, 0.02, 0.8, 0.05])
+    slider = Slider(slider_axes, 's', 0, max(index.duration, 1 / SAMPLE_FREQUENCY),
+                    valinit=start)
+    slider.on_changed(lambda seconds: reader.seek(index.offset_at_time(seconds)))
+    return slider
+
+
+def add_playback_keys(fig, serial_obj):
+    """
+    Control playback of a recording from the keyboard.
+
+    Space pauses and resumes playback, ``+`` doubles its speed and
+    ``-`` halves it.
+
+    :type serial_obj: :py:class:`~olimex.mock.ReplaySerial`
+    """
+    def on_key_press(event):
+        if event.key == ' ':
+            if serial_obj.paused:
+                serial_obj.resume()
+            else:
+                serial_obj.pause()
+        elif event.key == '+' and serial_obj.speed:
+            serial_obj.speed *= 2
+        elif event.key == '-' and serial_obj.speed:
+            serial_obj.speed /= 2
+
+    fig.canvas.mpl_connect('key_press_event', on_key_press)
+
+
+def render_stamp(axes, tracer):
+    """
+    Return an artist of ``axes`` that stamps the ``render`` stage of
+    ``tracer`` when drawn.
+
+    Blitted frames don't fire the canvas's ``draw_event``, so the stamp
+    is an animated artist of its own instead. It is drawn last of the
+    artists of each frame, after which only the copy to the screen is
+    left.
+
+    :type tracer: :py:class:`~olimex.tracing.LatencyTracer`
+    """
+    from matplotlib.artist import Artist
+
+    class RenderStamp(Artist):
+        def draw(self, renderer):
+            if self.get_visible():
+                tracer.stamp('render')
+
+    stamp = RenderStamp()
+    stamp.set_animated(True)
+    # Frames draw their artists in order of zorder.
+    stamp.set_zorder(float('inf'))
+    axes.add_artist(stamp)
+    return stamp
 
-        # Remove old data points, add new ones
-        ydata = np.delete(ydata, delete_indicies)
-        ydata = np.append(ydata, new_data)
-        line.set_ydata(ydata)
-        yield
 
+def print_metrics(metrics):
+    """
+    Print a summary of a reader's metrics.
 
-def show_exg(source, source_type='port', print_timing_data=False):
+    :type metrics: :py:class:`~olimex.metrics.ReaderMetrics`
+    """
+    snapshot = metrics.snapshot()
+    print('{packets} packets in {elapsed:.1f} s ({packets_per_second:.1f}/s over the last '
+          '{window} s)'.format(window=RATE_WINDOW, **snapshot))
+    print('{bytes_read} bytes read in {reads} reads, {empty_polls} empty, '
+          '{bytes_discarded} bytes discarded'.format(**snapshot))
+    print('{dropped} dropped, {duplicates} duplicates, {counter_errors} counter errors, '
+          '{resyncs} resyncs'.format(**snapshot))
+    if snapshot['reads']:
+        print('read latency: mean {:.0f} us, p50 < {:.0f} us, p99 < {:.0f} us, '
+              'max {:.0f} us'.format(*(1e6 * snapshot[key] for key in (
+                  'read_latency_mean', 'read_latency_p50', 'read_latency_p99',
+                  'read_latency_max'))))
+
+
+def show_exg(source, source_type='port', print_timing_data=False, start=0,
+             background=False, strip_seconds=STRIP_LENGTH_SECONDS, num_channels=1,
+             filter_bank=None, spectrogram=False, speed=1, trace=False):
     """
     Create and display a real-time :ref:`exg <exg>` figure.
 
@@ -127,42 +411,86 @@ def show_exg(source, source_type='port', print_timing_data=False):
     :param source: Serial port being sent exg packets or
                    file path to file containing saved exg data.
     :type source: str
+    :param start: Number of seconds into a file at which to start playback.
+    :param speed: Multiple of real time at which to play back a file, or
+                  0 to play it back as fast as possible.
+    :param background: Read from the serial port on a background thread
+                       instead of on each refresh of the figure.
+    :param strip_seconds: Number of seconds shown along the strip.
+    :type strip_seconds: int
+    :param num_channels: Number of channels to show in stacked strips.
+    :param filter_bank: Filters applied to the samples before they are
+                        drawn.
+    :type filter_bank: :py:class:`~olimex.filters.FilterBank`
+    :param spectrogram: Show a spectrogram of channel 1 below the strips.
+    :param trace: Measure the latency from the serial port to the screen
+                  and print its percentiles when the figure is closed.
     """
+    use_tk_backend()
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+
+    index = None
     if source_type == 'file':
-        print('Loading data...', end='', flush=True)
-        with open(source, 'rb') as fd:
-            buff = bytearray(fd.read())
-        serial_obj = FakeSerialByteArray(buff)
-        print('Done.')
+        serial_obj = ReplaySerial(source, speed=speed)
+        index = PacketIndex.for_file(source)
 
     else:
         serial_obj = serial.Serial(source, DEFAULT_BAUDRATE)
 
     reader = PacketStreamReader(serial_obj)
-
-    fig, axes = plt.subplots(figsize=(STRIP_LENGTH_SECONDS,
-                                      STRIP_LENGTH_SECONDS / 3),
-                             dpi=DOTS_PER_SECOND)
-    fig.canvas.set_window_title(source)
-    axes.set_ylim(0, DOTS_PER_STRIP_HEIGHT)
-    axes.set_xlim(0, DOTS_PER_STRIP_LENGTH)
+    if index is not None and start:
+        reader.seek(index.offset_at_time(start))
+
+    strip_length = DOTS_PER_SECOND * strip_seconds
+    strip_height = num_channels * STRIP_LENGTH_SECONDS / 3
+    spectrogram_axes = None
+    if spectrogram:
+        spectrogram_height = STRIP_LENGTH_SECONDS / 3
+        fig, (axes, spectrogram_axes) = plt.subplots(
+            2, figsize=(strip_seconds, strip_height + spectrogram_height),
+            dpi=DOTS_PER_SECOND,
+            gridspec_kw={'height_ratios': (strip_height, spectrogram_height)})
+    else:
+        fig, axes = plt.subplots(figsize=(strip_seconds, strip_height), dpi=DOTS_PER_SECOND)
+    fig.canvas.manager.set_window_title(source)
+    axes.set_ylim(0, num_channels * DOTS_PER_STRIP_HEIGHT)
+    axes.set_xlim(0, strip_length)
     axes.xaxis.set_visible(False)
     axes.yaxis.set_visible(False)
 
-    axes_updater_gen = axes_updater(axes, reader)
+    packet_reader = reader
+    if background:
+        packet_reader = BackgroundReader(reader)
+        packet_reader.start()
 
+    if index is not None:
+        # Seeks go through the background reader, if any, so that the
+        # reader is only used by one thread.
+        slider = add_timeline(fig, packet_reader, index, start)
+        add_playback_keys(fig, serial_obj)
+
+    tracer = LatencyTracer() if trace else None
+    axes_updater_gen = axes_updater(axes, packet_reader, strip_length, num_channels,
+                                    filter_bank, spectrogram_axes, tracer)
+    artists = next(axes_updater_gen)
+
+    # Only the trace is redrawn each refresh. The grid is rendered once
+    # and restored from the cached background by blitting.
     # Don't remove the "ani" binding below. Otherwise this animation
     # gets garbage collected.
-    try:
-        ani = animation.FuncAnimation(fig, lambda _: next(axes_updater_gen),
-                                  interval=REFRESH_INTERVAL_MS)
-    except StopIteration:
-        pass
+    ani = animation.FuncAnimation(fig, lambda _: next(axes_updater_gen),
+                                  init_func=lambda: artists,
+                                  interval=REFRESH_INTERVAL_MS,
+                                  blit=True)
 
     plt.show()
+    if background:
+        packet_reader.stop()
     if print_timing_data:
-        for p in reader.times:
-            print(p)
+        print_metrics(reader.metrics)
+    if tracer is not None:
+        print_latencies(tracer)
 
 
 def run_gui():
@@ -170,24 +498,90 @@ def run_gui():
     parser = argparse.ArgumentParser(description='Run GUI for Olimex-EKG-EMG.')
     parser.add_argument('-p', '--port',
                         dest='port',
-                        help='Port to which an Arduino is connected (eg. /dev/tty.usbmodem1411)')
+                        help='Port to which an Arduino is connected (eg. /dev/tty.usbmodem1411), '
+                             'or "auto" to use the first shield found.')
     parser.add_argument('-f', '--file',
                         dest='file',
-                        help='File to stream EXG data from. Loads entire file prior to display.')
+                        help='File to stream EXG data from.')
+    parser.add_argument('-b', '--background',
+                        action='store_true',
+                        default=False,
+                        dest='background',
+                        help='Read from PORT on a background thread.')
+    parser.add_argument('-c', '--channels',
+                        dest='channels',
+                        type=int,
+                        choices=range(1, NUMCHANNELS + 1),
+                        default=1,
+                        help='Number of channels to show in stacked strips.')
+    parser.add_argument('--filter',
+                        action='store_true',
+                        default=False,
+                        dest='filter',
+                        help='Remove baseline wander, mains hum and high frequency noise.')
+    parser.add_argument('--mains',
+                        dest='mains',
+                        type=int,
+                        choices=(50, 60),
+                        default=60,
+                        help='Mains frequency removed by --filter.')
+    parser.add_argument('--spectrogram',
+                        action='store_true',
+                        default=False,
+                        dest='spectrogram',
+                        help='Show a spectrogram and the median frequency of channel 1.')
+    parser.add_argument('--strip-seconds',
+                        dest='strip_seconds',
+                        type=int,
+                        default=STRIP_LENGTH_SECONDS,
+                        help='Number of seconds shown along the strip.')
+    parser.add_argument('--speed',
+                        dest='speed',
+                        type=float,
+                        default=1,
+                        help='Multiple of real time at which to play back FILE, '
+                             'or 0 to play it back as fast as possible. '
+                             'Space pauses, + and - change the speed.')
+    parser.add_argument('-s', '--start',
+                        dest='start',
+                        type=float,
+                        default=0,
+                        help='Number of seconds into FILE at which to start playback.')
     parser.add_argument('--list-mock-data',
                         action='store_true',
                         default=False,
                         dest='list_mock_data',
                         help='List all mock data files available.')
+    parser.add_argument('--trace',
+                        action='store_true',
+                        default=False,
+                        dest='trace',
+                        help='Print percentiles of the latency from the serial port to the '
+                             'screen when the figure is closed.')
     parser.add_argument('--print-timing-data',
                         action='store_true',
                         default=False,
                         dest='print_timing_data',
-                        help='File to stream EXG data from. Loads entire file prior to display.')
+                        help='Print packet rates, read latencies and errors when the '
+                             'figure is closed.')
     args = parser.parse_args()
+    filter_bank = None
+    if args.filter:
+        from olimex.filters import FilterBank
+        filter_bank = FilterBank(notch=args.mains)
+
+    if args.port == AUTO_PORT:
+        shields = find_shields()
+        if not shields:
+            print('No shield found')
+            return
+        args.port = shields[0]
 
     if args.port:
-        show_exg(args.port, print_timing_data=args.print_timing_data)
+        show_exg(args.port, print_timing_data=args.print_timing_data,
+                 background=args.background, strip_seconds=args.strip_seconds,
+                 num_channels=args.channels, filter_bank=filter_bank,
+                 spectrogram=args.spectrogram, trace=args.trace)
 
     elif args.file:
         data_dir, files = get_mock_data_list()
@@ -196,7 +590,10 @@ def run_gui():
         if not os.path.exists(args.file):
             print('File at {} not found'.format(args.file))
             return
-        show_exg(args.file, source_type='file', print_timing_data=args.print_timing_data)
+        show_exg(args.file, source_type='file', print_timing_data=args.print_timing_data,
+                 start=args.start, speed=args.speed, strip_seconds=args.strip_seconds,
+                 num_channels=args.channels, filter_bank=filter_bank,
+                 spectrogram=args.spectrogram, trace=args.trace)
 
     elif args.list_mock_data:
         data_dir, files = get_mock_data_list()
@@ -0,0 +1,269 @@
+"""
+This module defines a QRSDetector for finding R-peaks and heart rate
+in a stream of exg samples.
+
+The detector follows Pan and Tompkins (1985): the signal is band-pass
+filtered, differentiated, squared and integrated over a moving window,
+and peaks of the result are classified as QRS complexes or noise
+against adaptive thresholds. All filter and threshold state is kept
+between calls, so samples can be fed in chunks of any size, from a live
+:py:class:`~olimex.exg.PacketStreamReader` or from a recording.
+"""
+from collections import deque
+
+import numpy as np
+import scipy.signal
+
+from olimex.constants import SAMPLE_FREQUENCY
+
+# Pass band of the QRS complex, Hz
+QRS_BAND = (5, 15)
+# Width of the moving integration window, seconds
+INTEGRATION_WINDOW = 0.15
+# No two beats are closer than this, seconds
+REFRACTORY_PERIOD = 0.2
+# Peaks this soon after a beat and less than half its size are
+# taken to be T-waves, seconds
+T_WAVE_PERIOD = 0.36
+# Length of the initial period used to set thresholds, seconds
+LEARNING_PERIOD = 2
+# Slope below which nothing counts as a QRS complex, ADC counts per
+# second. Keeps the detector from tracking noise when there is no
+# heartbeat (eg. asystole) or no signal.
+MIN_QRS_SLOPE = 500
+# Number of RR intervals averaged for the heart rate
+RR_AVERAGE_LENGTH = 8
+# Number of RR intervals kept in QRSDetector.rr_intervals
+RR_HISTORY_LENGTH = 256
+
+
+class QRSDetector:
+    """
+    Detect R-peaks in a stream of samples from one channel.
+
+    For example::
+
+        detector = QRSDetector()
+        while True:
+            values, *_ = reader.read_chunk()
+            peak_times = detector.update(values)
+            print(detector.heart_rate)
+
+    :param fs: Sampling frequency in Hz.
+    :param channel: Channel to use when :py:meth:`update` is passed an
+                    ``(N, 6)`` block of samples.
+    :ivar rr_intervals: The most recent RR intervals in seconds.
+    :ivar peak_count: Number of R-peaks detected so far.
+    """
+    def __init__(self, fs=SAMPLE_FREQUENCY, channel=0):
+        self.fs = fs
+        self.channel = channel
+
+        self._bandpass = scipy.signal.butter(2, QRS_BAND, btype='bandpass', fs=fs, output='sos')
+        self._bandpass_state = None
+        # five-point derivative
+        self._derivative = np.array([2, 1, 0, -1, -2]) * fs / 8
+        self._derivative_state = np.zeros(len(self._derivative) - 1)
+        self._window = int(INTEGRATION_WINDOW * fs)
+        self._integrator = np.ones(self._window) / self._window
+        self._integrator_state = np.zeros(self._window - 1)
+
+        self._refractory = int(REFRACTORY_PERIOD * fs)
+        self._t_wave_period = int(T_WAVE_PERIOD * fs)
+        self._learning_length = int(LEARNING_PERIOD * fs)
+
+        # Number of samples seen so far
+        self._sample_index = 0
+        # Recent band-passed samples for locating the R-peak within
+        # the integration window. _history[0] is at _history_start.
+        self._history = np.empty(0)
+        self._history_start = 0
+        self._history_length = self._learning_length + 2 * self._window
+        # Last two integrated samples, for finding local maxima
+        # that straddle two updates.
+        self._tail = np.empty(0)
+
+        # Adaptive thresholds, set at the end of the learning period
+        self._learning = []
+        self._learning_end = self._learning_length
+        self._learning_max = 0
+        self._learning_sum = 0
+        self._signal_level = None
+        self._noise_level = None
+        # Largest noise peak since the last beat, for searching back
+        # for a missed beat: (sample index, value)
+        self._searchback_peak = None
+        self._last_peak = None
+        self._last_integrated_peak = None
+        self._last_integrated_value = None
+
+        self.rr_intervals = deque(maxlen=RR_HISTORY_LENGTH)
+        self.peak_count = 0
+
+    @property
+    def threshold(self):
+        threshold = self._noise_level + 0.25 * (self._signal_level - self._noise_level)
+        return max(threshold, MIN_QRS_SLOPE ** 2)
+
+    @property
+    def heart_rate(self):
+        """
+        Heart rate in beats per minute over the most recent beats, or
+        ``None`` before the second beat.
+        """
+        if not self.rr_intervals:
+            return None
+        recent = list(self.rr_intervals)[-RR_AVERAGE_LENGTH:]
+        return 60 * len(recent) / sum(recent)
+
+    def _filter(self, samples):
+        if self._bandpass_state is None:
+            # Start the filter as if the first sample had always been
+            # there, to avoid a large step response.
+            self._bandpass_state = scipy.signal.sosfilt_zi(self._bandpass) * samples[0]
+        bandpassed, self._bandpass_state = scipy.signal.sosfilt(
+            self._bandpass, samples, zi=self._bandpass_state)
+        derivative, self._derivative_state = scipy.signal.lfilter(
+            self._derivative, 1, bandpassed, zi=self._derivative_state)
+        integrated, self._integrator_state = scipy.signal.lfilter(
+            self._integrator, 1, derivative ** 2, zi=self._integrator_state)
+        return bandpassed, integrated
+
+    def _find_r_peak(self, index):
+        """
+        Return the sample index of the R-peak belonging to the
+        integrated peak at sample ``index``.
+        """
+        start = max(index - self._window - self._history_start, 0)
+        end = index + 1 - self._history_start
+        return self._history_start + start + int(np.argmax(np.abs(self._history[start:end])))
+
+    def _add_peak(self, index, value, weight):
+        self._signal_level = weight * value + (1 - weight) * self._signal_level
+        r_peak = self._find_r_peak(index)
+        if self._last_peak is not None:
+            self.rr_intervals.append((r_peak - self._last_peak) / self.fs)
+        self._last_peak = r_peak
+        self._last_integrated_peak = index
+        self._last_integrated_value = value
+        self._searchback_peak = None
+        self.peak_count += 1
+        return r_peak
+
+    def _classify(self, index, value, r_peaks):
+        if self._last_peak is not None:
+            since_last = index - self._last_integrated_peak
+            if since_last < self._refractory:
+                return
+
+            # Search back for a beat missed since the last one.
+            if (self._searchback_peak is not None and
+                    len(self.rr_intervals) and
+                    since_last > 1.66 * self.fs * np.mean(
+                        list(self.rr_intervals)[-RR_AVERAGE_LENGTH:])):
+                searchback_index, searchback_value = self._searchback_peak
+                if searchback_value > 0.5 * self.threshold:
+                    r_peaks.append(self._add_peak(searchback_index, searchback_value, 0.25))
+
+        is_t_wave = (self._last_peak is not None and
+                     index - self._last_integrated_peak < self._t_wave_period and
+                     value < 0.5 * self._last_integrated_value)
+        if value > self.threshold and not is_t_wave:
+            r_peaks.append(self._add_peak(index, value, 0.125))
+        else:
+            self._noise_level = 0.125 * value + 0.875 * self._noise_level
+            if self._searchback_peak is None or value > self._searchback_peak[1]:
+                self._searchback_peak = (index, value)
+
+    def _learn(self, integrated, start, peaks, r_peaks):
+        """
+        Gather statistics for the initial thresholds.
+
+        Once a learning period is over, set the thresholds and classify
+        the peaks found during it. If nothing as large as a QRS complex
+        was seen (eg. the flat line sent while the shield starts up),
+        start another learning period instead.
+
+        :param integrated: Integrated samples from this update.
+        :param start: Sample index of ``integrated[0]``.
+        :param peaks: ``(index, value)`` of each peak found in this update.
+        """
+        peaks = deque(peaks)
+        position = 0
+        while self._signal_level is None and position < len(integrated):
+            end = min(len(integrated), self._learning_end - start)
+            self._learning_max = max(self._learning_max, integrated[position:end].max())
+            self._learning_sum += integrated[position:end].sum()
+            position = end
+
+            learning_start = self._learning_end - self._learning_length
+            while peaks and peaks[0][0] < start + end:
+                index, value = peaks.popleft()
+                if index >= learning_start:
+                    self._learning.append((index, value))
+            if start + end < self._learning_end:
+                break
+
+            if self._learning_max < MIN_QRS_SLOPE ** 2:
+                self._learning_end += self._learning_length
+            else:
+                self._signal_level = 0.25 * self._learning_max
+                self._noise_level = 0.5 * self._learning_sum / self._learning_length
+                for index, value in self._learning:
+                    self._classify(index, value, r_peaks)
+            self._learning = []
+            self._learning_max = 0
+            self._learning_sum = 0
+
+        # Peaks after the end of the learning period
+        for index, value in peaks:
+            self._classify(index, value, r_peaks)
+
+    def update(self, samples):
+        """
+        Process more samples and return the R-peaks found.
+
+        :param samples: 1-D array of samples from one channel or an
+                        ``(N, 6)`` array of samples from all channels.
+                        Samples must be evenly spaced and finite. Use
+                        ``fill_gaps='interpolate'`` on the reader if
+                        packets may be dropped.
+        :returns: Array of the times of newly detected R-peaks, in
+                  seconds since the first sample. A peak is reported
+                  a fraction of a second after it occurs.
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        if samples.ndim == 2:
+            samples = samples[:, self.channel]
+        if not len(samples):
+            return np.empty(0)
+
+        bandpassed, integrated = self._filter(samples)
+        start = self._sample_index
+        self._sample_index += len(samples)
+
+        # The R-peak search below may look back a whole window before
+        # the first sample of this update, so trimming waits until after.
+        self._history = np.concatenate((self._history, bandpassed))
+
+        # Local maxima of the integrated signal, including ones on the
+        # boundary with the previous update.
+        extended = np.concatenate((self._tail, integrated))
+        offset = start - len(self._tail)
+        is_peak = (extended[1:-1] > extended[:-2]) & (extended[1:-1] >= extended[2:])
+        peaks = np.flatnonzero(is_peak) + 1
+        self._tail = extended[-2:]
+
+        peaks = zip(peaks + offset, extended[peaks])
+        r_peaks = []
+        if self._signal_level is None:
+            self._learn(integrated, start, peaks, r_peaks)
+        else:
+            for index, value in peaks:
+                self._classify(index, value, r_peaks)
+
+        excess = len(self._history) - self._history_length
+        if excess > 0:
+            self._history = self._history[excess:]
+            self._history_start += excess
+        return np.array(r_peaks) / self.fs
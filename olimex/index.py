@@ -0,0 +1,199 @@
+"""
+This module defines a PacketIndex for seeking within recorded exg data.
+
+Finding packet boundaries in a recording means searching for SYNC0/SYNC1
+from the first byte. A :py:class:`PacketIndex` does that search once,
+records the byte offset of every packet and caches the result in a
+sidecar file next to the recording (eg. ``nsr.bin.idx.npz``). With the
+index, playback can start at any point in the recording.
+"""
+import mmap
+import os
+
+import numpy as np
+
+from olimex.constants import PACKET_SIZE, SAMPLE_FREQUENCY
+from olimex.utils import calculate_values_from_packets, classify_steps, find_packet_run
+
+INDEX_SUFFIX = '.idx.npz'
+INDEX_VERSION = 2
+
+
+class PacketIndex:
+    """
+    Byte offsets of every packet in a recording.
+
+    :ivar offsets: Byte offset of each packet in the recording.
+    :ivar resyncs: Indices of packets that do not directly follow the
+                   previous packet in the recording, ie. where sync was
+                   lost and found again.
+    :ivar gaps: Indices of packets whose counter does not follow on from
+                the previous packet, ie. where packets were dropped.
+    :ivar samples: Sample number of each packet, counting sample periods
+                   since the first packet with dropped packets included,
+                   as worked out from the packet counters.
+
+    For example::
+
+        index = PacketIndex.for_file('nsr.bin')
+        serial = FakeSerialFile('nsr.bin')
+        serial.seek(index.offset_at_time(47 * 60))
+    """
+    def __init__(self, offsets, resyncs, gaps, samples, source_size=None,
+                 source_mtime_ns=None):
+        self.offsets = offsets
+        self.resyncs = resyncs
+        self.gaps = gaps
+        self.samples = samples
+        self.source_size = source_size
+        self.source_mtime_ns = source_mtime_ns
+
+    def __repr__(self):
+        return '<PacketIndex {} packets>'.format(len(self))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def duration(self):
+        """
+        Length of the recording in seconds, dropped packets included.
+        """
+        if not len(self):
+            return 0
+        return (int(self.samples[-1]) + 1) / SAMPLE_FREQUENCY
+
+    @classmethod
+    def build(cls, buff):
+        """
+        Return a new index of the packets in ``buff``.
+
+        :param buff: Bytes-like object holding a recording.
+        """
+        runs = []
+        pos = 0
+        while True:
+            offset, num_packets = find_packet_run(buff, pos)
+            if not num_packets:
+                break
+            runs.append(np.arange(num_packets, dtype=np.int64) * PACKET_SIZE + offset)
+            pos = offset + num_packets * PACKET_SIZE
+
+        offsets = np.concatenate(runs) if runs else np.empty(0, dtype=np.int64)
+
+        resyncs = np.flatnonzero(np.diff(offsets) != PACKET_SIZE) + 1
+        if len(offsets) and offsets[0]:
+            resyncs = np.concatenate(([0], resyncs))
+
+        data = np.frombuffer(buff, dtype=np.uint8)
+        packets = data[offsets[:, np.newaxis] + np.arange(PACKET_SIZE)].tobytes()
+        del data  # release our export of buff
+        values, counts, _, _ = calculate_values_from_packets(packets)
+        gaps = np.flatnonzero(np.diff(counts) != 1) + 1
+        # Duplicates share the sample of the packet before them.
+        steps, _, _ = classify_steps(values, counts)
+        samples = np.cumsum(steps, dtype=np.int64) - 1
+
+        return cls(offsets, resyncs, gaps, samples)
+
+    @classmethod
+    def for_file(cls, path, rebuild=False):
+        """
+        Return the index for the recording at ``path``.
+
+        The cached sidecar index is used if it was built from the
+        recording as it is now. Otherwise the index is rebuilt and the
+        sidecar is rewritten.
+
+        :param path: Path to a recording.
+        :param rebuild: Ignore any cached index.
+        """
+        stat = os.stat(path)
+        index_path = path + INDEX_SUFFIX
+        if not rebuild:
+            try:
+                index = cls.load(index_path)
+            except (OSError, KeyError, ValueError):
+                index = None
+            if (index is not None and
+                    index.source_size == stat.st_size and
+                    index.source_mtime_ns == stat.st_mtime_ns):
+                return index
+
+        if stat.st_size:
+            with open(path, 'rb') as fd:
+                with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as buff:
+                    index = cls.build(buff)
+        else:
+            index = cls.build(b'')
+        index.source_size = stat.st_size
+        index.source_mtime_ns = stat.st_mtime_ns
+
+        try:
+            index.save(index_path)
+        except OSError:
+            # Read-only location (eg. installed mock data). The index
+            # still works, it just won't be cached.
+            pass
+        return index
+
+    @classmethod
+    def load(cls, path):
+        """
+        Return the index saved at ``path``.
+        """
+        with np.load(path) as fd:
+            if int(fd['version']) != INDEX_VERSION:
+                raise ValueError('Unsupported index version')
+            return cls(fd['offsets'], fd['resyncs'], fd['gaps'], fd['samples'],
+                       int(fd['source_size']), int(fd['source_mtime_ns']))
+
+    def save(self, path):
+        """
+        Save this index to ``path``.
+        """
+        # Write to a file object so numpy doesn't append its own suffix.
+        with open(path, 'wb') as fd:
+            np.savez(fd,
+                     version=INDEX_VERSION,
+                     offsets=self.offsets,
+                     resyncs=self.resyncs,
+                     gaps=self.gaps,
+                     samples=self.samples,
+                     source_size=self.source_size,
+                     source_mtime_ns=self.source_mtime_ns)
+
+    def read_packets(self, buff, start=0, stop=None):
+        """
+        Return packets ``start`` to ``stop`` of the recording, back to back.
+
+        :param buff: Bytes-like object holding the recording this index
+                     was built from.
+        :returns: :py:class:`bytes` that can be passed to
+                  :py:func:`~olimex.utils.calculate_values_from_packets`.
+        """
+        offsets = self.offsets[start:stop]
+        data = np.frombuffer(buff, dtype=np.uint8)
+        packets = data[offsets[:, np.newaxis] + np.arange(PACKET_SIZE)].tobytes()
+        del data  # release our export of buff
+        return packets
+
+    def packet_at_time(self, seconds):
+        """
+        Return the number of the packet recorded ``seconds`` into the recording.
+
+        Time is counted in samples from the packet counters, so dropped
+        packets don't shift it. If the packet of that time was dropped,
+        the next one recorded is returned. The result is clamped to the
+        packets in the recording.
+        """
+        packet = int(np.searchsorted(self.samples, int(seconds * SAMPLE_FREQUENCY)))
+        return min(max(packet, 0), len(self) - 1)
+
+    def offset_at_time(self, seconds):
+        """
+        Return the byte offset of the packet recorded ``seconds`` into the recording.
+        """
+        if not len(self):
+            return 0
+        return int(self.offsets[self.packet_at_time(seconds)])
@@ -0,0 +1,174 @@
+"""
+This module defines ReaderMetrics for watching the health of packet
+acquisition while it runs.
+
+Every :py:class:`~olimex.exg.PacketStreamReader` keeps its counters in
+a :py:class:`ReaderMetrics` as :py:attr:`~olimex.exg.PacketStreamReader.metrics`.
+Memory use is fixed however long the reader runs: rates are measured
+over a sliding window and read latencies are kept in a histogram of
+fixed buckets. For example::
+
+    reader = PacketStreamReader(serial.Serial(port, 115200))
+    ...
+    print(reader.metrics.snapshot())
+"""
+import bisect
+from collections import deque
+import time
+
+# Upper edges in seconds of the buckets of the read latency histogram:
+# 1us, 2us, 4us, ... 1.05s. Latencies above the last edge are counted
+# in an extra bucket.
+LATENCY_BUCKETS = tuple(2 ** exponent * 1e-6 for exponent in range(21))
+# Seconds over which packets_per_second is measured
+RATE_WINDOW = 10
+# Seconds between the samples of the packet count used for the rate
+RATE_SAMPLE_INTERVAL = 1
+
+
+class ReaderMetrics:
+    """
+    Counters and read latencies of a packet reader.
+
+    Counters are only updated by the thread reading packets but can be
+    read from any thread, eg. to show them in a GUI.
+
+    :param clock: Function returning the time in seconds. Tests can pass
+                  a fake clock.
+    :ivar packets: Number of packets read.
+    :ivar bytes_read: Number of bytes read from the serial port.
+    :ivar bytes_discarded: Number of bytes skipped while looking for
+                           the start of a packet.
+    :ivar reads: Number of times the serial port was polled.
+    :ivar empty_polls: Number of times packets were asked for and none
+                       had arrived, eg. while the port is starved.
+    :ivar dropped: Packets missing according to the packet counter.
+    :ivar duplicates: Packets identical to the one before.
+    :ivar counter_errors: Packets with an unbelievable counter.
+    :ivar resyncs: Times bytes had to be skipped to find the next packet
+                   after the first one.
+    """
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self.reset()
+
+    def __repr__(self):
+        return '<ReaderMetrics {} packets, {} bytes>'.format(self.packets, self.bytes_read)
+
+    def reset(self):
+        """
+        Set every counter back to zero.
+        """
+        self.start_time = self._clock()
+        self.packets = 0
+        self.bytes_read = 0
+        self.bytes_discarded = 0
+        self.reads = 0
+        self.empty_polls = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.counter_errors = 0
+        self.resyncs = 0
+        self.read_latency_total = 0.0
+        self.read_latency_max = 0.0
+        self.read_latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        # (time, packets) pairs, oldest first
+        self._rate_samples = deque([(self.start_time, 0)],
+                                   maxlen=RATE_WINDOW // RATE_SAMPLE_INTERVAL + 1)
+
+    def record_read(self, num_bytes, latency):
+        """
+        Count one poll of the serial port.
+
+        :param num_bytes: Number of bytes read, 0 if none were waiting.
+        :param latency: Seconds the poll took.
+        """
+        self.reads += 1
+        self.bytes_read += num_bytes
+        self.read_latency_total += latency
+        if latency > self.read_latency_max:
+            self.read_latency_max = latency
+        self.read_latency_counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self._sample_rate()
+
+    def record_empty_poll(self):
+        """
+        Count a request for packets that found none.
+
+        Polls that only end the draining of the port don't count, so
+        this stays at zero while packets keep arriving.
+        """
+        self.empty_polls += 1
+        self._sample_rate()
+
+    def _sample_rate(self):
+        now = self._clock()
+        if now - self._rate_samples[-1][0] >= RATE_SAMPLE_INTERVAL:
+            self._rate_samples.append((now, self.packets))
+
+    @property
+    def elapsed(self):
+        """
+        Seconds since the metrics were created or reset.
+        """
+        return self._clock() - self.start_time
+
+    @property
+    def packets_per_second(self):
+        """
+        Packets read per second over the last :py:data:`RATE_WINDOW`
+        seconds or so.
+        """
+        then, packets = self._rate_samples[0]
+        elapsed = self._clock() - then
+        if elapsed <= 0:
+            return 0.0
+        return (self.packets - packets) / elapsed
+
+    def read_latency_percentile(self, percentile):
+        """
+        Return an upper bound of a percentile of the read latency.
+
+        :param percentile: Percentile between 0 and 100.
+        :returns: Upper edge in seconds of the histogram bucket holding
+                  the percentile, the longest latency seen if it falls
+                  in the last bucket, or ``None`` before any read.
+        """
+        if not self.reads:
+            return None
+        rank = percentile / 100 * self.reads
+        seen = 0
+        for bucket, count in enumerate(self.read_latency_counts):
+            seen += count
+            if count and seen >= rank:
+                break
+        if bucket < len(LATENCY_BUCKETS):
+            return min(LATENCY_BUCKETS[bucket], self.read_latency_max)
+        return self.read_latency_max
+
+    def snapshot(self):
+        """
+        Return the current metrics as a dictionary of plain numbers,
+        ready to log or serialise as JSON.
+        """
+        return {
+            'elapsed': self.elapsed,
+            'packets': self.packets,
+            'packets_per_second': self.packets_per_second,
+            'bytes_read': self.bytes_read,
+            'bytes_discarded': self.bytes_discarded,
+            'reads': self.reads,
+            'empty_polls': self.empty_polls,
+            'dropped': self.dropped,
+            'duplicates': self.duplicates,
+            'counter_errors': self.counter_errors,
+            'resyncs': self.resyncs,
+            'read_latency_mean': self.read_latency_total / self.reads if self.reads else None,
+            'read_latency_p50': self.read_latency_percentile(50),
+            'read_latency_p99': self.read_latency_percentile(99),
+            'read_latency_max': self.read_latency_max,
+            'read_latency_histogram': {
+                'buckets': list(LATENCY_BUCKETS),
+                'counts': list(self.read_latency_counts),
+            },
+        }
@@ -1,18 +1,44 @@
 """
 This module defines several functions and classes for mocking a
 serial port receiving Olimex-EKG-EMG (aka. EXG) packets.
+
+:py:func:`synthetic_stream` generates ECG- or EMG-like packet streams
+with array operations, fast enough to stress the readers well beyond
+the rate of a real shield, and can inject the faults seen on real
+serial lines.
 """
+import mmap
 import random
 import threading
 import time
 
-from olimex.constants import PACKET_SIZE, SYNC0, SYNC1, SAMPLE_FREQUENCY
+import numpy as np
+
+from olimex.constants import NUMCHANNELS, PACKET_SIZE, SYNC0, SYNC1, SAMPLE_FREQUENCY
+from olimex.utils import SYNC, encode_packets
+
+# Waves of one heartbeat: (centre relative to the R-peak in seconds,
+# width in seconds, amplitude relative to the R wave). The T wave
+# moves with the RR interval, see synthetic_ecg().
+ECG_WAVES = (
+    ('P', -0.2, 0.025, 0.15),
+    ('Q', -0.03, 0.01, -0.15),
+    ('R', 0, 0.012, 1),
+    ('S', 0.03, 0.01, -0.25),
+    ('T', 0.3, 0.05, 0.3),
+)
+# Relative amplitude of each channel, as from different leads
+CHANNEL_SCALES = np.array([1, 0.8, 0.6, 0.45, 0.3, 0.2])
+BASELINE = 512
+# Length of a contraction as a fraction of the time between
+# contractions, see synthetic_emg()
+EMG_DUTY_CYCLE = 0.5
 
 
 def packet_data_generator():
     # uint16_t   data[6];  // 10-bit sample (= 0 - 1023) in big endian (Motorola) format.
     while True:
-        byte_array = bytearray(random.randint(0, 255) for _ in range(12))
+        byte_array = bytearray(random.getrandbits(96).to_bytes(12, 'big'))
         yield byte_array
 
 
@@ -25,33 +51,177 @@ def packet_generator():
     count = 0
     data_value_gen = packet_data_generator()
     while True:
-        byte_array = bytearray((SYNC0, SYNC1, 2, count % 256))  # header bytes
+        byte_array = bytearray(SYNC0 + SYNC1)  # sync bytes
+        byte_array.extend((2, count % 256))  # version and count bytes
         byte_array.extend(next(data_value_gen))  # data bytes
         byte_array.extend((1,))  # switches byte
         yield byte_array
         count += 1
 
 
+def synthetic_ecg(num_samples, heart_rate=72, amplitude=300, noise=2, start=0,
+                  fs=SAMPLE_FREQUENCY, random_state=None):
+    """
+    Return ECG-like values for all channels.
+
+    Each beat is a sum of Gaussian P, Q, R, S and T waves. Channels are
+    scaled copies of the same beats with their own noise.
+
+    :param num_samples: Number of samples to return.
+    :param heart_rate: Beats per minute.
+    :param amplitude: Height of the R wave of channel 1 in ADC counts.
+    :param noise: Standard deviation of the noise in ADC counts.
+    :param start: Sample number of the first sample, so that successive
+                  calls continue the same signal.
+    :param random_state: :py:class:`numpy.random.RandomState` for the noise.
+    :returns: ``(num_samples, 6)`` integer array of values between 1 and
+              1024, as decoded from packets.
+    """
+    random_state = np.random.RandomState() if random_state is None else random_state
+    rr_interval = 60 / heart_rate
+    t = (start + np.arange(num_samples)) / fs
+    # Time since the last R-peak, and to the next one
+    since = t % rr_interval
+    waveform = np.zeros(num_samples)
+    for name, centre, width, height in ECG_WAVES:
+        if name == 'T':
+            # Bazett: the QT interval goes with the square root of RR.
+            centre *= np.sqrt(rr_interval)
+        for offset in (since, since - rr_interval):
+            waveform += height * np.exp(-((offset - centre) / width) ** 2 / 2)
+    return _to_values(amplitude * np.outer(waveform, CHANNEL_SCALES), noise, random_state)
+
+
+def synthetic_emg(num_samples, contraction_rate=30, amplitude=150, noise=2, start=0,
+                  fs=SAMPLE_FREQUENCY, random_state=None):
+    """
+    Return EMG-like values for all channels.
+
+    Bursts of band-limited noise, one per contraction, with each
+    channel having its own noise.
+
+    :param contraction_rate: Contractions per minute.
+    :param amplitude: Standard deviation of channel 1 during a
+                      contraction in ADC counts.
+
+    See :py:func:`synthetic_ecg` for the other arguments.
+    """
+    random_state = np.random.RandomState() if random_state is None else random_state
+    period = 60 / contraction_rate
+    t = (start + np.arange(num_samples)) / fs
+    phase = (t % period) / (period * EMG_DUTY_CYCLE)
+    envelope = np.where(phase < 1, np.sin(np.pi * np.minimum(phase, 1)) ** 2, 0)
+    # Differencing white noise takes out the low frequencies, as muscle
+    # activity has little power below about 20 Hz.
+    white = random_state.normal(0, 1, (num_samples + 1, NUMCHANNELS))
+    bursts = np.diff(white, axis=0) / np.sqrt(2)
+    signal = amplitude * envelope[:, np.newaxis] * bursts * CHANNEL_SCALES
+    return _to_values(signal, noise, random_state)
+
+
+def _to_values(signal, noise, random_state):
+    if noise:
+        signal = signal + random_state.normal(0, noise, signal.shape)
+    return np.clip(np.rint(signal + BASELINE), 1, 1024).astype(np.int32)
+
+
+def synthetic_stream(num_packets, kind='ecg', drop_rate=0, corrupt_rate=0,
+                     false_sync_rate=0, start=0, seed=None, **kwargs):
+    """
+    Return a synthetic stream of packets as sent by the shield.
+
+    For example, a day of ECG at 60 bpm with a packet in a thousand
+    dropped::
+
+        stream = synthetic_stream(24 * 3600 * SAMPLE_FREQUENCY,
+                                  heart_rate=60, drop_rate=0.001)
+        reader = PacketStreamReader(FakeSerialByteArray(stream))
+
+    :param num_packets: Number of packets generated, before any are
+                        dropped.
+    :param kind: ``'ecg'`` or ``'emg'``.
+    :param drop_rate: Fraction of packets left out.
+    :param corrupt_rate: Fraction of bytes overwritten with random values.
+    :param false_sync_rate: Fraction of packets followed by a false
+                            SYNC0/SYNC1 pair and a few random bytes.
+    :param start: Sample number of the first packet, so that successive
+                  calls continue the same stream.
+    :param seed: Seed for the signal noise and the faults.
+    :param kwargs: Passed on to :py:func:`synthetic_ecg` or
+                   :py:func:`synthetic_emg`.
+    :rtype: bytes
+    """
+    generators = {'ecg': synthetic_ecg, 'emg': synthetic_emg}
+    if kind not in generators:
+        raise ValueError('kind must be one of {}'.format(sorted(generators)))
+    random_state = np.random.RandomState(seed)
+    values = generators[kind](num_packets, start=start, random_state=random_state, **kwargs)
+    counts = np.arange(start, start + num_packets)
+
+    if drop_rate:
+        kept = random_state.random_sample(num_packets) >= drop_rate
+        values, counts = values[kept], counts[kept]
+
+    packets = np.frombuffer(encode_packets(values, counts), dtype=np.uint8)
+    packets = packets.reshape(-1, PACKET_SIZE)
+
+    if false_sync_rate:
+        # A false sync is SYNC0/SYNC1 followed by less than a packet of
+        # random bytes, inserted after a packet.
+        noisy = np.flatnonzero(random_state.random_sample(len(packets)) < false_sync_rate)
+        noise_lengths = random_state.randint(0, PACKET_SIZE - len(SYNC), len(noisy))
+        row_lengths = np.full(len(packets), PACKET_SIZE)
+        row_lengths[noisy] += len(SYNC) + noise_lengths
+        row_starts = np.concatenate(([0], np.cumsum(row_lengths)[:-1]))
+        data = np.empty(row_lengths.sum(), dtype=np.uint8)
+        data[row_starts[:, np.newaxis] + np.arange(PACKET_SIZE)] = packets
+        noise_starts = row_starts[noisy] + PACKET_SIZE
+        data[noise_starts] = SYNC[0]
+        data[noise_starts + 1] = SYNC[1]
+        for noise_start, noise_length in zip(noise_starts + len(SYNC), noise_lengths):
+            data[noise_start:noise_start + noise_length] = random_state.randint(
+                0, 256, noise_length)
+    else:
+        data = packets.ravel()
+
+    if corrupt_rate:
+        data = data.copy()
+        positions = random_state.randint(0, len(data), int(len(data) * corrupt_rate))
+        data[positions] = random_state.randint(0, 256, len(positions))
+    return data.tobytes()
+
+
+def synthetic_chunks(chunk_packets=SAMPLE_FREQUENCY, seed=None, **kwargs):
+    """
+    Generate an endless synthetic stream in chunks.
+
+    :param chunk_packets: Number of packets generated per chunk.
+    :param kwargs: Passed on to :py:func:`synthetic_stream`.
+    """
+    seed_sequence = np.random.RandomState(seed)
+    start = 0
+    while True:
+        yield synthetic_stream(chunk_packets, start=start,
+                               seed=seed_sequence.randint(2 ** 31), **kwargs)
+        start += chunk_packets
+
+
 class FakeSerialByteArray(object):
     """
     A class for mocking a serial.Serial object with data from a bytearray.
+
+    Bytes are handed out a packet's worth per poll, as fast as they are
+    asked for. Use :py:class:`ReplaySerial` to play data back in real
+    time.
     """
     def __init__(self, byte_array, *args, **kwargs):
         self._buffer = byte_array
         self._pos = 0
-        self._call_count = 0
 
     def __repr__(self):
         return '<FakeSerialByteArray {}>'.format(id(self))
 
     def inWaiting(self):
-        self._call_count += 1
-        # A random number I chose that
-        # made the graph move at an acceptable
-        # speed.
-        if not self._call_count % 24:
-            raise StopIteration
-
         left_in_buffer = len(self._buffer) - self._pos
         if left_in_buffer < PACKET_SIZE:
             return left_in_buffer
@@ -67,6 +237,183 @@ class FakeSerialByteArray(object):
         self._pos = new_pos
         return ret_val
 
+    def seek(self, pos):
+        """
+        Move to byte ``pos`` of the buffer.
+        """
+        self._pos = min(max(pos, 0), len(self._buffer))
+
     def close(self):
         pass
 
+
+class FakeSerialFile(FakeSerialByteArray):
+    """
+    A class for mocking a serial.Serial object with data from a file.
+
+    The file is memory-mapped rather than read into memory, so opening
+    a recording is instant and only the pages being played back are
+    resident, no matter how long the recording is.
+    """
+    def __init__(self, path, *args, **kwargs):
+        self._fd = open(path, 'rb')
+        try:
+            byte_array = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped.
+            byte_array = b''
+        super().__init__(byte_array, *args, **kwargs)
+        self.name = path
+
+    def __repr__(self):
+        return '<FakeSerialFile {}>'.format(self.name)
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._fd.close()
+
+
+class ReplaySerial(object):
+    """
+    A serial.Serial stand-in that replays a recording in real time.
+
+    Bytes are released on a monotonic clock at the rate the shield sends
+    them (:py:data:`BYTES_PER_SECOND`), or any multiple of it, however
+    often the port is polled. For example::
+
+        serial_obj = ReplaySerial('nsr.bin', speed=2)
+        reader = PacketStreamReader(serial_obj)
+
+    :param source: Path to a recording, or a bytes-like object holding one.
+    :param speed: Multiple of real time at which to replay, or ``None``
+                  or 0 to release everything at once.
+    :param timeout: As for serial.Serial: seconds :py:meth:`read` waits
+                    for the bytes asked for, ``None`` to wait for all of
+                    them or 0 not to wait.
+    :param clock: Function returning the time in seconds. Tests can
+                  pass a fake clock to replay deterministically.
+    """
+    BYTES_PER_SECOND = SAMPLE_FREQUENCY * PACKET_SIZE
+
+    def __init__(self, source, speed=1, timeout=None, clock=time.monotonic):
+        self._fd = None
+        self.name = None
+        if isinstance(source, str):
+            self.name = source
+            self._fd = open(source, 'rb')
+            try:
+                source = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped.
+                source = b''
+        self._buffer = source
+        self._pos = 0
+        self._speed = speed or None
+        self._paused = False
+        self.timeout = timeout
+        self._clock = clock
+        # Bytes up to _anchor_pos were released at _anchor_time. Bytes
+        # after it are released at speed * BYTES_PER_SECOND since then.
+        self._anchor_pos = 0
+        self._anchor_time = clock()
+
+    def __repr__(self):
+        return '<ReplaySerial {} speed={}>'.format(self.name or id(self), self._speed)
+
+    def _released(self):
+        """
+        Return the position up to which bytes have been released.
+        """
+        if self._speed is None:
+            return len(self._buffer)
+        if self._paused:
+            return self._anchor_pos
+        elapsed = self._clock() - self._anchor_time
+        released = self._anchor_pos + int(elapsed * self._speed * self.BYTES_PER_SECOND)
+        return min(released, len(self._buffer))
+
+    def _reanchor(self, pos):
+        self._anchor_pos = pos
+        self._anchor_time = self._clock()
+
+    @property
+    def speed(self):
+        return self._speed
+
+    @speed.setter
+    def speed(self, speed):
+        self._reanchor(self._released())
+        self._speed = speed or None
+
+    @property
+    def paused(self):
+        return self._paused
+
+    def pause(self):
+        """
+        Stop releasing bytes until :py:meth:`resume` is called.
+        """
+        if not self._paused:
+            self._reanchor(self._released())
+            self._paused = True
+
+    def resume(self):
+        if self._paused:
+            self._reanchor(self._anchor_pos)
+            self._paused = False
+
+    @property
+    def at_end(self):
+        """
+        ``True`` once every byte of the recording has been read.
+        """
+        return self._pos >= len(self._buffer)
+
+    def inWaiting(self):
+        return max(self._released() - self._pos, 0)
+
+    @property
+    def in_waiting(self):
+        return self.inWaiting()
+
+    def read(self, n=1):
+        """
+        Return up to ``n`` bytes, waiting for them as set by ``timeout``.
+
+        Fewer bytes are returned at the end of the recording, and while
+        paused once the timeout expires.
+        """
+        if self.timeout:
+            deadline = self._clock() + self.timeout
+        while True:
+            available = self.inWaiting()
+            if (available >= n or self._released() >= len(self._buffer) or
+                    self.timeout == 0 or
+                    (self.timeout is not None and self._clock() >= deadline)):
+                break
+            if self._paused:
+                wait = 0.01
+            else:
+                wait = (n - available) / (self._speed * self.BYTES_PER_SECOND)
+            if self.timeout is not None:
+                wait = min(wait, max(deadline - self._clock(), 0))
+            time.sleep(wait)
+
+        end = self._pos + min(n, available)
+        ret_val = bytes(self._buffer[self._pos:end])
+        self._pos = end
+        return ret_val
+
+    def seek(self, pos):
+        """
+        Continue replaying from byte ``pos`` of the recording.
+        """
+        self._pos = min(max(pos, 0), len(self._buffer))
+        self._reanchor(self._pos)
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        if self._fd is not None:
+            self._fd.close()
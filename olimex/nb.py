@@ -2,12 +2,17 @@ import os
 
 from bokeh.client import push_session
 from bokeh.io import curdoc
+from bokeh.layouts import column
+from bokeh.models import ColumnDataSource, DataRange1d, LinearColorMapper
 from bokeh.plotting import figure
 import numpy as np
-from olimex.mock import FakeSerialByteArray
+from olimex.acquisition import BackgroundReader
+from olimex.mock import ReplaySerial
 from olimex.exg import PacketStreamReader
+from olimex.index import PacketIndex
+from olimex.ports import AUTO_PORT, find_shields
+from olimex.spectral import SPECTROGRAM_RANGE, SpectralEstimator, SpectrogramBuffer
 from olimex.utils import get_mock_data_list
-import scipy.ndimage
 import serial
 
 from olimex.constants import DEFAULT_BAUDRATE, SAMPLE_FREQUENCY
@@ -25,11 +30,21 @@ SAMPLES_PER_004_SECOND = int(5)
 REFRESHES_PER_SECOND = 25
 REFRESH_INTERVAL_MS = 1000 / REFRESHES_PER_SECOND
 DOTS_TO_JUMP_PER_REFRESH = DOTS_PER_SECOND / REFRESHES_PER_SECOND
+# Most packets read per refresh: two strip lengths. Files played back
+# as fast as possible are read a bit at a time rather than at once.
+MAX_PACKETS_PER_REFRESH = 2 * STRIP_LENGTH_SECONDS * SAMPLE_FREQUENCY
 
 INITIAL_VOLTAGE = DOTS_PER_STRIP_HEIGHT / 2
 
+# Number of samples kept in the browser. Older samples roll off
+# the start of the strip as new ones are streamed in.
+STRIP_SAMPLES = 512
 
-def get_new_data_points(packet_reader):
+# Number of spectra along the spectrogram
+SPECTROGRAM_LENGTH = 60
+
+
+def get_new_data_points(packet_reader, max_packets=MAX_PACKETS_PER_REFRESH):
     """
     Return all data points in the buffer waiting to be displayed.
 
@@ -37,78 +52,165 @@ def get_new_data_points(packet_reader):
     read into a waiting buffer where they are held before
     they are displayed during the next refresh. The packet
     reader is responsible for managing that buffer.
+
+    :param packet_reader: A :py:class:`~olimex.exg.PacketStreamReader`
+                          or :py:class:`~olimex.acquisition.BackgroundReader`.
+    :param max_packets: Most packets returned at a time.
     """
     while True:
-        new_data = []
-        while True:
-            try:
-                channel_values = next(packet_reader)
-            except StopIteration:
-                break
-
-            if channel_values:
-                channel_1, *_ = channel_values
-                new_data.append(channel_1)
-
-        new_data = scipy.ndimage.zoom(
-            new_data,
-            DOTS_PER_SECOND / SAMPLE_FREQUENCY,
-            order=0
-        )
-        yield new_data
-
-
-def exg(source):
+        values, *_ = packet_reader.read_chunk(max_packets)
+        yield values
+
+
+def spectrogram_figure(estimator, length=SPECTROGRAM_LENGTH):
+    """
+    Return a figure showing a spectrogram of channel 1.
+
+    :param estimator: Estimator whose spectra are shown.
+    :type estimator: :py:class:`~olimex.spectral.SpectralEstimator`
+    :param length: Number of spectra along the spectrogram.
+    :returns: A tuple of the figure, the
+              :py:class:`~olimex.spectral.SpectrogramBuffer` and the
+              data source of the image.
+    """
+    spectrogram = SpectrogramBuffer(len(estimator.frequencies), length)
+    max_frequency = estimator.frequencies[-1]
+    p = figure(
+        x_range=(0, length),
+        y_range=(0, max_frequency),
+        plot_width=1024,
+        plot_height=200,
+        tools='save',
+        toolbar_location='below',
+        y_axis_label='Hz',
+    )
+    p.xaxis.visible = False
+    color_mapper = LinearColorMapper(palette='Viridis256', low=-SPECTROGRAM_RANGE, high=0)
+    ds = ColumnDataSource(data={'image': [spectrogram.image.copy()]})
+    p.image(image='image', x=0, y=0, dw=length, dh=max_frequency, source=ds,
+            color_mapper=color_mapper)
+    return p, spectrogram, ds
+
+
+def exg(source, start=0, background=False, num_channels=1, filter_bank=None,
+        spectrogram=False, speed=1, tracer=None):
+    """
+    Show a real-time exg figure in a browser through a Bokeh server.
+
+    :param source: Serial port, ``'auto'`` for the first shield found,
+                   or name of a mock data file.
+
+    :param tracer: Tracer of the latency from the serial port to the
+                   browser, or ``None``. The ``render`` stage ends once
+                   the update has been queued for the browser.
+    :type tracer: :py:class:`~olimex.tracing.LatencyTracer`
+    """
+    index = None
     if source.endswith('.bin'):
         data_dir, data_list = get_mock_data_list()
         source = os.path.join(data_dir, source)
-        print('Loading data...', end='', flush=True)
-        with open(source, 'rb') as fd:
-            buff = bytearray(fd.read())
-        serial_obj = FakeSerialByteArray(buff)
-        print('Done.', flush=True)
+        serial_obj = ReplaySerial(source, speed=speed)
+        index = PacketIndex.for_file(source)
 
     else:
+        if source == AUTO_PORT:
+            shields = find_shields()
+            if not shields:
+                raise ValueError('No shield found')
+            source = shields[0]
         serial_obj = serial.Serial(source, baudrate=DEFAULT_BAUDRATE)
 
     reader = PacketStreamReader(serial_obj)
-    new_data_gen = get_new_data_points(reader)
+    packet_reader = reader
+    if background:
+        packet_reader = BackgroundReader(reader)
+    # Seeks go through the background reader, if any, so that the
+    # reader is only used by one thread.
+    if index is not None and start:
+        packet_reader.seek(index.offset_at_time(start))
+    if background:
+        packet_reader.start()
+    new_data_gen = get_new_data_points(packet_reader)
 
     p = figure(
-        x_range=(0, 1024),
-        y_range=(0, 1024),
+        x_range=DataRange1d(follow='end', follow_interval=STRIP_SAMPLES, range_padding=0),
+        y_range=(0, 1024 * num_channels),
         plot_width=1024,
-        plot_height=400,
+        plot_height=400 * num_channels,
         tools='save',
         toolbar_location='below',
     )
     p.axis.visible = False
     p.xgrid.visible = False
 
-    line = p.line(
-        x=tuple(range(1024)), 
-        y=tuple(512 for _ in range(1024))
-    )
-
-    ds = line.data_source
+    # All channels live in one data source and are updated by one
+    # stream call. Channel 1 is at the top, each channel below it is
+    # offset down by one strip height.
+    offsets = 1024 * np.arange(num_channels - 1, -1, -1)
+    columns = ['y{}'.format(channel) for channel in range(num_channels)]
+    initial = {'x': np.arange(STRIP_SAMPLES)}
+    for column, offset in zip(columns, offsets):
+        initial[column] = np.full(STRIP_SAMPLES, 512 + offset)
+    ds = ColumnDataSource(data=initial)
+    for column in columns:
+        p.line(x='x', y=column, source=ds)
+
+    layout = p
+    estimator = None
+    if spectrogram:
+        estimator = SpectralEstimator()
+        spectrogram_plot, spectrogram_buffer, spectrogram_ds = spectrogram_figure(estimator)
+        layout = column(p, spectrogram_plot)
+
+    # x of the next sample to be streamed
+    sample_index = STRIP_SAMPLES
 
     def update():
+        nonlocal sample_index
         data = next(new_data_gen)
-
-        new_y = tuple(ds.data['y']) + tuple(data)
-        new_y = new_y[-1024:]
-
-        new_x = tuple(range(len(new_y)))
-
-        ds.data.update(x=new_x, y=new_y)
+        if not len(data):
+            return
+        if tracer is not None:
+            tracer.begin(packet_reader.last_arrival)
+            tracer.stamp('decode')
+
+        if filter_bank is not None:
+            data = filter_bank.filter(data)
+            if filter_bank.highpass:
+                # Put the signal back in the middle of the strip.
+                data += 512
+
+        # Only the new samples are sent to the browser.
+        new_data = {'x': np.arange(sample_index, sample_index + len(data))}
+        sample_index += len(data)
+        stacked = data[:, :num_channels] + offsets
+        for channel, column in enumerate(columns):
+            new_data[column] = stacked[:, channel]
+        ds.stream(new_data, rollover=STRIP_SAMPLES)
+
+        # The image is only sent when a new spectrum is ready,
+        # about once a second.
+        if estimator is not None:
+            spectra = estimator.update(data)
+            if len(spectra):
+                spectrogram_buffer.write(spectra)
+                spectrogram_ds.data.update(image=[spectrogram_buffer.image.copy()])
+                spectrogram_plot.title.text = 'median {:.1f} Hz'.format(
+                    estimator.median_frequency[0])
+        if tracer is not None:
+            tracer.stamp('process')
+            # Changes are sent to the browser when the callback returns.
+            tracer.stamp('render')
 
     curdoc().add_periodic_callback(update, 30)
 
     # open a session to keep our local document in sync with server
     session = push_session(curdoc())
-    session.show(p) # open the document in a browser
+    session.show(layout) # open the document in a browser
     try:
         session.loop_until_closed() # run forever
     finally:
+        if background:
+            packet_reader.stop()
         serial_obj.close()
 
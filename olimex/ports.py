@@ -0,0 +1,219 @@
+"""
+This module defines functions for finding the serial ports Olimex-EKG-EMG
+shields are connected to.
+
+Candidate ports are listed with :py:mod:`serial.tools.list_ports`,
+which asks the operating system for its serial devices rather than
+opening every ``/dev/tty*``. Each candidate is then probed on its own
+thread: it is opened with a short timeout and only counts as a shield
+once a few valid version 2 packets have been read from it.
+
+Shields found are cached, along with the hardware ID of their port, so
+the next call only probes the other ports, as long as the same device
+is still plugged into the same port. For example::
+
+    port = find_shields()[0]
+    reader = PacketStreamReader(serial.Serial(port, DEFAULT_BAUDRATE))
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import time
+
+import numpy as np
+import serial
+from serial.tools import list_ports
+
+from olimex.constants import DEFAULT_BAUDRATE, PACKET_SIZE
+from olimex.utils import PACKET_DTYPE, find_packet_run
+
+# Port name asking the GUI and notebook to use the first shield found
+AUTO_PORT = 'auto'
+# Seconds a port is listened to for packets
+PROBE_TIMEOUT = 0.5
+# Number of back-to-back packets that confirm a shield
+PROBE_PACKETS = 3
+PACKET_VERSION = 2
+# Bytes of noise kept while probing. Anything older can't be part of
+# the packets looked for.
+MAX_PROBE_BYTES = 4096
+# Seconds for which a cached shield is trusted without probing it
+CACHE_MAX_AGE = 24 * 60 * 60
+DEFAULT_CACHE_PATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+    'olimex', 'ports.json')
+
+
+def candidate_ports():
+    """
+    Return the serial ports of the system, without opening any of them.
+
+    :returns: A dictionary of device name to hardware ID, eg.
+              ``{'/dev/ttyACM0': 'USB VID:PID=2341:0043 SER=...'}``.
+    """
+    return {port.device: port.hwid for port in list_ports.comports()}
+
+
+def is_shield_stream(buff, num_packets=PROBE_PACKETS):
+    """
+    Return whether ``buff`` holds ``num_packets`` back-to-back packets
+    of version :py:data:`PACKET_VERSION`.
+    """
+    pos = 0
+    while True:
+        offset, run_length = find_packet_run(buff, pos, num_packets)
+        if offset < 0:
+            return False
+        if run_length == num_packets:
+            packets = np.frombuffer(bytes(buff[offset:offset + num_packets * PACKET_SIZE]),
+                                    dtype=PACKET_DTYPE)
+            if (packets['version'] == PACKET_VERSION).all():
+                return True
+        pos = offset + 1
+
+
+def probe_port(port, timeout=PROBE_TIMEOUT, num_packets=PROBE_PACKETS,
+               baudrate=DEFAULT_BAUDRATE):
+    """
+    Return whether a shield is sending packets on ``port``.
+
+    DTR is left low when opening the port so that an Arduino isn't
+    reset, which would keep it quiet for longer than the timeout.
+
+    :param timeout: Seconds to listen for packets.
+    :param num_packets: Number of back-to-back packets that confirm a
+                        shield.
+    """
+    serial_obj = serial.Serial()
+    serial_obj.port = port
+    serial_obj.baudrate = baudrate
+    serial_obj.timeout = min(timeout, 0.05)
+    serial_obj.dtr = False
+    try:
+        serial_obj.open()
+    except (OSError, ValueError, serial.SerialException):
+        return False
+
+    buff = bytearray()
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            buff.extend(serial_obj.read(max(serial_obj.in_waiting, 1)))
+            if is_shield_stream(buff, num_packets):
+                return True
+            del buff[:-MAX_PROBE_BYTES]
+    except (OSError, serial.SerialException):
+        return False
+    finally:
+        serial_obj.close()
+    return False
+
+
+def load_cache(path=DEFAULT_CACHE_PATH):
+    """
+    Return the shields cached at ``path``, or an empty dictionary.
+    """
+    try:
+        with open(path) as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(shields, path=DEFAULT_CACHE_PATH):
+    """
+    Cache ``shields``, a dictionary of port to hardware ID.
+
+    Failing to write the cache isn't an error; the next search just
+    probes again.
+    """
+    cache = {'time': time.time(), 'shields': shields}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fd:
+            json.dump(cache, fd)
+    except OSError:
+        pass
+
+
+def _cached_shields(ports, cache_path, max_age):
+    """
+    Return the cached shields still plugged into the same ports.
+    """
+    cache = load_cache(cache_path)
+    if not cache or time.time() - cache.get('time', 0) > max_age:
+        return []
+    # Ports without a hardware ID must at least still exist.
+    return [port for port, hwid in cache.get('shields', {}).items()
+            if port in ports and ports[port] == hwid and
+            (hwid is not None or os.path.exists(port))]
+
+
+def find_shields(ports=None, timeout=PROBE_TIMEOUT, use_cache=True,
+                 cache_path=DEFAULT_CACHE_PATH, max_age=CACHE_MAX_AGE):
+    """
+    Return the ports shields are sending packets on.
+
+    :param ports: Ports to search. Defaults to the
+                  :py:func:`candidate_ports` of the system.
+    :param timeout: Seconds to listen to each port. Ports are probed in
+                    parallel, so this bounds the whole search.
+    :param use_cache: Don't probe the shields found by earlier searches,
+                      if they are still plugged into the same ports. The
+                      other ports are probed, and shields found are
+                      added to the cache either way.
+    :param max_age: Seconds after which the cache is ignored.
+    :rtype: list
+    """
+    candidates = candidate_ports()
+    if ports is None:
+        ports = candidates
+    else:
+        # Ports the system doesn't list, eg. pseudo-terminals, have no
+        # hardware ID.
+        ports = {port: candidates.get(port) for port in ports}
+
+    cached = _cached_shields(ports, cache_path, max_age) if use_cache else []
+    names = sorted(port for port in ports if port not in cached)
+    found = []
+    if names:
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            found = list(executor.map(lambda port: probe_port(port, timeout), names))
+    probed = [port for port, is_shield in zip(names, found) if is_shield]
+
+    # Shields cached for ports that weren't searched are kept.
+    cache = load_cache(cache_path)
+    known = {}
+    if time.time() - cache.get('time', 0) <= max_age:
+        known = {port: hwid for port, hwid in cache.get('shields', {}).items()
+                 if port not in names}
+    known.update((port, ports[port]) for port in probed)
+    save_cache(known, cache_path)
+    return sorted(cached + probed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find Olimex-EKG-EMG shields.')
+    parser.add_argument('ports',
+                        nargs='*',
+                        help='Ports to probe. Defaults to every serial port.')
+    parser.add_argument('--timeout',
+                        dest='timeout',
+                        type=float,
+                        default=PROBE_TIMEOUT,
+                        help='Seconds to listen to each port.')
+    parser.add_argument('--no-cache',
+                        action='store_false',
+                        default=True,
+                        dest='use_cache',
+                        help='Probe the ports even if shields were found before.')
+    args = parser.parse_args()
+
+    for port in find_shields(args.ports or None, timeout=args.timeout,
+                             use_cache=args.use_cache):
+        print(port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,434 @@
+"""
+This module defines a compact, chunked recording format for decoded
+exg samples.
+
+Raw captures (eg. ``olimex/mock-data/*.bin``) are the serial byte stream, so
+every analysis has to find and decode the packets again. A recording
+(``.olx``) stores them decoded, one column per packet field, in chunks
+of a fixed number of packets::
+
+    MAGIC, header length (uint32), JSON header
+    chunk 0: data (uint16, N x 6), counts, steps, versions, switches (uint8, N each)
+    chunk 1: ...
+    chunk table (CHUNK_DTYPE, one row per chunk)
+    footer: chunk table offset (uint64), number of chunks (uint64), MAGIC
+
+``data`` holds the samples as sent by the shield, so values outside
+the 10-bit range (eg. from a corrupted packet) survive the round trip.
+Each chunk may be compressed with zlib. All integers are little endian.
+The chunk table holds the byte range, the range of sample numbers and
+the counter statistics of every chunk, so any slice of a recording can
+be read by loading the chunk table and the chunks it covers.
+
+The sample number of a packet counts sample periods since the first
+packet, dropped packets included, ie. its time is
+``sample / SAMPLE_FREQUENCY`` seconds. The ``steps`` column holds how
+far each packet's sample number is from the one before it.
+
+For example::
+
+    convert('nsr.bin')  # writes nsr.olx
+    with Recording('nsr.olx') as recording:
+        values, samples, counts, versions, switches = recording.read(60, 120)
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from olimex.constants import NUMCHANNELS, SAMPLE_FREQUENCY
+from olimex.index import PacketIndex
+from olimex.utils import calculate_values_from_packets, classify_steps
+
+MAGIC = b'OLXREC\r\n'
+# Version 1 stored values as int16 and is no longer read.
+FORMAT_VERSION = 2
+RECORDING_SUFFIX = '.olx'
+DEFAULT_CHUNK_SIZE = 4096  # packets, about 33 s
+COMPRESSION_CHOICES = (None, 'zlib')
+
+HEADER_LENGTH = struct.Struct('<I')
+FOOTER = struct.Struct('<QQ8s')
+
+CHUNK_DTYPE = np.dtype([
+    ('offset', '<u8'),  # byte offset of the chunk in the file
+    ('nbytes', '<u8'),  # length of the chunk in the file
+    ('num_packets', '<u4'),
+    ('first_sample', '<i8'),  # sample number of the first packet
+    ('last_sample', '<i8'),  # sample number of the last packet
+    ('dropped', '<u4'),
+    ('duplicates', '<u4'),
+    ('counter_errors', '<u4'),
+    ('resyncs', '<u4'),
+])
+
+# Columns of a chunk, in the order they are stored
+COLUMNS = (
+    ('data', np.dtype('<u2'), NUMCHANNELS),
+    ('counts', np.dtype('u1'), 1),
+    ('steps', np.dtype('u1'), 1),
+    ('versions', np.dtype('u1'), 1),
+    ('switches', np.dtype('u1'), 1),
+)
+
+
+class RecordingWriter:
+    """
+    Write decoded packets to a new recording.
+
+    For example::
+
+        with RecordingWriter('session.olx') as writer:
+            while True:
+                writer.write(*reader.read_chunk())
+
+    Packets are held in memory until a chunk is full. Duplicate packets
+    are left out.
+
+    :param path: Path of the recording to create.
+    :param chunk_size: Number of packets per chunk.
+    :param compression: ``None`` or ``'zlib'``.
+    :param source: Description of where the packets came from, kept
+                   in the header.
+    """
+    def __init__(self, path, chunk_size=DEFAULT_CHUNK_SIZE, compression=None, source=None):
+        if compression not in COMPRESSION_CHOICES:
+            raise ValueError('compression must be one of {}'.format(COMPRESSION_CHOICES))
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compression = compression
+
+        self._columns = {}
+        for name, dtype, width in COLUMNS:
+            shape = (chunk_size, width) if width > 1 else (chunk_size,)
+            self._columns[name] = np.empty(shape, dtype=dtype)
+        self._num_buffered = 0
+        # Counters of the chunk being filled: duplicates, counter
+        # errors and resyncs
+        self._counters = np.zeros(3, dtype=np.int64)
+        self._chunks = []
+        self._last_values = None
+        self._last_count = None
+        self._next_sample = 0
+
+        self._fd = open(path, 'wb')
+        header = json.dumps({
+            'version': FORMAT_VERSION,
+            'sample_frequency': SAMPLE_FREQUENCY,
+            'num_channels': NUMCHANNELS,
+            'chunk_size': chunk_size,
+            'compression': compression,
+            'source': source,
+        }).encode('utf-8')
+        self._fd.write(MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+
+    def __repr__(self):
+        return '<RecordingWriter {}>'.format(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, values, counts, versions, switches, resynced=None):
+        """
+        Append packets to the recording.
+
+        Arguments are as returned by
+        :py:meth:`~olimex.exg.PacketStreamReader.read_chunk`, without
+        gaps filled.
+
+        :param resynced: Boolean array marking packets that follow bytes
+                         skipped to find them.
+        """
+        if not len(values):
+            return
+        steps, duplicates, errors = classify_steps(values, counts, self._last_values,
+                                                   self._last_count)
+        self._last_values = values[-1].copy()
+        self._last_count = counts[-1]
+        if resynced is None:
+            resynced = np.zeros(len(values), dtype=bool)
+
+        kept = np.flatnonzero(~duplicates)
+        columns = {
+            'data': (1024 - values[kept]).astype(np.uint16),
+            'counts': counts[kept],
+            'steps': steps[kept],
+            'versions': versions[kept],
+            'switches': switches[kept],
+        }
+        # Running totals of the counters up to each packet kept.
+        # Duplicates are counted in the chunk of the packet kept
+        # after them.
+        totals = np.cumsum(np.column_stack((duplicates, errors, resynced)), axis=0)
+        counted = np.zeros(3, dtype=np.int64)
+
+        position = 0
+        while position < len(kept):
+            taken = min(len(kept) - position, self.chunk_size - self._num_buffered)
+            end = position + taken
+            for name, column in columns.items():
+                self._columns[name][self._num_buffered:self._num_buffered + taken] = (
+                    column[position:end])
+            self._num_buffered += taken
+            self._counters += totals[kept[end - 1]] - counted
+            counted = totals[kept[end - 1]]
+            position = end
+
+            if self._num_buffered == self.chunk_size:
+                self._flush()
+
+        self._counters += totals[-1] - counted
+
+    def _flush(self):
+        num_packets = self._num_buffered
+        if not num_packets:
+            return
+        body = b''.join(self._columns[name][:num_packets].tobytes() for name, _, _ in COLUMNS)
+        if self.compression == 'zlib':
+            body = zlib.compress(body)
+
+        steps = self._columns['steps'][:num_packets].astype(np.int64)
+        # The first step links this chunk to the packet before it.
+        first_sample = self._next_sample - 1 + int(steps[0])
+        last_sample = self._next_sample - 1 + int(steps.sum())
+        self._next_sample = last_sample + 1
+
+        duplicates, counter_errors, resyncs = self._counters.tolist()
+        self._chunks.append((self._fd.tell(), len(body), num_packets, first_sample,
+                             last_sample, int((steps - 1).sum()), duplicates, counter_errors,
+                             resyncs))
+        self._fd.write(body)
+        self._counters[:] = 0
+        self._num_buffered = 0
+
+    def close(self):
+        """
+        Write any buffered packets and the chunk table, and close the
+        file.
+        """
+        if self._fd.closed:
+            return
+        self._flush()
+        table = np.array(self._chunks, dtype=CHUNK_DTYPE)
+        table_offset = self._fd.tell()
+        self._fd.write(table.tobytes())
+        self._fd.write(FOOTER.pack(table_offset, len(table), MAGIC))
+        self._fd.close()
+
+
+class Recording:
+    """
+    A recording written by :py:class:`RecordingWriter`.
+
+    The file is memory-mapped. Opening it reads only the header and the
+    chunk table, and :py:meth:`read` only touches the chunks it needs.
+
+    :param path: Path to a recording.
+    :ivar header: Dictionary of the JSON header.
+    :ivar chunks: Chunk table, a structured array of
+                  :py:data:`CHUNK_DTYPE`.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._fd = open(path, 'rb')
+        try:
+            self._buffer = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._fd.close()
+            raise ValueError('{} is empty'.format(path))
+        try:
+            self._read_layout()
+        except ValueError:
+            self.close()
+            raise
+        except struct.error:
+            self.close()
+            raise ValueError('{} is truncated'.format(path))
+
+    def __repr__(self):
+        return '<Recording {} {} packets>'.format(self.path, self.num_packets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.num_packets
+
+    def _read_layout(self):
+        buff = self._buffer
+        if buff[:len(MAGIC)] != MAGIC or buff[-len(MAGIC):] != MAGIC:
+            raise ValueError('{} is not a recording'.format(self.path))
+        header_length, = HEADER_LENGTH.unpack_from(buff, len(MAGIC))
+        header_start = len(MAGIC) + HEADER_LENGTH.size
+        self.header = json.loads(buff[header_start:header_start + header_length].decode('utf-8'))
+        if self.header['version'] != FORMAT_VERSION:
+            raise ValueError('Unsupported recording version')
+
+        table_offset, num_chunks, _ = FOOTER.unpack_from(buff, len(buff) - FOOTER.size)
+        self.chunks = np.frombuffer(buff, dtype=CHUNK_DTYPE, count=num_chunks,
+                                    offset=table_offset).copy()
+
+    @property
+    def sample_frequency(self):
+        return self.header['sample_frequency']
+
+    @property
+    def num_packets(self):
+        return int(self.chunks['num_packets'].sum())
+
+    @property
+    def duration(self):
+        """
+        Length of the recording in seconds, dropped packets included.
+        """
+        if not len(self.chunks):
+            return 0
+        return (int(self.chunks['last_sample'][-1]) + 1) / self.sample_frequency
+
+    @property
+    def dropped_count(self):
+        return int(self.chunks['dropped'].sum())
+
+    def read_chunk(self, number):
+        """
+        Return the columns of chunk ``number``.
+
+        :returns: A tuple of ``(values, samples, counts, versions,
+                  switches)``. ``values`` is an ``(N, 6)`` integer array
+                  as returned by
+                  :py:func:`~olimex.utils.calculate_values_from_packets`
+                  and ``samples`` holds the sample number of each packet.
+        :raises ValueError: If the chunk is corrupt.
+        """
+        chunk = self.chunks[number]
+        num_packets = int(chunk['num_packets'])
+        start = int(chunk['offset'])
+        body = self._buffer[start:start + int(chunk['nbytes'])]
+        if self.header['compression'] == 'zlib':
+            try:
+                body = zlib.decompress(body)
+            except zlib.error as e:
+                raise ValueError('Chunk {} of {} is corrupt: {}'.format(number, self.path, e))
+
+        columns = {}
+        offset = 0
+        for name, dtype, width in COLUMNS:
+            column = np.frombuffer(body, dtype=dtype, count=num_packets * width, offset=offset)
+            if width > 1:
+                column = column.reshape(num_packets, width)
+            columns[name] = column
+            offset += column.nbytes
+
+        steps = np.cumsum(columns['steps'], dtype=np.int64)
+        samples = steps + (int(chunk['first_sample']) - steps[0])
+        values = 1024 - columns['data'].astype(np.int32)
+        return (values, samples, columns['counts'], columns['versions'],
+                columns['switches'])
+
+    def read(self, start=None, stop=None):
+        """
+        Return the packets recorded between two times.
+
+        :param start: Seconds into the recording of the first packet
+                      returned. Defaults to the start of the recording.
+        :param stop: Seconds into the recording at which to stop.
+                     Defaults to the end of the recording.
+        :returns: A tuple of ``(values, samples, counts, versions,
+                  switches)`` as returned by :py:meth:`read_chunk`.
+        """
+        fs = self.sample_frequency
+        start_sample = 0 if start is None else int(np.ceil(start * fs))
+        stop_sample = None if stop is None else int(np.ceil(stop * fs))
+
+        first = np.searchsorted(self.chunks['last_sample'], start_sample)
+        end = len(self.chunks)
+        if stop_sample is not None:
+            end = np.searchsorted(self.chunks['first_sample'], stop_sample)
+        chunks = [self.read_chunk(number) for number in range(first, max(first, end))]
+        if not chunks:
+            return (np.empty((0, NUMCHANNELS), dtype=np.int32), np.empty(0, dtype=np.int64),
+                    np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.uint8),
+                    np.empty(0, dtype=np.uint8))
+
+        columns = [np.concatenate(column) for column in zip(*chunks)]
+        del chunks  # release our views of the file
+        samples = columns[1]
+        selected = slice(np.searchsorted(samples, start_sample),
+                         None if stop_sample is None else np.searchsorted(samples, stop_sample))
+        return tuple(column[selected] for column in columns)
+
+    def close(self):
+        self._buffer.close()
+        self._fd.close()
+
+
+def convert(source, destination=None, chunk_size=DEFAULT_CHUNK_SIZE, compression=None):
+    """
+    Convert a raw capture to a recording.
+
+    :param source: Path to a capture of the serial byte stream (``.bin``).
+    :param destination: Path of the recording to write. Defaults to
+                        ``source`` with its extension replaced by
+                        :py:data:`RECORDING_SUFFIX`.
+    :param chunk_size: Number of packets per chunk.
+    :param compression: ``None`` or ``'zlib'``.
+    :returns: The path of the recording.
+    """
+    if destination is None:
+        destination = os.path.splitext(source)[0] + RECORDING_SUFFIX
+
+    index = PacketIndex.for_file(source)
+    resynced = np.zeros(len(index), dtype=bool)
+    resynced[index.resyncs] = True
+    # As with PacketStreamReader.resync_count, bytes before the first
+    # packet don't count as a resync.
+    resynced[:1] = False
+
+    with RecordingWriter(destination, chunk_size, compression,
+                         source=os.path.basename(source)) as writer:
+        if not len(index):
+            return destination
+        with open(source, 'rb') as fd:
+            with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as buff:
+                for start in range(0, len(index), chunk_size):
+                    packets = index.read_packets(buff, start, start + chunk_size)
+                    writer.write(*calculate_values_from_packets(packets),
+                                 resynced=resynced[start:start + chunk_size])
+    return destination
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert raw EXG captures to recordings.')
+    parser.add_argument('sources',
+                        nargs='+',
+                        help='Captures of the serial byte stream (eg. nsr.bin).')
+    parser.add_argument('--chunk-size',
+                        dest='chunk_size',
+                        type=int,
+                        default=DEFAULT_CHUNK_SIZE,
+                        help='Number of packets per chunk.')
+    parser.add_argument('-z', '--compress',
+                        action='store_true',
+                        default=False,
+                        dest='compress',
+                        help='Compress each chunk with zlib.')
+    args = parser.parse_args()
+
+    compression = 'zlib' if args.compress else None
+    for source in args.sources:
+        destination = convert(source, chunk_size=args.chunk_size, compression=compression)
+        print('{} -> {}'.format(source, destination))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+This module defines a SpectralEstimator for running power spectra of
+exg samples as they stream in, and a SpectrogramBuffer for showing
+them.
+
+A :py:class:`SpectralEstimator` cuts the stream into overlapping
+windows and averages the power spectra of the most recent windows
+(Welch's method), for all channels at once. From the averaged spectrum
+it gives the median and mean frequency of each channel, as used to
+track muscle fatigue in EMG.
+"""
+import numpy as np
+import scipy.signal
+
+from olimex.constants import NUMCHANNELS, SAMPLE_FREQUENCY
+
+DEFAULT_WINDOW_LENGTH = 256  # samples, about 2 s at 125 Hz
+DEFAULT_OVERLAP = 128  # samples
+DEFAULT_AVERAGES = 4
+# Range shown by a SpectrogramBuffer, dB below the peak of each spectrum
+SPECTROGRAM_RANGE = 60
+
+
+class SpectralEstimator:
+    """
+    Estimate the power spectra of a stream of samples from all channels.
+
+    For example::
+
+        estimator = SpectralEstimator()
+        while True:
+            values, *_ = reader.read_chunk()
+            if len(estimator.update(values)):
+                print(estimator.median_frequency)
+
+    A spectrum is computed every ``window_length - overlap`` samples
+    (a hop). The window, the frame being filled and the spectra being
+    averaged are allocated once, so every hop costs the same.
+
+    :param window_length: Number of samples in each window.
+    :param overlap: Number of samples shared by consecutive windows.
+    :param averages: Number of most recent spectra averaged in
+                     :py:attr:`psd`.
+    :param window: Window function, as accepted by
+                   :py:func:`scipy.signal.get_window`.
+    :param fs: Sampling frequency in Hz.
+    :param num_channels: Number of channels in each block of samples.
+    :ivar frequencies: Frequency in Hz of each row of a spectrum.
+    :ivar psd: Averaged power spectral density of each channel, of shape
+               ``(len(frequencies), num_channels)``, in ADC counts
+               squared per Hz. Zero before the first hop.
+    """
+    def __init__(self, window_length=DEFAULT_WINDOW_LENGTH, overlap=DEFAULT_OVERLAP,
+                 averages=DEFAULT_AVERAGES, window='hann', fs=SAMPLE_FREQUENCY,
+                 num_channels=NUMCHANNELS):
+        if not 0 <= overlap < window_length:
+            raise ValueError('overlap must be at least 0 and less than window_length')
+        if averages < 1:
+            raise ValueError('averages must be at least 1')
+        self.window_length = window_length
+        self.overlap = overlap
+        self.hop = window_length - overlap
+        self.averages = averages
+        self.fs = fs
+        self.num_channels = num_channels
+
+        self.window = scipy.signal.get_window(window, window_length)[:, np.newaxis]
+        self.frequencies = np.fft.rfftfreq(window_length, 1 / fs)
+        # One-sided power spectral density, as scipy.signal.welch
+        self._scale = np.full((len(self.frequencies), 1), 2 / (fs * np.sum(self.window ** 2)))
+        self._scale[0] = self._scale[0] / 2
+        if not window_length % 2:
+            self._scale[-1] = self._scale[-1] / 2
+
+        self._frame = np.zeros((window_length, num_channels))
+        self._filled = 0
+        self._scratch = np.empty((window_length, num_channels))
+        self._power = np.empty((len(self.frequencies), num_channels))
+        # The spectra being averaged, oldest overwritten first
+        self._spectra = np.zeros((averages, len(self.frequencies), num_channels))
+        self._spectrum_count = 0
+        self.psd = np.zeros((len(self.frequencies), num_channels))
+
+    def __repr__(self):
+        return '<SpectralEstimator window_length={} overlap={} averages={}>'.format(
+            self.window_length, self.overlap, self.averages)
+
+    def reset(self):
+        """
+        Forget all samples and spectra, eg. after seeking within a
+        recording.
+        """
+        self._filled = 0
+        self._spectrum_count = 0
+        self.psd[:] = 0
+
+    @property
+    def median_frequency(self):
+        """
+        Frequency in Hz below which half of the power of each channel
+        lies, or ``None`` before the first hop.
+        """
+        if not self._spectrum_count:
+            return None
+        cumulative = np.cumsum(self.psd, axis=0)
+        return self.frequencies[np.argmax(cumulative >= cumulative[-1] / 2, axis=0)]
+
+    @property
+    def mean_frequency(self):
+        """
+        Power-weighted mean frequency in Hz of each channel, or
+        ``None`` before the first hop.
+        """
+        if not self._spectrum_count:
+            return None
+        total = self.psd.sum(axis=0)
+        total[total == 0] = np.nan
+        return self.frequencies.dot(self.psd) / total
+
+    def _compute_spectrum(self):
+        """
+        Compute the power spectrum of the current frame, store it for
+        averaging and return it.
+        """
+        np.subtract(self._frame, self._frame.mean(axis=0), out=self._scratch)
+        self._scratch *= self.window
+        np.abs(np.fft.rfft(self._scratch, axis=0), out=self._power)
+        spectrum = self._spectra[self._spectrum_count % self.averages]
+        np.square(self._power, out=spectrum)
+        spectrum *= self._scale
+        self._spectrum_count += 1
+
+        num_spectra = min(self._spectrum_count, self.averages)
+        np.mean(self._spectra[:num_spectra], axis=0, out=self.psd)
+        return spectrum
+
+    def update(self, samples):
+        """
+        Process more samples and return the spectra of the windows
+        they complete.
+
+        :param samples: Array of shape ``(N, num_channels)``. Samples
+                        must be evenly spaced and finite.
+        :returns: Array of shape ``(hops, len(frequencies),
+                  num_channels)`` with the power spectral density of
+                  each window completed, oldest first. Usually empty or
+                  of length one.
+        """
+        samples = np.asarray(samples)
+        spectra = []
+        position = 0
+        while position < len(samples):
+            taken = min(len(samples) - position, self.window_length - self._filled)
+            self._frame[self._filled:self._filled + taken] = samples[position:position + taken]
+            self._filled += taken
+            position += taken
+            if self._filled == self.window_length:
+                spectra.append(self._compute_spectrum().copy())
+                # Keep the overlap as the start of the next frame.
+                self._frame[:self.overlap] = self._frame[self.hop:]
+                self._filled = self.overlap
+
+        if not spectra:
+            return np.empty((0, len(self.frequencies), self.num_channels))
+        return np.array(spectra)
+
+
+class SpectrogramBuffer:
+    """
+    A preallocated, sweep-style spectrogram of one channel.
+
+    Like :py:class:`~olimex.gui.StripBuffer`, each new spectrum is
+    written over the oldest one at a write head that moves left to
+    right and wraps around. Spectra are stored in dB relative to their
+    own peak, clipped at ``-SPECTROGRAM_RANGE``.
+
+    :param num_frequencies: Number of rows of each spectrum.
+    :param length: Number of spectra along the spectrogram.
+    :param channel: Channel shown.
+    :ivar image: Array of shape ``(num_frequencies, length)``, lowest
+                 frequency first. It is updated in place.
+    """
+    def __init__(self, num_frequencies, length, channel=0):
+        self.length = length
+        self.channel = channel
+        self.image = np.full((num_frequencies, length), -SPECTROGRAM_RANGE, dtype=np.float64)
+        self.head = 0
+
+    def write(self, spectra):
+        """
+        Write spectra at the write head and move the head past them.
+
+        :param spectra: Array of shape ``(N, num_frequencies,
+                        num_channels)``, as returned by
+                        :py:meth:`SpectralEstimator.update`.
+        """
+        for spectrum in spectra[-self.length:, :, self.channel]:
+            column = self.image[:, self.head]
+            peak = spectrum.max()
+            if peak > 0:
+                np.divide(spectrum, peak, out=column)
+                np.maximum(column, 10 ** (-SPECTROGRAM_RANGE / 10), out=column)
+                np.log10(column, out=column)
+                column *= 10
+            else:
+                column[:] = -SPECTROGRAM_RANGE
+            self.head = (self.head + 1) % self.length
@@ -0,0 +1,137 @@
+"""
+This module defines a LatencyTracer for measuring how stale the trace
+on screen is.
+
+Each batch of packets shown on a refresh is stamped as it passes
+through the stages between the serial port and the screen:
+
+- ``arrival``: the bytes of its oldest packet were read from the
+  serial port (:py:attr:`~olimex.exg.PacketStreamReader.last_arrival`).
+- ``decode``: the packets were handed to the display.
+- ``process``: they were filtered, analysed and written to the plot's
+  data.
+- ``render``: the plot was drawn, or sent to the browser for Bokeh.
+
+For example::
+
+    tracer = LatencyTracer()
+    tracer.begin(reader.last_arrival)
+    tracer.stamp('decode')
+    ...
+    tracer.stamp('process')
+    ...
+    tracer.stamp('render')
+    print(tracer.percentiles())
+
+Only the stamps of the last ``capacity`` batches are kept, in a
+preallocated array, so tracing can be left on for as long as the
+display runs. Time spent by bytes in the operating system's serial
+buffer, at most one poll interval, isn't seen.
+"""
+import time
+
+import numpy as np
+
+STAGES = ('decode', 'process', 'render')
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+
+class LatencyTracer:
+    """
+    Latencies of the last ``capacity`` batches through each stage.
+
+    :param capacity: Number of batches kept.
+    :param clock: Function returning the time in seconds. Must be the
+                  clock arrival times are taken with,
+                  :py:func:`time.perf_counter` for readers.
+    :ivar batch_count: Number of batches traced to the end.
+    """
+    def __init__(self, capacity=1024, clock=time.perf_counter):
+        self.capacity = capacity
+        self._clock = clock
+        # One row per batch: arrival followed by the time of each stage
+        self._stamps = np.empty((capacity, len(STAGES) + 1))
+        self._current = None
+        self.batch_count = 0
+
+    def __repr__(self):
+        return '<LatencyTracer {} batches>'.format(self.batch_count)
+
+    def begin(self, arrival):
+        """
+        Start tracing a batch.
+
+        :param arrival: Time its oldest packet arrived, or ``None`` if
+                        there is no batch this refresh, in which case
+                        stamps are ignored until the next call.
+        """
+        self._current = None if arrival is None else [arrival]
+
+    def stamp(self, stage):
+        """
+        Record that the current batch finished ``stage``.
+
+        Stages must be stamped in the order of :py:data:`STAGES`.
+        """
+        if self._current is None:
+            return
+        if STAGES[len(self._current) - 1] != stage:
+            raise ValueError('expected stage {!r}, got {!r}'.format(
+                STAGES[len(self._current) - 1], stage))
+        self._current.append(self._clock())
+        if len(self._current) == len(STAGES) + 1:
+            self._stamps[self.batch_count % self.capacity] = self._current
+            self.batch_count += 1
+            self._current = None
+
+    def latencies(self):
+        """
+        Return the latencies of the batches kept, oldest first.
+
+        :returns: A dictionary of stage name to an array of seconds
+                  spent in that stage, plus ``total`` for the time from
+                  arrival to render.
+        """
+        num_batches = min(self.batch_count, self.capacity)
+        stamps = self._stamps[:num_batches]
+        if self.batch_count > self.capacity:
+            stamps = np.roll(stamps, -(self.batch_count % self.capacity), axis=0)
+        durations = np.diff(stamps, axis=1)
+        latencies = {stage: durations[:, column] for column, stage in enumerate(STAGES)}
+        latencies['total'] = stamps[:, -1] - stamps[:, 0]
+        return latencies
+
+    def percentiles(self, percentiles=DEFAULT_PERCENTILES):
+        """
+        Return percentiles of the latency of each stage and in total.
+
+        :returns: A dictionary of stage name, and ``total``, to a
+                  dictionary of percentile, eg. ``'p99'``, to seconds.
+                  Empty before the first batch.
+        """
+        if not self.batch_count:
+            return {}
+        return {
+            stage: {'p{}'.format(percentile): float(value)
+                    for percentile, value in zip(percentiles,
+                                                 np.percentile(durations, percentiles))}
+            for stage, durations in self.latencies().items()
+        }
+
+    def reset(self):
+        self._current = None
+        self.batch_count = 0
+
+
+def print_latencies(tracer):
+    """
+    Print the latency percentiles of ``tracer`` in milliseconds.
+    """
+    percentiles = tracer.percentiles()
+    print('Latency of the last {} batches (ms):'.format(min(tracer.batch_count,
+                                                            tracer.capacity)))
+    for stage in STAGES + ('total',):
+        if stage in percentiles:
+            print('{:>8} '.format(stage) + ' '.join(
+                '{} {:.1f}'.format(name, 1000 * value)
+                for name, value in percentiles[stage].items()))
@@ -1,10 +1,35 @@
-import glob
 import os
-import pip
-import sys
 
 import numpy as np
-import serial
+
+from olimex.constants import PACKET_SIZE, SYNC0, SYNC1
+
+SYNC = SYNC0 + SYNC1
+
+# Directory of the mock data within the olimex package
+MOCK_DATA_DIRNAME = 'mock-data'
+
+# Counter jumps larger than this are not believed to be dropped packets.
+# The counter wraps at 256, so a counter that goes backwards a little
+# looks like a jump of almost 256 packets.
+MAX_DROPPED_PACKETS = 127
+
+# Number of packets checked per array operation when looking for the
+# end of a run of in-sync packets. Bounds the work done past a resync.
+RUN_BLOCK_PACKETS = 4096
+
+# Record layout of a single Olimex-EKG-EMG packet. Passing a buffer
+# of back-to-back packets to :py:func:`numpy.frombuffer` with this
+# dtype gives a view of every field without copying the buffer.
+PACKET_DTYPE = np.dtype([
+    ('sync0', 'u1'),
+    ('sync1', 'u1'),
+    ('version', 'u1'),
+    ('count', 'u1'),
+    ('data', '>u2', (6,)),
+    ('switches', 'u1'),
+])
+assert PACKET_DTYPE.itemsize == PACKET_SIZE
 
 
 def calculate_values_from_packet_data(data):
@@ -39,54 +64,218 @@ def calculate_values_from_packet_data(data):
     return values
 
 
+def calculate_values_from_packets(buff):
+    """
+    Return the channel values and header fields of many packets at once.
+
+    :param buff: Bytes-like object holding back-to-back packets. Its
+                 length must be a multiple of
+                 :py:data:`~olimex.constants.PACKET_SIZE` and it must
+                 start on a packet boundary.
+    :returns: A tuple of ``(values, counts, versions, switches)``.
+              ``values`` is an ``(N, 6)`` integer array with the same
+              flip applied as in
+              :py:func:`calculate_values_from_packet_data`. The other
+              three are length ``N`` arrays of the header bytes.
+
+    This is the batched counterpart to
+    :py:func:`calculate_values_from_packet_data`. The packets are
+    decoded with a handful of array operations instead of a Python
+    loop per packet.
+    """
+    if len(buff) % PACKET_SIZE:
+        raise ValueError('Buffer length {} is not a multiple of the packet '
+                         'size ({})'.format(len(buff), PACKET_SIZE))
+
+    packets = np.frombuffer(buff, dtype=PACKET_DTYPE)
+    # Same flip as in calculate_values_from_packet_data.
+    values = 1024 - packets['data'].astype(np.int32)
+    return (values,
+            packets['count'].copy(),
+            packets['version'].copy(),
+            packets['switches'].copy())
+
+
+def encode_packets(values, counts, versions=2, switches=1):
+    """
+    Return packets holding the given channel values, back to back.
+
+    This is the inverse of :py:func:`calculate_values_from_packets`.
+
+    :param values: ``(N, 6)`` array of channel values between 1 and 1024.
+    :param counts: Array of the ``N`` packet counters. Taken modulo 256.
+    :param versions: Version byte of every packet, or an array of them.
+    :param switches: Switches byte of every packet, or an array of them.
+    :rtype: bytes
+    """
+    packets = np.empty(len(values), dtype=PACKET_DTYPE)
+    packets['sync0'] = SYNC[0]
+    packets['sync1'] = SYNC[1]
+    packets['version'] = versions
+    packets['count'] = np.asarray(counts) % 256
+    # Same flip as in calculate_values_from_packet_data.
+    packets['data'] = 1024 - np.asarray(values)
+    packets['switches'] = switches
+    return packets.tobytes()
+
+
+def find_packet_run(buff, start=0, max_packets=None):
+    """
+    Return the position and length of the next run of in-sync packets.
+
+    :param buff: Bytes-like object supporting ``find`` (eg.
+                 :py:class:`bytearray`, :py:class:`bytes` or
+                 :py:class:`mmap.mmap`).
+    :param start: Offset at which to start searching for SYNC0/SYNC1.
+    :param max_packets: Upper bound on the length of the run.
+    :returns: A tuple of ``(offset, num_packets)``. ``offset`` is the
+              position of the first SYNC0/SYNC1 pair at or after
+              ``start`` (or -1 if there is none). ``num_packets`` is
+              the number of complete, back-to-back packets starting at
+              ``offset`` that each begin with SYNC0/SYNC1. It is 0 if
+              the packet at ``offset`` is not complete yet.
+    """
+    offset = buff.find(SYNC, start)
+    if offset < 0:
+        return -1, 0
+
+    available = (len(buff) - offset) // PACKET_SIZE
+    if max_packets is not None:
+        available = min(available, max_packets)
+
+    num_packets = 0
+    while num_packets < available:
+        block_size = min(available - num_packets, RUN_BLOCK_PACKETS)
+        block = np.frombuffer(buff, dtype=np.uint8,
+                              count=block_size * PACKET_SIZE,
+                              offset=offset + num_packets * PACKET_SIZE)
+        block = block.reshape(block_size, PACKET_SIZE)
+        in_sync = (block[:, 0] == SYNC[0]) & (block[:, 1] == SYNC[1])
+        del block  # release our export of buff
+        if in_sync.all():
+            num_packets += block_size
+        else:
+            num_packets += int(in_sync.argmin())
+            break
+
+    return offset, num_packets
+
+
+def count_steps(counts, last_count=None):
+    """
+    Return how far each packet counter moved on from the one before it.
+
+    :param counts: Array of packet counter bytes.
+    :param last_count: Counter of the packet before ``counts[0]``. If
+                       ``None``, the first step is 1.
+    :returns: Integer array the same length as ``counts``. A step of 1
+              means consecutive packets, 0 means a repeated counter
+              and ``n > 1`` means ``n - 1`` packets are missing.
+    """
+    counts = counts.astype(np.int16)
+    previous = np.empty_like(counts)
+    previous[1:] = counts[:-1]
+    if len(counts):
+        previous[0] = counts[0] - 1 if last_count is None else last_count
+    return (counts - previous) % 256
+
+
+def classify_steps(values, counts, last_values=None, last_count=None):
+    """
+    Return the counter steps of packets along with which of them are
+    duplicates or counter errors.
+
+    A packet whose counter repeats with the same values as the packet
+    before it is a duplicate. One whose counter repeats with different
+    values, or jumps by more than :py:data:`MAX_DROPPED_PACKETS`, is a
+    counter error and is taken to follow on from the packet before it.
+
+    :param values: ``(N, 6)`` array of channel values.
+    :param counts: Array of the ``N`` packet counter bytes.
+    :param last_values: Values of the packet before ``values[0]``.
+    :param last_count: Counter of the packet before ``counts[0]``.
+    :returns: A tuple of ``(steps, duplicates, errors)``. ``steps`` is
+              as returned by :py:func:`count_steps`, with duplicates
+              set to 0 and counter errors set to 1. ``duplicates`` and
+              ``errors`` are boolean arrays.
+    """
+    steps = count_steps(counts, last_count)
+    if not len(steps):
+        no_packets = np.zeros(0, dtype=bool)
+        return steps, no_packets, no_packets
+
+    previous = np.empty_like(values)
+    previous[1:] = values[:-1]
+    previous[0] = values[0] if last_values is None else last_values
+    same_values = (values == previous).all(axis=1)
+    if last_values is None:
+        same_values[0] = False
+
+    repeated = steps == 0
+    duplicates = repeated & same_values
+    errors = (repeated & ~same_values) | (steps > MAX_DROPPED_PACKETS)
+    steps[errors] = 1
+    return steps, duplicates, errors
+
+
 def calculate_heart_rate(data):
-    return np.fft.rfft(data)
+    """
+    Return the average heart rate of ``data`` in beats per minute.
+
+    :param data: 1-D array of samples from one channel.
+    :returns: The heart rate, or ``None`` if fewer than two beats were
+              found.
+
+    See :py:class:`~olimex.heart.QRSDetector` for detecting beats in a
+    stream of samples.
+    """
+    # Imported here so that reading packets doesn't require scipy.
+    from olimex.heart import QRSDetector
+
+    peak_times = QRSDetector().update(data)
+    if len(peak_times) < 2:
+        return None
+    return 60 * (len(peak_times) - 1) / (peak_times[-1] - peak_times[0])
 
 
 def get_mock_data_list():
-    mock_data_dir = os.path.join(sys.prefix, 'olimex', 'mock-data')
-    if not os.path.exists(mock_data_dir):
-        # possibly installed with `pip install -e .`
-        pkgs = pip.get_installed_distributions()
-        pkgs = [pkg for pkg in pkgs if pkg.project_name == 'olimex-ekg-emg']
-        if not pkgs:
-            return '', []
-        mock_data_dir = os.path.join(pkgs[0].location, 'mock-data')
-
-    if not os.path.exists(mock_data_dir):
+    """
+    Return the directory holding the mock data and the names of the
+    recordings in it.
+
+    The mock data is installed as resources of the olimex package, so it
+    is found the same way whether the package was installed normally or
+    with ``pip install -e .``.
+
+    :returns: A tuple of ``(directory, names)``, or ``('', [])`` if the
+              mock data is missing.
+    """
+    try:
+        from importlib.resources import files
+        mock_data_dir = str(files('olimex') / MOCK_DATA_DIRNAME)
+    except ImportError:
+        # Python < 3.9
+        mock_data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     MOCK_DATA_DIRNAME)
+
+    if not os.path.isdir(mock_data_dir):
         return '', []
 
-    return mock_data_dir, os.listdir(mock_data_dir)
+    return mock_data_dir, sorted(name for name in os.listdir(mock_data_dir)
+                                 if name.endswith('.bin'))
 
 
 def list_serial_ports():
     """
     Lists serial port names
 
-    Pulled from here: http://stackoverflow.com/questions/12090503
+    Ports are listed by the operating system without opening them. See
+    :py:func:`olimex.ports.find_shields` for finding the ports shields
+    are connected to.
 
-    :raises EnvironmentError:
-        On unsupported or unknown platforms
     :returns:
         A list of the serial ports available on the system
     """
-    if sys.platform.startswith('win'):
-        ports = ['COM%s' % (i + 1) for i in range(256)]
-    elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
-        # this excludes your current terminal "/dev/tty"
-        ports = glob.glob('/dev/tty[A-Za-z]*')
-    elif sys.platform.startswith('darwin'):
-        ports = glob.glob('/dev/tty.*')
-    else:
-        raise EnvironmentError('Unsupported platform')
-
-    result = []
-    for port in ports:
-        try:
-            s = serial.Serial(port)
-            s.close()
-            result.append(port)
-        except (OSError, serial.SerialException):
-            pass
-    return result
+    from olimex.ports import candidate_ports
 
+    return sorted(candidate_ports())
@@ -0,0 +1,265 @@
+"""
+This module defines virtual Olimex-EKG-EMG shields on pseudo-terminals.
+
+Each :py:class:`VirtualShield` opens a pseudo-terminal and writes a
+packet stream to it from a background thread, paced like a shield on a
+real serial line: at the shield's packet rate, or faster for load
+tests, but never faster than the baud rate allows. Anything that opens
+a port with ``serial.Serial`` can read from :py:attr:`VirtualShield.port`
+instead, so the GUI, the notebook and ``tools/slsnif.py`` can be tested
+end to end without hardware. Unlike the mocks in :py:mod:`olimex.mock`,
+reads go through real file descriptors and the kernel's tty buffers, so
+they return partial packets, and bytes that don't fit in a full buffer
+are lost, as on a real port.
+
+For example, to run four shields until interrupted with Ctrl-C::
+
+    python -m olimex.virtual -n 4
+
+and then, in another terminal::
+
+    python -m olimex.gui -p /dev/pts/5
+
+This module needs a POSIX system.
+"""
+import argparse
+import mmap
+import os
+import threading
+import time
+import tty
+
+from olimex.constants import DEFAULT_BAUDRATE, PACKET_SIZE, SAMPLE_FREQUENCY
+from olimex.mock import synthetic_chunks
+
+# Bits sent per byte on an 8N1 serial line
+BITS_PER_BYTE = 10
+# Seconds between writes to the pseudo-terminal
+WRITE_INTERVAL = 0.005
+
+
+def _repeat(data):
+    while True:
+        yield data
+
+
+class VirtualShield:
+    """
+    A shield sending packets to a pseudo-terminal.
+
+    :param source: Bytes-like object or path of a recording to send. By
+                   default an endless synthetic ECG stream, see
+                   :py:func:`~olimex.mock.synthetic_chunks`.
+    :param speed: Multiple of the shield's packet rate at which to send,
+                  or ``None`` to send as fast as the baud rate allows.
+    :param baudrate: Baud rate of the simulated serial line. Bounds the
+                     bytes sent per second whatever the speed.
+    :param loop: Send ``source`` over and over rather than once.
+    :param seed: Seed of the default synthetic stream.
+    :ivar port: Path of the pseudo-terminal to open, eg. ``/dev/pts/5``.
+    :ivar bytes_sent: Number of bytes written to the pseudo-terminal.
+    :ivar bytes_dropped: Number of bytes lost because the reader fell
+                         behind and the tty buffer was full.
+    """
+    def __init__(self, source=None, speed=1, baudrate=DEFAULT_BAUDRATE, loop=False, seed=None):
+        self.speed = speed
+        self.baudrate = baudrate
+        self.bytes_sent = 0
+        self.bytes_dropped = 0
+
+        self._file = None
+        if source is None:
+            self._chunks = synthetic_chunks(seed=seed)
+        else:
+            if isinstance(source, str):
+                self._file = open(source, 'rb')
+                source = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._chunks = _repeat(source) if loop else iter((source,))
+        self._pending = memoryview(b'')
+
+        self._master, self._slave = os.openpty()
+        # No echo or line editing, as on a real serial port
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        # Keeping the slave end open keeps the line up between readers.
+        self.port = os.ttyname(self._slave)
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='VirtualShield {}'.format(self.port))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __repr__(self):
+        return '<VirtualShield {} speed={}>'.format(self.port, self.speed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def bytes_per_second(self):
+        """
+        Rate at which bytes are sent.
+        """
+        line_rate = self.baudrate / BITS_PER_BYTE
+        if self.speed is None:
+            return line_rate
+        return min(self.speed * SAMPLE_FREQUENCY * PACKET_SIZE, line_rate)
+
+    @property
+    def finished(self):
+        """
+        Whether the whole source has been sent.
+        """
+        return not self._thread.is_alive()
+
+    def _next_bytes(self, n):
+        """
+        Return up to ``n`` bytes of the source, or ``None`` at its end.
+        """
+        while not len(self._pending):
+            try:
+                self._pending = memoryview(next(self._chunks))
+            except StopIteration:
+                return None
+        data = self._pending[:n]
+        self._pending = self._pending[n:]
+        return data
+
+    def _send(self, data):
+        try:
+            written = os.write(self._master, data)
+        except BlockingIOError:
+            written = 0
+        self.bytes_sent += written
+        # Like a UART with nowhere to put them, the rest are lost.
+        self.bytes_dropped += len(data) - written
+
+    def _run(self):
+        start = time.monotonic()
+        due = 0
+        while not self._stop.wait(WRITE_INTERVAL):
+            elapsed = time.monotonic() - start
+            target = int(elapsed * self.bytes_per_second)
+            while due < target:
+                data = self._next_bytes(target - due)
+                if data is None:
+                    return
+                due += len(data)
+                self._send(data)
+
+    def wait(self, timeout=None):
+        """
+        Wait until the whole source has been sent.
+
+        :returns: Whether it has been sent.
+        """
+        self._thread.join(timeout)
+        return self.finished
+
+    def close(self):
+        """
+        Stop sending and close the pseudo-terminal.
+        """
+        self._stop.set()
+        self._thread.join()
+        if self._master is not None:
+            os.close(self._master)
+            os.close(self._slave)
+            self._master = self._slave = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class VirtualShieldRig:
+    """
+    A group of virtual shields, eg. for load tests.
+
+    :param num_shields: Number of shields.
+    :param kwargs: Passed on to every :py:class:`VirtualShield`. Unless
+                   given, each shield's synthetic stream has a different
+                   seed.
+    """
+    def __init__(self, num_shields, **kwargs):
+        self.shields = []
+        try:
+            for number in range(num_shields):
+                shield_kwargs = dict(kwargs)
+                shield_kwargs.setdefault('seed', number)
+                self.shields.append(VirtualShield(**shield_kwargs))
+        except Exception:
+            self.close()
+            raise
+
+    def __repr__(self):
+        return '<VirtualShieldRig {} shields>'.format(len(self.shields))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.shields)
+
+    def __len__(self):
+        return len(self.shields)
+
+    @property
+    def ports(self):
+        return [shield.port for shield in self.shields]
+
+    def close(self):
+        for shield in self.shields:
+            shield.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Send EXG packets to pseudo-terminals, as if from Olimex-EKG-EMG shields.')
+    parser.add_argument('-n', '--shields',
+                        dest='shields',
+                        type=int,
+                        default=1,
+                        help='Number of shields to simulate.')
+    parser.add_argument('-f', '--file',
+                        dest='file',
+                        help='Recording to send, over and over. '
+                             'Defaults to a synthetic ECG.')
+    parser.add_argument('--speed',
+                        dest='speed',
+                        type=float,
+                        default=1,
+                        help="Multiple of the shield's packet rate at which to send. "
+                             '0 sends as fast as the baud rate allows.')
+    parser.add_argument('--baudrate',
+                        dest='baudrate',
+                        type=int,
+                        default=DEFAULT_BAUDRATE,
+                        help='Baud rate of the simulated serial lines.')
+    args = parser.parse_args()
+
+    kwargs = {'speed': args.speed or None, 'baudrate': args.baudrate}
+    if args.file:
+        kwargs.update(source=args.file, loop=True)
+    with VirtualShieldRig(args.shields, **kwargs) as rig:
+        for shield in rig:
+            print(shield.port, flush=True)
+        print('Stop program with CTRL + C', flush=True)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        for shield in rig:
+            print('{}: {} bytes sent, {} dropped'.format(
+                shield.port, shield.bytes_sent, shield.bytes_dropped))
+
+
+if __name__ == '__main__':
+    main()
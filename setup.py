@@ -1,4 +1,3 @@
-import os
 from setuptools import setup
 
 import olimex
@@ -9,9 +8,6 @@ with open("README.rst") as fd:
 with open("LICENSE") as fd:
     LICENSE = fd.read()
 
-MOCK_DATA_FILES = os.listdir('mock-data')
-MOCK_DATA_FILES = map(lambda f: os.path.join('mock-data', f), MOCK_DATA_FILES)
-
 setup(
     name='olimex-ekg-emg',
     version=olimex.__version__,
@@ -22,12 +18,12 @@ setup(
     author_email=olimex.__email__,
     url='https://github.com/logston/olimex-ekg-emg',
     packages=['olimex'],
-    data_files=[('olimex/mock-data', MOCK_DATA_FILES)],
+    package_data={'olimex': ['mock-data/*.bin']},
     test_suite='tests',
     keywords=['Olimex', 'EKG', 'EMG', 'Arduino'],
     install_requires=[
         'bokeh>=0.12.2',
-        'pyserial>=2.7',
+        'pyserial>=3.0',
         'numpy>=1.9.1',
         'scipy>=0.15.1',
     ],
@@ -0,0 +1,110 @@
+import time
+import unittest
+
+import numpy as np
+
+from olimex.acquisition import BackgroundReader, RingBuffer
+from olimex.constants import PACKET_SIZE
+from olimex.exg import PacketStreamReader
+from olimex.mock import packet_generator, FakeSerialByteArray, ReplaySerial, synthetic_stream
+
+
+def make_chunk(start, num_packets):
+    values = np.arange(start, start + num_packets).repeat(6).reshape(-1, 6)
+    counts = np.arange(start, start + num_packets, dtype=np.uint8)
+    versions = np.full(num_packets, 2, dtype=np.uint8)
+    switches = np.ones(num_packets, dtype=np.uint8)
+    return values, counts, versions, switches
+
+
+class RingBufferTestCase(unittest.TestCase):
+    def test_read_write(self):
+        ring = RingBuffer(8)
+        ring.write(*make_chunk(0, 5))
+        values, counts, _, _ = ring.read(max_packets=3)
+        self.assertEqual([0, 1, 2], values[:, 0].tolist())
+        # wraps around the end of the buffer
+        ring.write(*make_chunk(5, 5))
+        values, counts, _, _ = ring.read()
+        self.assertEqual(list(range(3, 10)), values[:, 0].tolist())
+        self.assertEqual(list(range(3, 10)), counts.tolist())
+        self.assertEqual(0, len(ring.read()[0]))
+        self.assertEqual(0, ring.overflow_count)
+
+    def test_overflow(self):
+        ring = RingBuffer(8)
+        ring.write(*make_chunk(0, 6))
+        ring.write(*make_chunk(6, 6))
+        self.assertEqual(4, ring.overflow_count)
+        values, _, _, _ = ring.read()
+        self.assertEqual(list(range(4, 12)), values[:, 0].tolist())
+
+        ring.write(*make_chunk(12, 20))
+        self.assertEqual(16, ring.overflow_count)
+        values, _, _, _ = ring.read()
+        self.assertEqual(list(range(24, 32)), values[:, 0].tolist())
+
+    def test_arrival(self):
+        ring = RingBuffer(8)
+        ring.write(*make_chunk(0, 5), arrival=1.0)
+        ring.write(*make_chunk(5, 2), arrival=2.0)
+        ring.read(max_packets=3)
+        self.assertEqual(1.0, ring.last_arrival)
+        # Packets left over by a partial read keep their arrival.
+        ring.read(max_packets=3)
+        self.assertEqual(1.0, ring.last_arrival)
+        ring.write(*make_chunk(7, 4), arrival=3.0)
+        ring.read()
+        self.assertEqual(2.0, ring.last_arrival)
+        self.assertEqual(0, len(ring._arrivals))
+
+        # Overflowed packets take their arrival with them.
+        ring.write(*make_chunk(11, 8), arrival=4.0)
+        ring.write(*make_chunk(19, 4), arrival=5.0)
+        ring.read()
+        self.assertEqual(4.0, ring.last_arrival)
+
+    def test_clear(self):
+        ring = RingBuffer(8)
+        ring.write(*make_chunk(0, 5))
+        ring.clear()
+        self.assertEqual(0, len(ring))
+        ring.write(*make_chunk(5, 2))
+        self.assertEqual([5, 6], ring.read()[0][:, 0].tolist())
+
+
+class BackgroundReaderTestCase(unittest.TestCase):
+    def test_read_chunk(self):
+        packet_gen = packet_generator()
+        byte_array = bytearray()
+        for _ in range(100):
+            byte_array.extend(next(packet_gen))
+
+        reader = PacketStreamReader(FakeSerialByteArray(byte_array))
+        counts = []
+        start = time.perf_counter()
+        with BackgroundReader(reader) as background_reader:
+            deadline = time.perf_counter() + 5
+            while len(counts) < 100 and time.perf_counter() < deadline:
+                counts.extend(background_reader.read_chunk()[1].tolist())
+                time.sleep(0.001)
+        self.assertEqual(list(range(100)), counts)
+        # Arrival times are handed on to the consumer.
+        self.assertGreaterEqual(background_reader.last_arrival, start)
+
+    def test_seek(self):
+        stream = synthetic_stream(1000, seed=0)
+        reader = PacketStreamReader(ReplaySerial(stream, speed=None))
+        with BackgroundReader(reader) as background_reader:
+            deadline = time.perf_counter() + 5
+            while not len(background_reader.buffer) and time.perf_counter() < deadline:
+                time.sleep(0.001)
+            background_reader.seek(900 * PACKET_SIZE)
+            self.assertEqual(1, background_reader.seek_count)
+            counts = []
+            while len(counts) < 100 and time.perf_counter() < deadline:
+                counts.extend(background_reader.read_chunk()[1].tolist())
+                time.sleep(0.001)
+        # Only packets from after the seek are handed on.
+        self.assertEqual([count % 256 for count in range(900, 1000)], counts)
+        self.assertEqual(0, reader.dropped_count)
@@ -0,0 +1,70 @@
+import asyncio
+import os
+import unittest
+
+import serial
+
+from olimex.aio import AsyncPacketStreamReader
+from olimex.constants import PACKET_SLICES
+from olimex.mock import packet_generator, FakeSerialByteArray
+from olimex.utils import calculate_values_from_packet_data
+
+
+def make_stream(num_packets, noise=b'\x00\x01\x02'):
+    packet_gen = packet_generator()
+    packets = [next(packet_gen) for _ in range(num_packets)]
+    values = [calculate_values_from_packet_data(packet[PACKET_SLICES['data']])
+              for packet in packets]
+    return bytes(noise) + b''.join(packets), values
+
+
+class AsyncPacketStreamReaderTestCase(unittest.TestCase):
+    def run_async(self, coroutine):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        return loop.run_until_complete(asyncio.wait_for(coroutine, 10))
+
+    def test_fake_serial(self):
+        byte_array, expected = make_stream(30)
+        reader = AsyncPacketStreamReader(FakeSerialByteArray(bytearray(byte_array)),
+                                         poll_interval=0)
+
+        async def read_all():
+            return [values async for values in reader]
+
+        self.assertEqual(expected, self.run_async(read_all()))
+
+    def test_many_ptys(self):
+        streams = [make_stream(50) for _ in range(4)]
+        masters, readers = [], []
+        for _ in streams:
+            master, slave = os.openpty()
+            self.addCleanup(os.close, master)
+            port = serial.Serial(os.ttyname(slave), timeout=0)
+            os.close(slave)
+            masters.append(master)
+            readers.append(AsyncPacketStreamReader(port))
+
+        async def read(reader, num_packets):
+            values = []
+            while len(values) < num_packets:
+                chunk = await reader.read_chunk_async()
+                values.extend(chunk[0].tolist())
+            return values
+
+        async def write():
+            # Dribble the streams out in pieces to exercise partial reads.
+            for start in range(0, len(streams[0][0]), 40):
+                for master, (byte_array, _) in zip(masters, streams):
+                    os.write(master, byte_array[start:start + 40])
+                await asyncio.sleep(0.001)
+
+        async def run():
+            results = asyncio.gather(*(read(reader, len(expected))
+                                       for reader, (_, expected) in zip(readers, streams)))
+            await write()
+            return await results
+
+        results = self.run_async(run())
+        for values, (_, expected) in zip(results, streams):
+            self.assertEqual(expected, values)
@@ -0,0 +1,68 @@
+import io
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+from olimex.batch import FIELDS, analyze, analyze_all, find_recordings, write_table
+from olimex.recording import Recording, convert
+from olimex.utils import get_mock_data_list
+
+MOCK_DATA_DIR, _ = get_mock_data_list()
+
+
+class BatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        for name in ('nsr.bin', 's-tach.bin'):
+            shutil.copy(os.path.join(MOCK_DATA_DIR, name), self.tmp_dir)
+        self.paths = find_recordings([self.tmp_dir])
+
+    def test_analyze(self):
+        summary = analyze(self.paths[0])
+        self.assertIsNone(summary['error'])
+        self.assertEqual(6331, summary['packets'])
+        self.assertEqual(46, summary['dropped'])
+        self.assertEqual(373, summary['duplicates'])
+        self.assertAlmostEqual(72, summary['heart_rate_bpm'], delta=2)
+        self.assertLess(summary['ch1_min'], summary['ch1_mean'])
+
+        # A recording converted from the capture gives the same summary.
+        converted = analyze(convert(self.paths[0]))
+        del summary['file'], converted['file']
+        self.assertEqual(summary, converted)
+
+    def test_missing_file(self):
+        summary = analyze(os.path.join(self.tmp_dir, 'missing.bin'))
+        self.assertIsNotNone(summary['error'])
+        self.assertIsNone(summary['packets'])
+
+    def test_corrupt_chunk(self):
+        path = convert(self.paths[0], compression='zlib')
+        with Recording(path) as recording:
+            offset = int(recording.chunks['offset'][0])
+        with open(path, 'r+b') as fd:
+            fd.seek(offset)
+            fd.write(b'\xff' * 8)
+
+        summary = analyze(path)
+        self.assertIn('corrupt', summary['error'])
+        # The other files are still analysed.
+        summaries = list(analyze_all(self.paths + [path], jobs=1))
+        self.assertEqual([None, None], [summary['error'] for summary in summaries[:2]])
+        self.assertIsNotNone(summaries[2]['error'])
+
+    def test_analyze_all(self):
+        self.assertEqual(['nsr.bin', 's-tach.bin'],
+                         [os.path.basename(path) for path in self.paths])
+        summaries = list(analyze_all(self.paths, jobs=2))
+        self.assertEqual(list(analyze_all(self.paths, jobs=1)), summaries)
+
+        fd = io.StringIO()
+        write_table(summaries, fd)
+        fd.seek(0)
+        rows = list(csv.DictReader(fd))
+        self.assertEqual(list(FIELDS), list(rows[0]))
+        self.assertEqual(self.paths, [row['file'] for row in rows])
@@ -0,0 +1,26 @@
+import unittest
+
+from benchmarks.run import BENCHMARKS, compare
+
+
+class BenchmarksTestCase(unittest.TestCase):
+    def test_benchmarks_run(self):
+        for name, benchmark in BENCHMARKS.items():
+            func, units_per_call, unit = benchmark()
+            func()
+            self.assertGreater(units_per_call, 0, name)
+
+    def test_compare(self):
+        history = [
+            {'machine': 'a', 'results': {'sync_clean': 1.0}},
+            {'machine': 'a', 'results': {'sync_clean': 3.0, 'decode_batched': 1.0}},
+            {'machine': 'a', 'results': {'sync_clean': 2.0}},
+            {'machine': 'b', 'results': {'sync_clean': 100.0}},
+        ]
+        results = {
+            'sync_clean': {'seconds': 3.0},
+            'decode_batched': {'seconds': 0.5},
+            'gui_frame_1_channel': {'seconds': 1.0},
+        }
+        ratios = compare(results, history, machine='a')
+        self.assertEqual({'sync_clean': 1.5, 'decode_batched': 0.5}, dict(ratios))
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from olimex.capture import CaptureWriter, capture
+from olimex.constants import PACKET_SIZE
+from olimex.mock import packet_generator
+from olimex.utils import SYNC
+
+
+class FakeSerialChunks:
+    """
+    Return the given chunks from read(), then interrupt like Ctrl-C.
+    """
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+
+    def read(self, n=1):
+        if not self._chunks:
+            raise KeyboardInterrupt
+        return self._chunks.pop(0)
+
+
+class CaptureWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, 'session.bin')
+
+        packet_gen = packet_generator()
+        packets = [next(packet_gen) for _ in range(200)]
+        del packets[50]  # dropped packet
+        self.data = b''.join(packets)
+        # Reads that don't line up with packets
+        self.chunks = [self.data[start:start + 100] for start in range(0, len(self.data), 100)]
+
+    def read_paths(self, paths):
+        data = b''
+        for path in paths:
+            with open(path, 'rb') as fd:
+                data += fd.read()
+        return data
+
+    def test_write(self):
+        with CaptureWriter(self.path, validate=True) as writer:
+            self.assertEqual(len(self.data), capture(FakeSerialChunks(self.chunks), writer))
+        self.assertEqual([self.path], writer.paths)
+        self.assertEqual(self.data, self.read_paths(writer.paths))
+        self.assertEqual(199, writer.packet_count)
+        self.assertEqual(1, writer.reader.dropped_count)
+
+    def test_rotate_by_size(self):
+        with CaptureWriter(self.path, max_bytes=1000) as writer:
+            for chunk in self.chunks:
+                writer.write(chunk)
+        self.assertEqual(4, len(writer.paths))
+        self.assertEqual(os.path.join(self.tmp_dir, 'session-0001.bin'), writer.paths[0])
+        self.assertEqual(self.data, self.read_paths(writer.paths))
+        for path in writer.paths:
+            data = self.read_paths([path])
+            # Files start and end on packet boundaries.
+            self.assertTrue(data.startswith(SYNC))
+            self.assertEqual(0, len(data) % PACKET_SIZE)
+
+    def test_rotate_by_duration(self):
+        with CaptureWriter(self.path, max_seconds=0) as writer:
+            for chunk in self.chunks[:5]:
+                writer.write(chunk)
+        # A new file for each read after the first
+        self.assertEqual(5, len(writer.paths))
+        self.assertEqual(self.data[:500], self.read_paths(writer.paths))
+
+        # Later captures don't overwrite earlier ones.
+        with CaptureWriter(self.path, max_seconds=0) as writer:
+            writer.write(self.chunks[0])
+        self.assertEqual(os.path.join(self.tmp_dir, 'session-0006.bin'), writer.paths[0])
+
+    def test_synced_before_close(self):
+        writer = CaptureWriter(self.path, fsync_interval=0)
+        writer.write(self.data)
+        # Data is on disk without closing the writer.
+        self.assertEqual(self.data, self.read_paths([self.path]))
+        writer.close()
+
+    def test_synced_while_idle(self):
+        writer = CaptureWriter(self.path, fsync_interval=3600)
+        writer.write(self.data)
+        self.assertEqual(b'', self.read_paths([self.path]))
+        writer.fsync_interval = 0
+        # The port goes quiet. Data written before is synced anyway.
+        capture(FakeSerialChunks([b'']), writer)
+        self.assertEqual(self.data, self.read_paths([self.path]))
+        writer.close()
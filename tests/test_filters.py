@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+
+from olimex.constants import NUMCHANNELS, SAMPLE_FREQUENCY
+from olimex.filters import FilterBank
+
+
+class FilterBankTestCase(unittest.TestCase):
+    def setUp(self):
+        t = np.arange(20 * SAMPLE_FREQUENCY) / SAMPLE_FREQUENCY
+        signal = 100 * np.sin(2 * np.pi * 5 * t)
+        self.signal = np.column_stack([signal] * NUMCHANNELS)
+        wander = 200 * np.sin(2 * np.pi * 0.05 * t) + 512
+        hum = 50 * np.sin(2 * np.pi * 60 * t)
+        self.samples = self.signal + (wander + hum)[:, np.newaxis]
+
+    def test_filter(self):
+        filtered = FilterBank().filter(self.samples)
+        self.assertEqual(self.samples.shape, filtered.shape)
+        # After settling, what's left is the 5 Hz signal.
+        settled = slice(5 * SAMPLE_FREQUENCY, None)
+        error = filtered[settled] - self.signal[settled]
+        self.assertLess(np.abs(error).max() / 100, 0.2)
+
+    def test_chunk_size(self):
+        expected = FilterBank(notch=50).filter(self.samples)
+        for chunk_size in (1, 5, 17, 1000):
+            filter_bank = FilterBank(notch=50)
+            filtered = np.concatenate([
+                filter_bank.filter(self.samples[start:start + chunk_size])
+                for start in range(0, len(self.samples), chunk_size)])
+            np.testing.assert_array_equal(expected, filtered)
+
+    def test_disabled_filters(self):
+        filter_bank = FilterBank(highpass=None, notch=None, lowpass=30)
+        self.assertEqual(1, len(filter_bank.sos))
+        with self.assertRaises(ValueError):
+            FilterBank(highpass=None, notch=None, lowpass=None)
+
+    def test_num_channels(self):
+        filter_bank = FilterBank(num_channels=2)
+        self.assertEqual((3, 2), filter_bank.filter(np.zeros((3, 2))).shape)
+        with self.assertRaises(ValueError):
+            filter_bank.filter(self.samples)
+        with self.assertRaises(ValueError):
+            filter_bank.filter(np.zeros(3))
@@ -0,0 +1,119 @@
+import unittest
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from olimex.exg import MAX_READ_SIZE, PacketStreamReader
+from olimex.filters import FilterBank
+from olimex.gui import MAX_PACKETS_PER_REFRESH, StripBuffer, axes_updater, get_new_data_points
+from olimex.mock import packet_generator, FakeSerialByteArray, ReplaySerial, synthetic_stream
+from olimex.tracing import LatencyTracer
+
+
+class StripBufferTestCase(unittest.TestCase):
+    def test_write(self):
+        strip = StripBuffer(length=12, num_channels=2, dots_per_sample=2, gap=3)
+        strip.write(np.array([[1, 10], [2, 20], [3, 30], [4, 40]]))
+        self.assertEqual(8, strip.head)
+        self.assertEqual([1, 1, 2, 2, 3, 3, 4, 4], strip.ydata[0, :8].tolist())
+        self.assertEqual([10, 10, 20, 20, 30, 30, 40, 40], strip.ydata[1, :8].tolist())
+        self.assertTrue(np.isnan(strip.ydata[:, 8:11]).all())
+
+        # wraps around the end of the strip, gap included
+        strip.write(np.array([[5, 50], [6, 60], [7, 70]]))
+        self.assertEqual(2, strip.head)
+        self.assertEqual([7, 7], strip.ydata[0, :2].tolist())
+        self.assertEqual([5, 5, 6, 6], strip.ydata[0, 8:].tolist())
+        self.assertTrue(np.isnan(strip.ydata[:, 2:5]).all())
+        self.assertEqual([3, 4, 4], strip.ydata[0, 5:8].tolist())
+
+    def test_write_more_than_length(self):
+        strip = StripBuffer(length=6, num_channels=1, dots_per_sample=2, gap=0)
+        strip.write(np.arange(5).reshape(-1, 1))
+        self.assertEqual([2, 2, 3, 3, 4, 4], strip.ydata[0].tolist())
+        self.assertEqual(0, strip.head)
+
+
+class GetNewDataPointsTestCase(unittest.TestCase):
+    def test_max_packets(self):
+        stream = synthetic_stream(5 * MAX_PACKETS_PER_REFRESH, seed=0)
+        # Everything is waiting at once.
+        reader = PacketStreamReader(ReplaySerial(stream, speed=None))
+        new_data_gen = get_new_data_points(reader)
+        self.assertEqual(MAX_PACKETS_PER_REFRESH, len(next(new_data_gen)))
+        self.assertLessEqual(len(reader._buffer), MAX_READ_SIZE)
+        num_packets = MAX_PACKETS_PER_REFRESH
+        while num_packets < 5 * MAX_PACKETS_PER_REFRESH:
+            num_packets += len(next(new_data_gen))
+        self.assertEqual(0, len(next(new_data_gen)))
+
+
+class AxesUpdaterTestCase(unittest.TestCase):
+    def test_all_channels(self):
+        packet_gen = packet_generator()
+        packets = [next(packet_gen) for _ in range(5)]
+        reader = PacketStreamReader(FakeSerialByteArray(bytearray(b''.join(packets))))
+        values, _, _, _ = PacketStreamReader(
+            FakeSerialByteArray(bytearray(b''.join(packets)))).read_chunk()
+
+        axes = Figure().add_subplot()
+        updater = axes_updater(axes, reader, strip_length=100, num_channels=6)
+        *lines, heart_rate_text = next(updater)
+        self.assertEqual(6, len(lines))
+        next(updater)
+        for channel, line in enumerate(lines):
+            ydata = line.get_ydata()
+            self.assertEqual(values[:, channel].repeat(2).tolist(), ydata[:10].tolist())
+
+    def test_spectrogram(self):
+        packet_gen = packet_generator()
+        packets = [next(packet_gen) for _ in range(300)]
+        reader = PacketStreamReader(FakeSerialByteArray(bytearray(b''.join(packets))))
+
+        figure = Figure()
+        axes, spectrogram_axes = figure.subplots(2)
+        updater = axes_updater(axes, reader, strip_length=100,
+                               spectrogram_axes=spectrogram_axes)
+        line, heart_rate_text, image, median_text = next(updater)
+        self.assertEqual('', median_text.get_text())
+        # The first spectrum is ready after one window of samples.
+        for _ in range(100):
+            next(updater)
+        self.assertTrue(median_text.get_text().endswith('Hz'))
+        self.assertEqual(0, image.get_array()[:, 0].max())
+
+    def test_seek(self):
+        reader = PacketStreamReader(ReplaySerial(synthetic_stream(2000, seed=0), speed=None))
+        filter_bank = FilterBank()
+        updater = axes_updater(Figure().add_subplot(), reader, strip_length=100,
+                               filter_bank=filter_bank)
+        _, heart_rate_text = next(updater)
+        next(updater)
+        self.assertTrue(heart_rate_text.get_text().endswith('bpm'))
+        self.assertIsNotNone(filter_bank._state)
+
+        # Jump to the end of the recording, where there's nothing to read.
+        reader.seek(10 ** 6)
+        next(updater)
+        # Neither beats nor filter state carry over the jump.
+        self.assertEqual('', heart_rate_text.get_text())
+        self.assertIsNone(filter_bank._state)
+
+    def test_tracer(self):
+        reader = PacketStreamReader(ReplaySerial(synthetic_stream(50, seed=0), speed=None))
+        tracer = LatencyTracer()
+        figure = Figure()
+        FigureCanvasAgg(figure)
+        axes = figure.add_subplot()
+        updater = axes_updater(axes, reader, strip_length=100, tracer=tracer)
+        *_, stamp = next(updater)
+        next(updater)
+        # Drawn last, as by a blitting FuncAnimation
+        axes.draw_artist(stamp)
+        # No packets are left, so the next refresh isn't traced.
+        next(updater)
+        axes.draw_artist(stamp)
+        self.assertEqual(1, tracer.batch_count)
+        total = tracer.latencies()['total']
+        self.assertGreater(total[0], 0)
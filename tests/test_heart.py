@@ -0,0 +1,77 @@
+import os
+import unittest
+
+import numpy as np
+
+from olimex.exg import PacketStreamReader
+from olimex.heart import QRSDetector
+from olimex.mock import FakeSerialFile
+from olimex.utils import calculate_heart_rate, get_mock_data_list
+
+MOCK_DATA_DIR, _ = get_mock_data_list()
+
+
+def load_mock_data(name):
+    serial = FakeSerialFile(os.path.join(MOCK_DATA_DIR, name))
+    reader = PacketStreamReader(serial)
+    chunks = []
+    while True:
+        values, *_ = reader.read_chunk()
+        if not len(values):
+            break
+        chunks.append(values)
+    serial.close()
+    return np.concatenate(chunks)
+
+
+def detect(values, chunk_size):
+    detector = QRSDetector()
+    peak_times = []
+    for start in range(0, len(values), chunk_size):
+        peak_times.extend(detector.update(values[start:start + chunk_size]))
+    return detector, np.array(peak_times)
+
+
+class QRSDetectorTestCase(unittest.TestCase):
+    def assert_heart_rate(self, name, heart_rate, tolerance=1):
+        values = load_mock_data(name)
+        detector, peak_times = detect(values, 5)
+        rr_intervals = np.diff(peak_times)
+        self.assertAlmostEqual(heart_rate, 60 / rr_intervals.mean(), delta=tolerance)
+        self.assertAlmostEqual(heart_rate, detector.heart_rate, delta=tolerance)
+        self.assertLess(rr_intervals.std() / rr_intervals.mean(), 0.05)
+
+    def test_nsr(self):
+        self.assert_heart_rate('nsr.bin', 72)
+
+    def test_s_brady(self):
+        self.assert_heart_rate('s-brady.bin', 40.5)
+
+    def test_s_tach(self):
+        self.assert_heart_rate('s-tach.bin', 120)
+
+    def test_afib(self):
+        values = load_mock_data('afib.bin')
+        _, peak_times = detect(values, 5)
+        rr_intervals = np.diff(peak_times)
+        # irregularly irregular, and fast
+        self.assertGreater(rr_intervals.std() / rr_intervals.mean(), 0.15)
+        self.assertTrue(120 < 60 / rr_intervals.mean() < 180)
+
+    def test_asystole(self):
+        values = load_mock_data('asys.bin')
+        detector, peak_times = detect(values, 5)
+        self.assertEqual(0, len(peak_times))
+        self.assertIsNone(detector.heart_rate)
+
+    def test_chunk_size(self):
+        values = load_mock_data('afib.bin')
+        _, expected = detect(values, len(values))
+        for chunk_size in (1, 3, 17):
+            _, peak_times = detect(values, chunk_size)
+            self.assertEqual(expected.tolist(), peak_times.tolist())
+
+    def test_calculate_heart_rate(self):
+        values = load_mock_data('nsr.bin')
+        self.assertAlmostEqual(72, calculate_heart_rate(values[:, 0]), delta=1)
+        self.assertIsNone(calculate_heart_rate(values[:100, 0]))
@@ -0,0 +1,53 @@
+import json
+import subprocess
+import sys
+import unittest
+
+# Modules that must import without pulling in any of HEAVY_MODULES
+LIGHTWEIGHT_MODULES = (
+    'olimex.batch',
+    'olimex.capture',
+    'olimex.exg',
+    'olimex.gui',
+    'olimex.ports',
+    'olimex.recording',
+    'olimex.utils',
+)
+HEAVY_MODULES = ('bokeh', 'matplotlib', 'pip', 'scipy', 'tkinter')
+# Seconds each lightweight module may take to import, numpy included.
+# Measured at about 0.15 s; scipy.signal alone takes about 1 s.
+IMPORT_TIME_BUDGET = 0.5
+
+
+def run_python(code, *options):
+    return subprocess.run([sys.executable] + list(options) + ['-c', code],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+
+
+def import_time(module):
+    """
+    Return the seconds taken to import ``module`` in a new interpreter.
+    """
+    result = run_python('import {}'.format(module), '-X', 'importtime')
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e6
+    raise AssertionError('no import time reported for {}'.format(module))
+
+
+class ImportTestCase(unittest.TestCase):
+    def test_no_heavy_imports(self):
+        for module in LIGHTWEIGHT_MODULES:
+            with self.subTest(module=module):
+                result = run_python('import json, sys, {}; print(json.dumps(sorted(sys.modules)))'
+                                    .format(module))
+                loaded = set(name.split('.')[0] for name in json.loads(result.stdout))
+                self.assertEqual(set(), loaded.intersection(HEAVY_MODULES))
+
+    def test_import_time_budget(self):
+        for module in LIGHTWEIGHT_MODULES:
+            with self.subTest(module=module):
+                self.assertLess(import_time(module), IMPORT_TIME_BUDGET)
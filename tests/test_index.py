@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from olimex.constants import PACKET_SIZE, SAMPLE_FREQUENCY
+from olimex.exg import PacketStreamReader
+from olimex.index import INDEX_SUFFIX, PacketIndex
+from olimex.mock import packet_generator, FakeSerialFile
+
+
+class PacketIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, 'recording.bin')
+
+        packet_gen = packet_generator()
+        self.packets = [next(packet_gen) for _ in range(300)]
+        del self.packets[100]  # dropped packet
+        byte_array = bytearray(b'\x00\x01\x02')  # leading noise
+        for i, packet in enumerate(self.packets):
+            if i == 200:
+                byte_array.extend(b'\xff' * 4)  # noise mid-stream
+            byte_array.extend(packet)
+        with open(self.path, 'wb') as fd:
+            fd.write(byte_array)
+
+    def test_build(self):
+        index = PacketIndex.for_file(self.path)
+        self.assertEqual(len(self.packets), len(index))
+        self.assertEqual(3, index.offsets[0])
+        self.assertEqual(3 + 199 * PACKET_SIZE, index.offsets[199])
+        self.assertEqual(7 + 200 * PACKET_SIZE, index.offsets[200])
+        self.assertEqual([0, 200], index.resyncs.tolist())
+        self.assertEqual([100], index.gaps.tolist())
+        self.assertEqual(list(range(100)) + list(range(101, 300)), index.samples.tolist())
+        self.assertEqual(300 / SAMPLE_FREQUENCY, index.duration)
+        self.assertTrue(os.path.exists(self.path + INDEX_SUFFIX))
+
+    def test_cache(self):
+        index = PacketIndex.for_file(self.path)
+        cached = PacketIndex.for_file(self.path)
+        self.assertEqual(index.offsets.tolist(), cached.offsets.tolist())
+
+        # Changing the recording invalidates the cached index.
+        with open(self.path, 'ab') as fd:
+            fd.write(self.packets[0])
+        rebuilt = PacketIndex.for_file(self.path)
+        self.assertEqual(len(index) + 1, len(rebuilt))
+
+    def test_seek(self):
+        index = PacketIndex.for_file(self.path)
+        serial = FakeSerialFile(self.path)
+        reader = PacketStreamReader(serial)
+        # Packet 100 was dropped, so sample 250 is the 250th packet recorded.
+        reader.seek(index.offset_at_time(250 / SAMPLE_FREQUENCY))
+        self.assertEqual(self.packets[249], reader._get_next_packet())
+        # The time of the dropped packet goes to the packet after it.
+        reader.seek(index.offset_at_time(100 / SAMPLE_FREQUENCY))
+        self.assertEqual(self.packets[100], reader._get_next_packet())
+        reader.seek(index.offset_at_time(10 ** 6))
+        self.assertEqual(self.packets[-1], reader._get_next_packet())
+        serial.close()
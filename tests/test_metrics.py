@@ -0,0 +1,89 @@
+import json
+import unittest
+
+from olimex.constants import PACKET_SIZE
+from olimex.exg import PacketStreamReader
+from olimex.metrics import LATENCY_BUCKETS, ReaderMetrics
+from olimex.mock import ReplaySerial, synthetic_stream
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ReaderMetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.metrics = ReaderMetrics(clock=self.clock)
+
+    def test_read_latency(self):
+        self.assertIsNone(self.metrics.read_latency_percentile(50))
+        for _ in range(98):
+            self.metrics.record_read(17, 3e-6)
+        self.metrics.record_read(0, 1e-3)
+        self.metrics.record_read(0, 5)
+        self.assertEqual(100, self.metrics.reads)
+        # Polls with nothing waiting aren't empty polls by themselves.
+        self.assertEqual(0, self.metrics.empty_polls)
+        self.metrics.record_empty_poll()
+        self.assertEqual(1, self.metrics.empty_polls)
+        self.assertEqual(98 * 17, self.metrics.bytes_read)
+        # 3us falls in the bucket up to 4us.
+        self.assertEqual(4e-6, self.metrics.read_latency_percentile(50))
+        self.assertEqual(2 ** 10 * 1e-6, self.metrics.read_latency_percentile(99))
+        # Past the last bucket, the longest latency seen
+        self.assertEqual(5, self.metrics.read_latency_percentile(100))
+        self.assertEqual(len(LATENCY_BUCKETS) + 1, len(self.metrics.read_latency_counts))
+
+    def test_packets_per_second(self):
+        for second in range(1, 31):
+            # 100 packets/s for 20 s, then 50 packets/s
+            self.metrics.packets += 100 if second <= 20 else 50
+            self.clock.now = second
+            self.metrics.record_read(PACKET_SIZE, 1e-6)
+        # Only the last 10 seconds count.
+        self.assertAlmostEqual(50, self.metrics.packets_per_second)
+        # Memory use doesn't grow with time.
+        self.assertLessEqual(len(self.metrics._rate_samples), 11)
+
+    def test_snapshot(self):
+        self.metrics.record_read(PACKET_SIZE, 1e-6)
+        self.clock.now = 2
+        snapshot = json.loads(json.dumps(self.metrics.snapshot()))
+        self.assertEqual(2, snapshot['elapsed'])
+        self.assertEqual(PACKET_SIZE, snapshot['bytes_read'])
+        self.assertEqual(1, sum(snapshot['read_latency_histogram']['counts']))
+
+        self.metrics.reset()
+        self.assertEqual(0, self.metrics.snapshot()['bytes_read'])
+        self.assertEqual(0, self.metrics.elapsed)
+
+
+class PacketStreamReaderMetricsTestCase(unittest.TestCase):
+    def test_reader_metrics(self):
+        stream = synthetic_stream(100, seed=0)
+        middle = 50 * PACKET_SIZE
+        # Noise before the first packet and in the middle of the stream
+        data = b'\x00' * 5 + stream[:middle] + b'\x00' * 3 + stream[middle:]
+        reader = PacketStreamReader(ReplaySerial(data, speed=None))
+        values, _, _, _ = reader.read_chunk()
+        self.assertEqual(100, len(values))
+
+        metrics = reader.metrics
+        self.assertEqual(100, metrics.packets)
+        self.assertEqual(len(data), metrics.bytes_read)
+        self.assertEqual(8, metrics.bytes_discarded)
+        # Noise before the first packet isn't a resync.
+        self.assertEqual(1, metrics.resyncs)
+        self.assertEqual(1, reader.resync_count)
+
+        # Packets were waiting, so the poll ending the read isn't empty.
+        self.assertEqual(0, metrics.empty_polls)
+        values, _, _, _ = reader.read_chunk()
+        self.assertEqual(0, len(values))
+        self.assertEqual(1, metrics.empty_polls)
+        self.assertEqual(metrics.reads, sum(metrics.read_latency_counts))
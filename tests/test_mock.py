@@ -0,0 +1,141 @@
+import unittest
+
+import numpy as np
+
+from olimex.constants import NUMCHANNELS, PACKET_SIZE, SAMPLE_FREQUENCY
+from olimex.exg import PacketStreamReader
+from olimex.heart import QRSDetector
+from olimex.index import PacketIndex
+from olimex.mock import (FakeSerialByteArray, ReplaySerial, synthetic_chunks, synthetic_ecg,
+                         synthetic_emg, synthetic_stream)
+from olimex.utils import calculate_values_from_packets, encode_packets
+
+
+class SyntheticStreamTestCase(unittest.TestCase):
+    def test_encode_packets(self):
+        values = np.random.RandomState(0).randint(1, 1025, (300, NUMCHANNELS))
+        counts = np.arange(300)
+        decoded, decoded_counts, versions, switches = calculate_values_from_packets(
+            encode_packets(values, counts))
+        np.testing.assert_array_equal(values, decoded)
+        np.testing.assert_array_equal(counts % 256, decoded_counts)
+        self.assertEqual({2}, set(versions))
+        self.assertEqual({1}, set(switches))
+
+    def test_ecg(self):
+        for heart_rate in (40, 72, 150):
+            values = synthetic_ecg(60 * SAMPLE_FREQUENCY, heart_rate=heart_rate, noise=5)
+            self.assertEqual((60 * SAMPLE_FREQUENCY, NUMCHANNELS), values.shape)
+            self.assertTrue(((values >= 1) & (values <= 1024)).all())
+            detector = QRSDetector()
+            detector.update(values)
+            self.assertAlmostEqual(heart_rate, detector.heart_rate, delta=1)
+
+    def test_emg(self):
+        values = synthetic_emg(20 * SAMPLE_FREQUENCY, contraction_rate=30,
+                               random_state=np.random.RandomState(0))
+        # Active for the first half of every two seconds
+        active = values[:SAMPLE_FREQUENCY // 2, 0].std()
+        resting = values[int(1.5 * SAMPLE_FREQUENCY):2 * SAMPLE_FREQUENCY, 0].std()
+        self.assertGreater(active, 10 * resting)
+
+    def test_stream(self):
+        stream = synthetic_stream(1000, seed=0)
+        self.assertEqual(1000 * PACKET_SIZE, len(stream))
+        self.assertEqual(stream, synthetic_stream(1000, seed=0))
+        reader = PacketStreamReader(FakeSerialByteArray(stream))
+        values, counts, _, _ = reader.read_chunk(1)
+        self.assertEqual(0, counts[0])
+
+    def test_faults(self):
+        stream = synthetic_stream(10000, seed=0, drop_rate=0.01)
+        index = PacketIndex.build(stream)
+        self.assertAlmostEqual(9900, len(index), delta=50)
+        self.assertEqual(0, len(index.resyncs))
+        self.assertGreater(len(index.gaps), 50)
+
+        stream = synthetic_stream(10000, seed=0, false_sync_rate=0.01)
+        index = PacketIndex.build(stream)
+        self.assertEqual(10000, len(index))
+        self.assertAlmostEqual(100, len(index.resyncs), delta=30)
+
+        stream = synthetic_stream(10000, seed=0, corrupt_rate=0.001)
+        self.assertEqual(10000 * PACKET_SIZE, len(stream))
+        self.assertNotEqual(synthetic_stream(10000, seed=0), stream)
+
+    def test_chunks(self):
+        chunks = synthetic_chunks(chunk_packets=100, seed=0)
+        stream = next(chunks) + next(chunks)
+        _, counts, _, _ = calculate_values_from_packets(stream)
+        np.testing.assert_array_equal(np.arange(200), counts)
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 100.0
+
+    def __call__(self):
+        return self.time
+
+
+class ReplaySerialTestCase(unittest.TestCase):
+    def setUp(self):
+        self.stream = synthetic_stream(10 * SAMPLE_FREQUENCY, seed=0)
+        self.clock = FakeClock()
+        self.serial = ReplaySerial(self.stream, timeout=0, clock=self.clock)
+
+    def test_real_time(self):
+        self.assertEqual(0, self.serial.inWaiting())
+        self.clock.time += 1
+        self.assertEqual(SAMPLE_FREQUENCY * PACKET_SIZE, self.serial.inWaiting())
+        self.assertEqual(self.stream[:100], self.serial.read(100))
+        self.assertEqual(SAMPLE_FREQUENCY * PACKET_SIZE - 100, self.serial.inWaiting())
+
+        # Reads return what has been released, however often they poll.
+        reader = PacketStreamReader(self.serial)
+        self.clock.time += 1
+        values, counts, _, _ = reader.read_chunk()
+        self.assertEqual(2 * SAMPLE_FREQUENCY - 6, len(values))
+
+        self.clock.time += 100
+        self.assertEqual(len(self.stream) - 2 * SAMPLE_FREQUENCY * PACKET_SIZE,
+                         len(self.serial.read(10 ** 6)))
+        self.assertTrue(self.serial.at_end)
+
+    def test_speed(self):
+        self.serial.speed = 4
+        self.clock.time += 0.5
+        self.assertEqual(2 * SAMPLE_FREQUENCY * PACKET_SIZE, self.serial.inWaiting())
+        self.serial.speed = 1
+        self.clock.time += 0.4
+        self.assertEqual(2.4 * SAMPLE_FREQUENCY * PACKET_SIZE, self.serial.inWaiting())
+
+        serial = ReplaySerial(self.stream, speed=None, clock=self.clock)
+        self.assertEqual(self.stream, serial.read(len(self.stream)))
+        # 0 plays back as fast as possible too.
+        serial = ReplaySerial(self.stream, speed=0, clock=self.clock)
+        self.assertIsNone(serial.speed)
+        self.assertEqual(self.stream, serial.read(len(self.stream)))
+
+    def test_pause(self):
+        self.clock.time += 1
+        self.serial.pause()
+        self.clock.time += 10
+        self.assertEqual(SAMPLE_FREQUENCY * PACKET_SIZE, self.serial.inWaiting())
+        self.serial.resume()
+        self.clock.time += 1
+        self.assertEqual(2 * SAMPLE_FREQUENCY * PACKET_SIZE, self.serial.inWaiting())
+
+    def test_seek(self):
+        self.clock.time += 1
+        self.serial.seek(5 * PACKET_SIZE)
+        self.assertEqual(0, self.serial.inWaiting())
+        self.clock.time += 1
+        self.assertEqual(self.stream[5 * PACKET_SIZE:6 * PACKET_SIZE],
+                         self.serial.read(PACKET_SIZE))
+
+    def test_blocking_read(self):
+        serial = ReplaySerial(self.stream, speed=1000)
+        # 10 seconds of packets in about 10 ms
+        self.assertEqual(self.stream, serial.read(len(self.stream)))
+        self.assertEqual(b'', serial.read())
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from olimex.mock import synthetic_stream
+from olimex.ports import find_shields, is_shield_stream, load_cache, probe_port
+from olimex.utils import encode_packets
+
+try:
+    from olimex.virtual import VirtualShield
+except ImportError:  # No pseudo-terminals, eg. on Windows
+    VirtualShield = None
+
+
+class IsShieldStreamTestCase(unittest.TestCase):
+    def test_is_shield_stream(self):
+        stream = synthetic_stream(3, seed=0)
+        self.assertTrue(is_shield_stream(stream))
+        self.assertTrue(is_shield_stream(b'\xa5Z\x00' + stream))
+        self.assertFalse(is_shield_stream(stream[:-1]))
+        self.assertFalse(is_shield_stream(bytes(range(256)) * 4))
+        # Other packet versions aren't shields.
+        self.assertFalse(is_shield_stream(encode_packets([[512] * 6] * 3, range(3), versions=1)))
+
+
+@unittest.skipIf(VirtualShield is None or os.name != 'posix', 'needs pseudo-terminals')
+class FindShieldsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.shield = VirtualShield()
+        self.addCleanup(self.shield.close)
+        # Sends bytes, but no packets
+        self.noise = VirtualShield(bytes(range(256)), loop=True)
+        self.addCleanup(self.noise.close)
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.cache_path = os.path.join(tmp_dir, 'ports.json')
+
+    def test_probe_port(self):
+        self.assertTrue(probe_port(self.shield.port))
+        self.assertFalse(probe_port(self.noise.port, timeout=0.2))
+        self.assertFalse(probe_port('/dev/does-not-exist'))
+
+    def test_find_shields(self):
+        ports = [self.noise.port, self.shield.port]
+        start = time.monotonic()
+        shields = find_shields(ports, timeout=0.3, cache_path=self.cache_path)
+        # Ports are probed in parallel.
+        self.assertLess(time.monotonic() - start, 0.55)
+        self.assertEqual([self.shield.port], shields)
+        self.assertEqual({self.shield.port: None}, load_cache(self.cache_path)['shields'])
+
+        # Cached shields are returned without probing, while their port
+        # exists. Shields plugged in since are found too.
+        with VirtualShield() as other:
+            ports.append(other.port)
+            self.assertEqual(sorted([self.shield.port, other.port]),
+                             find_shields(ports, timeout=0.3, cache_path=self.cache_path))
+        self.assertEqual({self.shield.port: None, other.port: None},
+                         load_cache(self.cache_path)['shields'])
+        self.shield.close()
+        self.assertEqual([], find_shields(ports, timeout=0.3, cache_path=self.cache_path))
+        self.assertEqual({}, load_cache(self.cache_path)['shields'])
+
+    def test_cache_kept_for_other_ports(self):
+        find_shields([self.shield.port], timeout=0.3, cache_path=self.cache_path)
+        self.assertEqual([], find_shields([self.noise.port], timeout=0.3,
+                                          cache_path=self.cache_path))
+        self.assertEqual({self.shield.port: None}, load_cache(self.cache_path)['shields'])
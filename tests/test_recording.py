@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from olimex.constants import SAMPLE_FREQUENCY
+from olimex.mock import packet_generator
+from olimex.recording import FORMAT_VERSION, RECORDING_SUFFIX, Recording, RecordingWriter, convert
+from olimex.utils import calculate_values_from_packets
+
+
+class RecordingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, 'capture.bin')
+
+        packet_gen = packet_generator()
+        self.packets = [next(packet_gen) for _ in range(1000)]
+        del self.packets[100:103]  # dropped packets
+        self.packets.insert(500, self.packets[499])  # duplicate packet
+        byte_array = bytearray(b'\x00\x01\x02')  # leading noise
+        for i, packet in enumerate(self.packets):
+            if i == 700:
+                byte_array.extend(b'\xff' * 4)  # noise mid-stream
+            byte_array.extend(packet)
+        with open(self.path, 'wb') as fd:
+            fd.write(byte_array)
+
+        # The recording leaves the duplicate out.
+        del self.packets[500]
+        self.values, self.counts, self.versions, self.switches = (
+            calculate_values_from_packets(b''.join(self.packets)))
+        self.samples = np.concatenate((np.arange(100), np.arange(103, 1000)))
+
+    def test_convert(self):
+        for compression in (None, 'zlib'):
+            destination = convert(self.path, chunk_size=128, compression=compression)
+            self.assertEqual(os.path.join(self.tmp_dir, 'capture' + RECORDING_SUFFIX),
+                             destination)
+            with Recording(destination) as recording:
+                self.assertEqual(len(self.values), len(recording))
+                self.assertEqual(8, len(recording.chunks))
+                self.assertEqual(3, recording.dropped_count)
+                self.assertEqual(1, recording.chunks['duplicates'].sum())
+                self.assertEqual(1, recording.chunks['resyncs'].sum())
+                self.assertEqual(1000 / SAMPLE_FREQUENCY, recording.duration)
+
+                values, samples, counts, versions, switches = recording.read()
+                self.assertEqual(self.values.dtype, values.dtype)
+                np.testing.assert_array_equal(self.values, values)
+                np.testing.assert_array_equal(self.samples, samples)
+                np.testing.assert_array_equal(self.counts, counts)
+                np.testing.assert_array_equal(self.switches, switches)
+
+    def test_read_slice(self):
+        with Recording(convert(self.path, chunk_size=128)) as recording:
+            values, samples, _, _, _ = recording.read(98 / SAMPLE_FREQUENCY,
+                                                      300 / SAMPLE_FREQUENCY)
+            np.testing.assert_array_equal(self.samples[98:297], samples)
+            np.testing.assert_array_equal(self.values[98:297], values)
+
+            values, samples, _, _, _ = recording.read(990 / SAMPLE_FREQUENCY)
+            np.testing.assert_array_equal(np.arange(990, 1000), samples)
+            self.assertEqual(0, len(recording.read(2000)[0]))
+
+    def test_writer_chunks(self):
+        path = os.path.join(self.tmp_dir, 'written.olx')
+        with RecordingWriter(path, chunk_size=100) as writer:
+            for start in range(0, len(self.values), 37):
+                end = start + 37
+                writer.write(self.values[start:end], self.counts[start:end],
+                             self.versions[start:end], self.switches[start:end])
+        with Recording(path) as recording:
+            self.assertEqual(self.samples[::100].tolist(),
+                             recording.chunks['first_sample'].tolist())
+            np.testing.assert_array_equal(self.samples, recording.read()[1])
+
+    def test_not_a_recording(self):
+        with self.assertRaises(ValueError):
+            Recording(self.path)
+
+    def test_out_of_range_values(self):
+        # Corrupted packets can hold any 16-bit value.
+        values = np.array([[1024 - 0xffff, 1024, 0, -1000, 1023, 1]] * 3)
+        counts = np.arange(3, dtype=np.uint8)
+        other = np.zeros(3, dtype=np.uint8)
+        path = os.path.join(self.tmp_dir, 'corrupt' + RECORDING_SUFFIX)
+        with RecordingWriter(path) as writer:
+            writer.write(values, counts, other, other)
+        with Recording(path) as recording:
+            np.testing.assert_array_equal(values, recording.read()[0])
+
+    def test_old_version(self):
+        path = convert(self.path)
+        with open(path, 'rb') as fd:
+            data = fd.read()
+        version = '"version": {}'.format(FORMAT_VERSION).encode()
+        self.assertIn(version, data)
+        with open(path, 'wb') as fd:
+            fd.write(data.replace(version, b'"version": 1', 1))
+        with self.assertRaises(ValueError):
+            Recording(path)
@@ -0,0 +1,75 @@
+import unittest
+
+import numpy as np
+import scipy.signal
+
+from olimex.constants import NUMCHANNELS, SAMPLE_FREQUENCY
+from olimex.spectral import SPECTROGRAM_RANGE, SpectralEstimator, SpectrogramBuffer
+
+
+class SpectralEstimatorTestCase(unittest.TestCase):
+    def setUp(self):
+        random = np.random.RandomState(0)
+        t = np.arange(20 * SAMPLE_FREQUENCY) / SAMPLE_FREQUENCY
+        # A different tone on each channel, over noise and an offset
+        tones = 10 + 5 * np.arange(NUMCHANNELS)
+        self.tones = tones
+        self.samples = (512 + 100 * np.sin(2 * np.pi * t[:, np.newaxis] * tones) +
+                        random.normal(0, 5, (len(t), NUMCHANNELS)))
+
+    def test_welch(self):
+        estimator = SpectralEstimator(window_length=256, overlap=192, averages=8)
+        spectra = estimator.update(self.samples)
+        self.assertEqual(1 + (len(self.samples) - 256) // 64, len(spectra))
+
+        # The average of the last spectra matches Welch's method over
+        # the samples they cover.
+        covered = self.samples[(len(spectra) - 8) * 64:(len(spectra) - 1) * 64 + 256]
+        frequencies, expected = scipy.signal.welch(
+            covered, fs=SAMPLE_FREQUENCY, nperseg=256, noverlap=192, axis=0)
+        np.testing.assert_allclose(frequencies, estimator.frequencies)
+        np.testing.assert_allclose(expected, estimator.psd)
+
+        peaks = estimator.frequencies[np.argmax(estimator.psd, axis=0)]
+        np.testing.assert_allclose(self.tones, peaks, atol=0.5)
+        np.testing.assert_allclose(self.tones, estimator.median_frequency, atol=0.5)
+        np.testing.assert_allclose(self.tones, estimator.mean_frequency, atol=2)
+
+    def test_chunk_size(self):
+        expected = SpectralEstimator().update(self.samples)
+        for chunk_size in (1, 5, 17, 1000):
+            estimator = SpectralEstimator()
+            spectra = np.concatenate([
+                estimator.update(self.samples[start:start + chunk_size])
+                for start in range(0, len(self.samples), chunk_size)])
+            np.testing.assert_array_equal(expected, spectra)
+
+    def test_before_first_hop(self):
+        estimator = SpectralEstimator()
+        self.assertEqual(0, len(estimator.update(self.samples[:10])))
+        self.assertIsNone(estimator.median_frequency)
+        self.assertIsNone(estimator.mean_frequency)
+        with self.assertRaises(ValueError):
+            SpectralEstimator(window_length=64, overlap=64)
+
+
+class SpectrogramBufferTestCase(unittest.TestCase):
+    def test_write(self):
+        estimator = SpectralEstimator()
+        spectrogram = SpectrogramBuffer(len(estimator.frequencies), 4, channel=1)
+        t = np.arange(10 * SAMPLE_FREQUENCY) / SAMPLE_FREQUENCY
+        samples = np.zeros((len(t), NUMCHANNELS))
+        samples[:, 1] = np.sin(2 * np.pi * 20 * t)
+        spectra = estimator.update(samples)
+        self.assertEqual(8, len(spectra))
+
+        spectrogram.write(spectra[:2])
+        self.assertEqual(2, spectrogram.head)
+        column = spectrogram.image[:, 0]
+        self.assertEqual(0, column.max())
+        self.assertEqual(-SPECTROGRAM_RANGE, column.min())
+        self.assertAlmostEqual(20, estimator.frequencies[np.argmax(column)], delta=0.5)
+
+        # More spectra than fit only keep the newest.
+        spectrogram.write(spectra)
+        self.assertEqual(2, spectrogram.head)
@@ -1,9 +1,15 @@
+import os
 import random
+import tempfile
 import unittest
-from olimex.constants import PACKET_SLICES
+
+import numpy as np
+
+from olimex.constants import PACKET_SIZE, PACKET_SLICES
 from olimex.exg import PacketStreamReader
-from olimex.mock import packet_generator, FakeSerialByteArray
-from olimex.utils import calculate_values_from_packet_data
+from olimex.mock import (packet_generator, FakeSerialByteArray, FakeSerialFile, ReplaySerial,
+                         synthetic_stream)
+from olimex.utils import calculate_values_from_packet_data, calculate_values_from_packets
 
 
 class PacketStreamReaderTestCase(unittest.TestCase):
@@ -46,6 +52,117 @@ class PacketStreamReaderTestCase(unittest.TestCase):
         self.assertEqual(packet1_value, reader._get_next_packet_values())
         self.assertEqual(packet2_value, next(reader))
 
+    def test_read_chunk(self):
+        byte_array = bytearray()
+        # add some noise
+        byte_array.extend((random.randint(0, 255) for _ in range(5)))
+        packet_gen = packet_generator()
+        packets = [next(packet_gen) for _ in range(3)]
+        for packet in packets:
+            byte_array.extend(packet)
+
+        serial = FakeSerialByteArray(byte_array)
+        reader = PacketStreamReader(serial)
+        values, counts, versions, switches = reader.read_chunk()
+        self.assertEqual((3, 6), values.shape)
+        for packet, row in zip(packets, values):
+            expected = calculate_values_from_packet_data(packet[PACKET_SLICES['data']])
+            self.assertEqual(expected, row.tolist())
+        self.assertEqual([0, 1, 2], counts.tolist())
+        self.assertEqual([2, 2, 2], versions.tolist())
+        self.assertEqual([1, 1, 1], switches.tolist())
+
+        values, counts, _, _ = reader.read_chunk()
+        self.assertEqual((0, 6), values.shape)
+        self.assertEqual(0, len(counts))
+
+    def test_read_chunk_resync(self):
+        packet_gen = packet_generator()
+        packets = [next(packet_gen) for _ in range(4)]
+        byte_array = bytearray()
+        byte_array.extend(packets[0])
+        # packet missing its sync bytes, then noise ending in a lone SYNC0
+        byte_array.extend(packets[1][2:9])
+        byte_array.extend(b'\x00\x01\xa5')
+        byte_array.extend(packets[2])
+        byte_array.extend(packets[3])
+
+        serial = FakeSerialByteArray(byte_array)
+        reader = PacketStreamReader(serial)
+        _, counts, _, _ = reader.read_chunk(max_packets=1)
+        self.assertEqual([0], counts.tolist())
+        _, counts, _, _ = reader.read_chunk()
+        self.assertEqual([2, 3], counts.tolist())
+
+    def test_dropped_packets(self):
+        packet_gen = packet_generator()
+        packets = [next(packet_gen) for _ in range(8)]
+        byte_array = bytearray()
+        for i, packet in enumerate(packets):
+            if i in (2, 3, 5):
+                continue  # dropped
+            byte_array.extend(packet)
+            if i == 6:
+                byte_array.extend(packet)  # duplicate
+
+        for fill_gaps in (None, 'nan', 'interpolate'):
+            reader = PacketStreamReader(FakeSerialByteArray(byte_array), fill_gaps=fill_gaps)
+            reader.read_chunk(max_packets=1)
+            values, counts, _, _ = reader.read_chunk()
+            self.assertEqual(3, reader.dropped_count)
+            self.assertEqual(1, reader.duplicate_count)
+            self.assertEqual(0, reader.counter_error_count)
+            self.assertEqual(0, reader.resync_count)
+            if fill_gaps is None:
+                self.assertEqual([1, 4, 6, 6, 7], counts.tolist())
+                continue
+
+            self.assertEqual(list(range(1, 8)), counts.tolist())
+            if fill_gaps == 'nan':
+                self.assertTrue(np.isnan(values[[1, 2, 4]]).all())
+                self.assertFalse(np.isnan(values[[0, 3, 5, 6]]).any())
+            else:
+                expected = (2 * values[0] + values[3]) / 3
+                self.assertTrue(np.allclose(expected, values[1]))
+                expected = (values[3] + values[5]) / 2
+                self.assertTrue(np.allclose(expected, values[4]))
+
+    def test_fake_serial_file(self):
+        packet_gen = packet_generator()
+        packets = [next(packet_gen) for _ in range(3)]
+        with tempfile.NamedTemporaryFile(suffix='.bin', delete=False) as fd:
+            fd.write(b''.join(packets))
+        self.addCleanup(os.remove, fd.name)
+
+        serial = FakeSerialFile(fd.name)
+        reader = PacketStreamReader(serial)
+        for packet in packets:
+            self.assertEqual(packet, reader._get_next_packet())
+        self.assertIsNone(reader._get_next_packet())
+        serial.close()
+
+        with open(fd.name, 'wb'):
+            pass
+        serial = FakeSerialFile(fd.name)
+        self.assertIsNone(PacketStreamReader(serial)._get_next_packet())
+        serial.close()
+
+    def test_seek(self):
+        stream = synthetic_stream(200, seed=0)
+        for fill_gaps in (None, 'interpolate'):
+            with self.subTest(fill_gaps=fill_gaps):
+                reader = PacketStreamReader(ReplaySerial(stream, speed=None),
+                                            fill_gaps=fill_gaps)
+                self.assertEqual(100, len(reader.read_chunk(100)[0]))
+                reader.seek(130 * PACKET_SIZE)
+                values, counts, _, _ = reader.read_chunk(10)
+                # The jump isn't taken for dropped packets.
+                self.assertEqual(10, len(values))
+                self.assertEqual(list(range(130, 140)), counts.tolist())
+                self.assertEqual(0, reader.dropped_count)
+                self.assertEqual(0, reader.resync_count)
+                self.assertEqual(1, reader.seek_count)
+
 
 class UtilsTestCase(unittest.TestCase):
     def test_calculate_value_from_packet_data(self):
@@ -58,3 +175,18 @@ class UtilsTestCase(unittest.TestCase):
         for value_pair in values_to_assert_equal:
             values, data = value_pair[0], value_pair[1]
             self.assertEqual(values, calculate_values_from_packet_data(data))
+
+    def test_calculate_values_from_packets(self):
+        packet_gen = packet_generator()
+        packets = [next(packet_gen) for _ in range(10)]
+        values, counts, versions, switches = calculate_values_from_packets(
+            b''.join(packets))
+        for packet, row in zip(packets, values):
+            expected = calculate_values_from_packet_data(packet[PACKET_SLICES['data']])
+            self.assertEqual(expected, row.tolist())
+        self.assertEqual(list(range(10)), counts.tolist())
+        self.assertEqual([2] * 10, versions.tolist())
+        self.assertEqual([1] * 10, switches.tolist())
+
+        with self.assertRaises(ValueError):
+            calculate_values_from_packets(b''.join(packets)[:-1])
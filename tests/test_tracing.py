@@ -0,0 +1,98 @@
+import unittest
+
+from olimex.constants import PACKET_SIZE
+from olimex.exg import PacketStreamReader
+from olimex.mock import FakeSerialByteArray, ReplaySerial, synthetic_stream
+from olimex.tracing import LatencyTracer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LatencyTracerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.tracer = LatencyTracer(capacity=4, clock=self.clock)
+
+    def trace(self, arrival, decode, process, render):
+        self.tracer.begin(arrival)
+        for stage, duration in (('decode', decode), ('process', process), ('render', render)):
+            self.clock.now += duration
+            self.tracer.stamp(stage)
+
+    def test_percentiles(self):
+        self.assertEqual({}, self.tracer.percentiles())
+        self.trace(0, 0.001, 0.002, 0.010)
+        self.trace(self.clock.now, 0.003, 0.002, 0.010)
+        percentiles = self.tracer.percentiles((0, 100))
+        self.assertAlmostEqual(0.001, percentiles['decode']['p0'])
+        self.assertAlmostEqual(0.003, percentiles['decode']['p100'])
+        self.assertAlmostEqual(0.002, percentiles['process']['p100'])
+        self.assertAlmostEqual(0.015, percentiles['total']['p100'])
+
+    def test_no_batch(self):
+        # Refreshes without packets aren't traced.
+        self.tracer.begin(None)
+        self.tracer.stamp('decode')
+        self.tracer.stamp('process')
+        self.tracer.stamp('render')
+        self.assertEqual(0, self.tracer.batch_count)
+
+    def test_stage_order(self):
+        self.tracer.begin(0)
+        with self.assertRaises(ValueError):
+            self.tracer.stamp('render')
+
+    def test_capacity(self):
+        for batch in range(6):
+            self.trace(self.clock.now, batch, 0, 0)
+        self.assertEqual(6, self.tracer.batch_count)
+        # Only the last 4 batches are kept, oldest first.
+        self.assertEqual([2, 3, 4, 5], self.tracer.latencies()['decode'].tolist())
+
+
+class LastArrivalTestCase(unittest.TestCase):
+    def test_read_chunk(self):
+        stream = synthetic_stream(10, seed=0)
+        serial_obj = ReplaySerial(stream, speed=None)
+        reader = PacketStreamReader(serial_obj)
+        self.assertIsNone(reader.last_arrival)
+
+        # Half a packet is left over for the next read.
+        serial_obj._buffer = stream[:5 * PACKET_SIZE + 8]
+        reader.read_chunk()
+        first_arrival = reader.last_arrival
+        self.assertIsNotNone(first_arrival)
+
+        serial_obj._buffer = stream
+        values, _, _, _ = reader.read_chunk()
+        self.assertEqual(5, len(values))
+        # The oldest packet started arriving with the first read.
+        self.assertEqual(first_arrival, reader.last_arrival)
+
+        values, _, _, _ = reader.read_chunk()
+        self.assertEqual(0, len(values))
+        self.assertEqual(first_arrival, reader.last_arrival)
+
+    def test_max_packets(self):
+        stream = synthetic_stream(10, seed=0)
+        # Hands out a packet per read
+        reader = PacketStreamReader(FakeSerialByteArray(stream))
+        # Packets trickle in over three reads before the next chunk.
+        for _ in range(3):
+            reader._fill()
+        read_times = [read_time for _, read_time in reader._reads]
+        self.assertEqual(sorted(read_times), read_times)
+
+        # Each packet carries the time of the read it came in with,
+        # however many reads max_packets leaves over.
+        for read_time in read_times:
+            values, _, _, _ = reader.read_chunk(max_packets=1)
+            self.assertEqual(1, len(values))
+            self.assertEqual(read_time, reader.last_arrival)
+        self.assertEqual(0, len(reader._reads))
@@ -0,0 +1,79 @@
+import os
+import time
+import unittest
+
+import numpy as np
+import serial
+
+from olimex.constants import DEFAULT_BAUDRATE, PACKET_SIZE, SAMPLE_FREQUENCY
+from olimex.exg import PacketStreamReader
+from olimex.mock import synthetic_stream
+from olimex.utils import calculate_values_from_packets
+
+try:
+    from olimex.virtual import VirtualShield, VirtualShieldRig
+except ImportError:  # No pseudo-terminals, eg. on Windows
+    VirtualShield = VirtualShieldRig = None
+
+
+def read_until_finished(reader, shields, timeout=10):
+    chunks = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        finished = all(shield.finished for shield in shields)
+        values, _, _, _ = reader.read_chunk()
+        chunks.append(values)
+        if finished and not len(values):
+            break
+        time.sleep(0.01)
+    return np.concatenate(chunks)
+
+
+@unittest.skipIf(VirtualShield is None or os.name != 'posix', 'needs pseudo-terminals')
+class VirtualShieldTestCase(unittest.TestCase):
+    def open(self, port):
+        serial_obj = serial.Serial(port, DEFAULT_BAUDRATE, timeout=0)
+        self.addCleanup(serial_obj.close)
+        return serial_obj
+
+    def test_end_to_end(self):
+        stream = synthetic_stream(300, seed=0)
+        with VirtualShield(stream, speed=None) as shield:
+            reader = PacketStreamReader(self.open(shield.port))
+            values = read_until_finished(reader, [shield])
+        self.assertEqual(len(stream), shield.bytes_sent)
+        self.assertEqual(0, shield.bytes_dropped)
+        expected, _, _, _ = calculate_values_from_packets(stream)
+        self.assertEqual(expected.tolist(), values.tolist())
+        self.assertEqual(0, reader.dropped_count)
+
+    def test_pacing(self):
+        with VirtualShield(speed=1) as shield:
+            self.assertEqual(SAMPLE_FREQUENCY * PACKET_SIZE, shield.bytes_per_second)
+            time.sleep(0.5)
+            sent = shield.bytes_sent
+        # Half a second of packets, give or take scheduling delays
+        self.assertGreater(sent, 0.25 * SAMPLE_FREQUENCY * PACKET_SIZE)
+        self.assertLess(sent, 0.75 * SAMPLE_FREQUENCY * PACKET_SIZE)
+
+        # The baud rate caps the rate however fast the shield is asked to send.
+        with VirtualShield(speed=100, baudrate=9600) as shield:
+            self.assertEqual(960, shield.bytes_per_second)
+
+    def test_overflow(self):
+        # Nobody reads, so the tty buffer fills up and bytes are lost.
+        with VirtualShield(synthetic_stream(200, seed=0), speed=None, baudrate=10 ** 8,
+                           loop=True) as shield:
+            deadline = time.monotonic() + 10
+            while not shield.bytes_dropped and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertGreater(shield.bytes_dropped, 0)
+
+    def test_rig(self):
+        with VirtualShieldRig(3, source=synthetic_stream(200, seed=0), speed=None) as rig:
+            self.assertEqual(3, len(set(rig.ports)))
+            readers = [PacketStreamReader(self.open(port)) for port in rig.ports]
+            for reader in readers:
+                values = read_until_finished(reader, rig)
+                self.assertEqual(200, len(values))
+                self.assertEqual(0, reader.dropped_count)
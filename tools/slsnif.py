@@ -4,29 +4,44 @@ import time
 
 import serial
 
+from olimex.capture import (DEFAULT_FSYNC_INTERVAL, READ_SIZE, READ_TIMEOUT, CaptureWriter,
+                            capture)
 from olimex.constants import DEFAULT_BAUDRATE
 
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
-def slsnif(port, logfile=None):
-    ser = serial.Serial(port, baudrate=DEFAULT_BAUDRATE)
-    array = bytearray()
-    while True:
+def echo(data):
+    print(data, end='', flush=True)
+
+
+def slsnif(port, logfile=None, quiet=False, max_bytes=None, max_seconds=None,
+           fsync_interval=DEFAULT_FSYNC_INTERVAL, validate=False):
+    ser = serial.Serial(port, baudrate=DEFAULT_BAUDRATE, timeout=READ_TIMEOUT)
+    on_read = None if quiet else echo
+    if not logfile:
         try:
-            if ser.inWaiting():
-                data = ser.read()
-                if logfile:
-                    array.extend(data)
-                print(data, end='', flush=True)
+            while True:
+                data = ser.read(READ_SIZE)
+                # Reads come back empty once the timeout expires.
+                if data and on_read is not None:
+                    on_read(data)
         except KeyboardInterrupt:
-            if logfile:
-                print('\nDumping data to disk...', end='', flush=True)
-                with open(os.path.join(CURRENT_DIR, logfile), 'wb') as fd:
-                    fd.write(array)
-                print('Done.')
-            break
+            return
+
+    writer = CaptureWriter(os.path.join(CURRENT_DIR, logfile), max_bytes=max_bytes,
+                           max_seconds=max_seconds, fsync_interval=fsync_interval,
+                           validate=validate)
+    with writer:
+        captured = capture(ser, writer, on_read=on_read)
+
+    print('\nCaptured {} bytes to {}'.format(captured, ', '.join(writer.paths)))
+    if validate:
+        reader = writer.reader
+        print('{} packets, {} dropped, {} duplicates, {} counter errors, {} resyncs'.format(
+            writer.packet_count, reader.dropped_count, reader.duplicate_count,
+            reader.counter_error_count, reader.resync_count))
 
 
 if __name__ == '__main__':
@@ -38,12 +53,36 @@ if __name__ == '__main__':
                         dest='logfile',
                         help='File to log serial data to. '
                              'Path should be relative to slsnif.py')
+    parser.add_argument('-q', '--quiet',
+                        action='store_true',
+                        default=False,
+                        dest='quiet',
+                        help='Do not print the data logged.')
+    parser.add_argument('--max-bytes',
+                        dest='max_bytes',
+                        type=int,
+                        help='Start a new log file once it reaches this size.')
+    parser.add_argument('--max-seconds',
+                        dest='max_seconds',
+                        type=float,
+                        help='Start a new log file once it has been open this long.')
+    parser.add_argument('--fsync-interval',
+                        dest='fsync_interval',
+                        type=float,
+                        default=DEFAULT_FSYNC_INTERVAL,
+                        help='Seconds between syncs of the log file to disk.')
+    parser.add_argument('--validate',
+                        action='store_true',
+                        default=False,
+                        dest='validate',
+                        help='Decode packets as they are logged and report dropped packets.')
     args = parser.parse_args()
 
     print('Stop program with CTRL + C')
     if args.logfile:
-        print('Streaming data will be written to disk when program is stopped.')
+        print('Streaming data is written to disk as it arrives.')
 
     time.sleep(2)
-    slsnif(args.port, args.logfile)
-
+    slsnif(args.port, args.logfile, quiet=args.quiet, max_bytes=args.max_bytes,
+           max_seconds=args.max_seconds, fsync_interval=args.fsync_interval,
+           validate=args.validate)